@@ -0,0 +1,100 @@
+import argparse
+import asyncio
+import sys
+
+import httpx
+
+from benchmarks.dataset import COLUMNS, Scale, generate, load
+from benchmarks.driver import count_queries, run, time_phases
+from benchmarks.report import compare, format_summary, load_baseline, save_baseline, summarize
+from database.engine import dispose_engines, get_engine, get_replica_engines
+from database.repository import STORAGE_BACKEND
+from main import app
+
+SCALES = {
+    'small': Scale(organizations=10, employees_per_organization=3, tenders_per_organization=10, bids_per_tender=3),
+    'medium': Scale(),
+    'large': Scale(organizations=1000, employees_per_organization=5, tenders_per_organization=50, bids_per_tender=5),
+}
+
+
+async def seed(args):
+    try:
+        counts = await load(get_engine(), generate(SCALES[args.scale], args.seed), reset=args.reset)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        await dispose_engines()
+    for table, count in counts.items():
+        print(f'{table}: {count}')
+    return 0
+
+
+async def benchmark(args):
+    dataset = generate(SCALES[args.scale], args.seed)
+    meta = {'scale': args.scale, 'seed': args.seed, 'concurrency': args.concurrency, 'storage': STORAGE_BACKEND}
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+    else:
+        # In-process: no network or server scheduling noise, and queries can be attributed to requests.
+        if STORAGE_BACKEND == 'memory':
+            # The dataset goes straight into this process' store, no database involved.
+            from database.memory import memory_store
+            memory_store.clear()
+            memory_store.load(dataset.rows, COLUMNS)
+        else:
+            count_queries([get_engine(), *get_replica_engines()])
+        time_phases()
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        client = httpx.AsyncClient(transport=transport, base_url='http://benchmark', timeout=args.timeout)
+
+    try:
+        async with client:
+            if args.warmup:
+                await run(client, dataset, args.warmup, args.concurrency, args.seed, not args.url)
+            stats, elapsed = await run(client, dataset, args.duration, args.concurrency, args.seed, not args.url)
+    finally:
+        await dispose_engines()
+
+    summary = summarize(stats, elapsed)
+    print(format_summary(summary))
+    print(f'total: {sum(route["count"] for route in summary.values()) / elapsed:.1f} requests/sec')
+
+    if args.save:
+        save_baseline(args.save, meta, summary)
+    if args.compare:
+        regressions = compare(load_baseline(args.compare), meta, summary, args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        return 1 if regressions else 0
+    return 0
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Synthetic data and load benchmark for the tender API.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    seed_parser = commands.add_parser('seed', help='fill the database with a deterministic synthetic dataset')
+    run_parser = commands.add_parser('run', help='replay a mix of the API routes and report latencies')
+    for command in (seed_parser, run_parser):
+        command.add_argument('--scale', choices=SCALES, default='medium')
+        command.add_argument('--seed', type=int, default=0)
+    seed_parser.add_argument('--reset', action='store_true', help='truncate the existing data first')
+
+    run_parser.add_argument('--url', help='benchmark a running server instead of the app in-process')
+    run_parser.add_argument('--duration', type=float, default=30, help='seconds of measured load')
+    run_parser.add_argument('--warmup', type=float, default=5, help='seconds of unmeasured load before')
+    run_parser.add_argument('--concurrency', type=int, default=16)
+    run_parser.add_argument('--timeout', type=float, default=30)
+    run_parser.add_argument('--save', metavar='NAME', help='store the results as baseline NAME')
+    run_parser.add_argument('--compare', metavar='NAME', help='fail on regressions against baseline NAME')
+    run_parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative p95 growth')
+
+    args = parser.parse_args(argv)
+    return asyncio.run(seed(args) if args.command == 'seed' else benchmark(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,255 @@
+import asyncio
+import contextvars
+import random
+import time
+from collections import Counter
+from typing import Callable, NamedTuple
+
+import fastapi.routing
+import httpx
+from sqlalchemy import event
+
+from benchmarks.dataset import SERVICE_TYPES, WORDS, Dataset
+
+# Counter of the statements executed on behalf of the current request, set per request by the
+# worker and incremented by the engine listener; only available when the app runs in-process.
+_queries = contextvars.ContextVar('benchmark_queries', default=None)
+# Engines count_queries listens on; with none, as with the memory backend, there is nothing to count.
+_counted_engines = []
+# Seconds spent in each of FastAPI's steps for the current request, the same way; see time_phases.
+_phases = contextvars.ContextVar('benchmark_phases', default=None)
+
+PHASES = ('routing', 'validation', 'endpoint', 'serialization')
+
+
+class Route(NamedTuple):
+    name: str
+    weight: int
+    request: Callable
+
+
+def _tender(dataset: Dataset, rng: random.Random):
+    return rng.choice(dataset.tenders)
+
+
+def _bid(dataset: Dataset, rng: random.Random):
+    return rng.choice(dataset.bids)
+
+
+def _list_tenders(dataset, rng):
+    params = {'limit': 10}
+    if rng.random() < 0.5:
+        params['service_type'] = rng.choice(SERVICE_TYPES)
+    return 'GET', '/api/tenders', params, None
+
+
+def _search_tenders(dataset, rng):
+    return 'GET', '/api/tenders/search', {'q': rng.choice(WORDS), 'limit': 10}, None
+
+
+def _my_tenders(dataset, rng):
+    return 'GET', '/api/tenders/my', {'username': rng.choice(dataset.usernames), 'limit': 10}, None
+
+
+def _tender_status(dataset, rng):
+    tender = _tender(dataset, rng)
+    return 'GET', f'/api/tenders/{tender.id}/status', {'username': tender.username}, None
+
+
+def _create_tender(dataset, rng):
+    tender = _tender(dataset, rng)
+    body = {
+        'name': ' '.join(rng.choices(WORDS, k=3)),
+        'description': ' '.join(rng.choices(WORDS, k=12)),
+        'service_type': rng.choice(SERVICE_TYPES),
+        'organization_id': str(tender.organization_id),
+        'creator_username': tender.username,
+    }
+    return 'POST', '/api/tenders/new', None, body
+
+
+def _set_tender_status(dataset, rng):
+    tender = rng.choice(dataset.published_tenders)
+    return 'PUT', f'/api/tenders/{tender.id}/status', {'username': tender.username, 'status': 'PUBLISHED'}, None
+
+
+def _edit_tender(dataset, rng):
+    tender = _tender(dataset, rng)
+    body = {'description': ' '.join(rng.choices(WORDS, k=12)), 'service_type': tender.service_type}
+    return 'PATCH', f'/api/tenders/{tender.id}/edit', {'username': tender.username}, body
+
+
+def _rollback_tender(dataset, rng):
+    tender = _tender(dataset, rng)
+    return 'PUT', f'/api/tenders/{tender.id}/rollback/1', {'username': tender.username}, None
+
+
+def _create_bid(dataset, rng):
+    bid = _bid(dataset, rng)
+    body = {
+        'name': ' '.join(rng.choices(WORDS, k=3)),
+        'description': ' '.join(rng.choices(WORDS, k=8)),
+        'tender_id': str(bid.tender_id),
+        'author_type': 'User',
+        'author_id': str(bid.user_id),
+    }
+    return 'POST', '/api/bids/new', None, body
+
+
+def _my_bids(dataset, rng):
+    return 'GET', '/api/bids/my', {'username': _bid(dataset, rng).username, 'limit': 10}, None
+
+
+def _list_bids(dataset, rng):
+    tender = rng.choice(dataset.published_tenders)
+    return 'GET', f'/api/bids/{tender.id}/list', {'username': tender.username, 'limit': 10}, None
+
+
+def _bid_status(dataset, rng):
+    bid = _bid(dataset, rng)
+    return 'GET', f'/api/bids/{bid.id}/status', {'username': bid.username}, None
+
+
+def _set_bid_status(dataset, rng):
+    bid = _bid(dataset, rng)
+    return 'PUT', f'/api/bids/{bid.id}/status', {'username': bid.username, 'status': 'PUBLISHED'}, None
+
+
+def _edit_bid(dataset, rng):
+    bid = _bid(dataset, rng)
+    body = {'description': ' '.join(rng.choices(WORDS, k=8))}
+    return 'PATCH', f'/api/bids/{bid.id}/edit', {'username': bid.username}, body
+
+
+def _rollback_bid(dataset, rng):
+    bid = _bid(dataset, rng)
+    return 'PUT', f'/api/bids/{bid.id}/rollback/1', {'username': bid.username}, None
+
+
+def _submit_decision(dataset, rng):
+    # Rejections only: an approval closes the tender and would change the mix as the run goes on.
+    bid = _bid(dataset, rng)
+    params = {'username': bid.tender_username, 'decision': 'Rejected'}
+    return 'GET', f'/api/bids/{bid.id}/submit_decision', params, None
+
+
+def _reviews(dataset, rng):
+    bid = _bid(dataset, rng)
+    params = {'authorUsername': bid.username, 'requesterUsername': bid.tender_username, 'limit': 10}
+    return 'GET', f'/api/bids/{bid.tender_id}/reviews', params, None
+
+
+# Every route of openapi.yml the app serves, weighted towards reads like the dashboards' traffic.
+ROUTES = (
+    Route('GET /api/ping', 5, lambda dataset, rng: ('GET', '/api/ping', None, None)),
+    Route('GET /api/tenders', 15, _list_tenders),
+    Route('GET /api/tenders/search', 5, _search_tenders),
+    Route('GET /api/tenders/my', 8, _my_tenders),
+    Route('GET /api/tenders/{tenderId}/status', 10, _tender_status),
+    Route('POST /api/tenders/new', 2, _create_tender),
+    Route('PUT /api/tenders/{tenderId}/status', 1, _set_tender_status),
+    Route('PATCH /api/tenders/{tenderId}/edit', 2, _edit_tender),
+    Route('PUT /api/tenders/{tenderId}/rollback/{version}', 1, _rollback_tender),
+    Route('POST /api/bids/new', 2, _create_bid),
+    Route('GET /api/bids/my', 8, _my_bids),
+    Route('GET /api/bids/{tenderId}/list', 8, _list_bids),
+    Route('GET /api/bids/{bidId}/status', 10, _bid_status),
+    Route('PUT /api/bids/{bidId}/status', 1, _set_bid_status),
+    Route('PATCH /api/bids/{bidId}/edit', 2, _edit_bid),
+    Route('PUT /api/bids/{bidId}/rollback/{version}', 1, _rollback_bid),
+    Route('GET /api/bids/{bidId}/submit_decision', 1, _submit_decision),
+    Route('GET /api/bids/{tenderId}/reviews', 3, _reviews),
+)
+
+
+class RouteStats:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.queries = None
+        self.phases = None
+
+    def record(self, latency: float, status_code: int, queries, phases=None):
+        self.latencies.append(latency)
+        self.statuses[status_code] += 1
+        if queries is not None:
+            self.queries = (self.queries or 0) + queries
+        if phases is not None:
+            self.phases = self.phases or dict.fromkeys(PHASES, 0.0)
+            for phase, seconds in phases.items():
+                self.phases[phase] += seconds
+
+
+def count_queries(engines):
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter = _queries.get()
+        if counter is not None:
+            counter[0] += 1
+
+    for engine in engines:
+        event.listen(engine.sync_engine, 'before_cursor_execute', before_cursor_execute)
+        _counted_engines.append(engine)
+
+
+def _timed(phase: str, function):
+    def add(started: float):
+        phases = _phases.get()
+        if phases is not None:
+            phases[phase] += time.perf_counter() - started
+
+    if asyncio.iscoroutinefunction(function):
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                add(started)
+    else:
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                add(started)
+    return timed
+
+
+def time_phases():
+    # Splits the in-process latency into FastAPI's steps: matching the path against the routes, parsing and
+    # validating the parameters and body along with the dependencies, the endpoint itself, and validating and
+    # encoding its result. Endpoints that build their Response themselves, like the list pages, serialize in
+    # the endpoint. What is left of the latency is middleware and the transport.
+    fastapi.routing.APIRoute.matches = _timed('routing', fastapi.routing.APIRoute.matches)
+    fastapi.routing.solve_dependencies = _timed('validation', fastapi.routing.solve_dependencies)
+    fastapi.routing.run_endpoint_function = _timed('endpoint', fastapi.routing.run_endpoint_function)
+    fastapi.routing.serialize_response = _timed('serialization', fastapi.routing.serialize_response)
+
+
+async def _worker(client: httpx.AsyncClient, dataset: Dataset, rng: random.Random, deadline: float, stats,
+                  in_process: bool):
+    weights = [route.weight for route in ROUTES]
+    while time.monotonic() < deadline:
+        route = rng.choices(ROUTES, weights)[0]
+        method, url, params, body = route.request(dataset, rng)
+        counter = [0]
+        _queries.set(counter)
+        phases = dict.fromkeys(PHASES, 0.0)
+        _phases.set(phases)
+        started = time.perf_counter()
+        response = await client.request(method, url, params=params, json=body)
+        latency = time.perf_counter() - started
+        stats.setdefault(route.name, RouteStats()).record(latency, response.status_code,
+                                                          counter[0] if _counted_engines else None,
+                                                          phases if in_process else None)
+
+
+async def run(client: httpx.AsyncClient, dataset: Dataset, duration: float, concurrency: int, seed: int = 0,
+              in_process: bool = True):
+    stats = {}
+    deadline = time.monotonic() + duration
+    started = time.monotonic()
+    await asyncio.gather(*(
+        _worker(client, dataset, random.Random(f'{seed}:{n}'), deadline, stats, in_process)
+        for n in range(concurrency)
+    ))
+    return stats, time.monotonic() - started
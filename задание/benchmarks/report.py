@@ -0,0 +1,93 @@
+import json
+import math
+import os
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), 'baselines')
+# Rarely hit routes have too few samples for their p95 to mean anything.
+MIN_SAMPLES = 50
+
+
+def percentile(values, q: float) -> float:
+    # Nearest-rank on the sorted sample.
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def summarize(stats, elapsed: float):
+    summary = {}
+    for name, route in sorted(stats.items()):
+        count = len(route.latencies)
+        ok = sum(n for status_code, n in route.statuses.items() if status_code < 400)
+        summary[name] = {
+            'count': count,
+            'errors': count - ok,
+            'rps': count / elapsed,
+            'mean_ms': sum(route.latencies) / count * 1000,
+            'p50_ms': percentile(route.latencies, 50) * 1000,
+            'p95_ms': percentile(route.latencies, 95) * 1000,
+            'p99_ms': percentile(route.latencies, 99) * 1000,
+            'queries': None if route.queries is None else route.queries / count,
+            'phases_ms': None if route.phases is None else
+            {phase: seconds / count * 1000 for phase, seconds in route.phases.items()},
+            'statuses': {str(status_code): n for status_code, n in sorted(route.statuses.items())},
+        }
+    return summary
+
+
+def format_summary(summary) -> str:
+    lines = [f'{"route":<48} {"count":>7} {"err":>5} {"rps":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"q/req":>6}']
+    for name, route in summary.items():
+        queries = '-' if route['queries'] is None else f'{route["queries"]:.2f}'
+        lines.append(f'{name:<48} {route["count"]:>7} {route["errors"]:>5} {route["rps"]:>8.1f} '
+                     f'{route["p50_ms"]:>8.2f} {route["p95_ms"]:>8.2f} {route["p99_ms"]:>8.2f} {queries:>6}')
+
+    phased = {name: route for name, route in summary.items() if route['phases_ms'] is not None}
+    if phased:
+        # Mean milliseconds per request in each step, next to the mean latency they are part of.
+        phases = list(next(iter(phased.values()))['phases_ms'])
+        lines.append('')
+        lines.append(f'{"route":<48} {"mean ms":>8} ' + ' '.join(f'{phase:>13}' for phase in phases))
+        for name, route in phased.items():
+            mean = route['mean_ms']
+            lines.append(f'{name:<48} {mean:>8.3f} '
+                         + ' '.join(f'{route["phases_ms"][phase]:>13.3f}' for phase in phases))
+    return '\n'.join(lines)
+
+
+def baseline_path(name: str) -> str:
+    return os.path.join(BASELINE_DIR, f'{name}.json')
+
+
+def save_baseline(name: str, meta, summary):
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    with open(baseline_path(name), 'w') as f:
+        json.dump({'meta': meta, 'routes': summary}, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load_baseline(name: str):
+    with open(baseline_path(name)) as f:
+        return json.load(f)
+
+
+def compare(baseline, meta, summary, tolerance: float):
+    # Latency regresses when p95 grows by more than the tolerance. An extra query per request
+    # shows up as +1 in the average, while membership cache misses only move it by a fraction.
+    if baseline['meta'] != meta:
+        return [f'baseline was recorded with {baseline["meta"]}, this run is {meta}']
+
+    regressions = []
+    for name, route in summary.items():
+        before = baseline['routes'].get(name)
+        if before is None:
+            continue
+        enough = min(route['count'], before['count']) >= MIN_SAMPLES
+        if enough and route['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f'{name}: p95 {before["p95_ms"]:.2f}ms -> {route["p95_ms"]:.2f}ms')
+        if route['queries'] is not None and before['queries'] is not None \
+                and route['queries'] > before['queries'] + 0.5:
+            regressions.append(f'{name}: queries per request {before["queries"]:.2f} -> {route["queries"]:.2f}')
+        if route['errors'] / route['count'] > before['errors'] / before['count'] + tolerance:
+            regressions.append(f'{name}: errors {before["errors"]}/{before["count"]} -> '
+                               f'{route["errors"]}/{route["count"]}')
+    return regressions
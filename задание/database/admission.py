@@ -0,0 +1,157 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from urllib.parse import parse_qs
+
+from starlette.responses import JSONResponse
+
+from database.engine import DB_MAX_OVERFLOW, DB_POOL_SIZE
+
+# Requests of one worker allowed to run at once; by default as many as its pool has connections, so that
+# admitted requests do not queue on the pool. 0 turns concurrency limiting off.
+ADMISSION_CONCURRENCY = int(os.getenv('ADMISSION_CONCURRENCY', DB_POOL_SIZE + DB_MAX_OVERFLOW))
+# The part of it reserved for writes; reads get the rest, so neither can starve the other.
+ADMISSION_WRITE_CONCURRENCY = int(os.getenv('ADMISSION_WRITE_CONCURRENCY', max(1, ADMISSION_CONCURRENCY // 3)))
+# Requests allowed to wait for a slot, per budget, and for how many seconds.
+ADMISSION_QUEUE = int(os.getenv('ADMISSION_QUEUE', ADMISSION_CONCURRENCY * 2))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 1))
+# Sustained requests per second and burst allowed per username, or per client address for the writes that
+# carry the user in the body; 0 turns rate limiting off.
+ADMISSION_USER_RATE = float(os.getenv('ADMISSION_USER_RATE', 50))
+ADMISSION_USER_BURST = int(os.getenv('ADMISSION_USER_BURST', 100))
+ADMISSION_TRACKED_USERS = int(os.getenv('ADMISSION_TRACKED_USERS', 10000))
+
+# Served without touching the database: own budget, no rate limit, so health checks always get through.
+CHEAP_PATHS = frozenset(['/api/ping', '/api/metrics'])
+CHEAP_CONCURRENCY = 64
+# Long-lived and holding no pooled connection while open.
+STREAM_PATHS = frozenset(['/api/status/stream'])
+USERNAME_PARAMETERS = ('username', 'requesterUsername')
+# Writes that name their user only in the body, which the middleware does not read; limited per client address.
+ADDRESS_LIMITED_PATHS = frozenset(['/api/tenders/new', '/api/tenders/bulk', '/api/bids/new', '/api/bids/bulk'])
+
+
+class Limiter:
+    def __init__(self, limit: int, queue: int, timeout: float):
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self._waiters = deque()
+
+    async def acquire(self) -> bool:
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return True
+        if len(self._waiters) >= self.queue:
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            # Not cancelled when the slot was handed over just as the wait timed out.
+            return not waiter.cancelled()
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif not waiter.cancelled():
+                self.release()
+            raise
+        return True
+
+    def release(self):
+        # A freed slot goes straight to the longest waiting request.
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class TokenBuckets:
+    def __init__(self, rate: float, burst: int, maxsize: int):
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+
+    def take(self, key: str) -> float:
+        # Returns 0 when the request may go, otherwise the seconds until the bucket has a token again.
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+def _rate_key(scope):
+    parameters = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    for name in USERNAME_PARAMETERS:
+        if parameters.get(name):
+            return f'user:{parameters[name][0]}'
+    # Behind a proxy the address is the forwarded one, as serve.py runs uvicorn with proxy_headers.
+    if scope['path'] in ADDRESS_LIMITED_PATHS and scope.get('client'):
+        return f'address:{scope["client"][0]}'
+    return None
+
+
+def _is_write(scope) -> bool:
+    # submit_decision is a GET in the API but writes like the other state changes.
+    return scope['method'] not in ('GET', 'HEAD', 'OPTIONS') or scope['path'].endswith('/submit_decision')
+
+
+class AdmissionMiddleware:
+    # Sheds load before it reaches the pool: a request that cannot get a slot within the short queue
+    # timeout is answered 503 at once instead of holding its socket while waiting for a connection.
+    def __init__(self, app):
+        self.app = app
+        self.cheap = Limiter(CHEAP_CONCURRENCY, 0, 0)
+        read_concurrency = max(1, ADMISSION_CONCURRENCY - ADMISSION_WRITE_CONCURRENCY)
+        self.reads = Limiter(read_concurrency, ADMISSION_QUEUE, ADMISSION_QUEUE_TIMEOUT)
+        self.writes = Limiter(ADMISSION_WRITE_CONCURRENCY, ADMISSION_QUEUE, ADMISSION_QUEUE_TIMEOUT)
+        self.users = TokenBuckets(ADMISSION_USER_RATE, ADMISSION_USER_BURST, ADMISSION_TRACKED_USERS)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        path = scope['path']
+        if path in CHEAP_PATHS:
+            limiter = self.cheap
+        else:
+            rate_key = _rate_key(scope)
+            if ADMISSION_USER_RATE > 0 and rate_key is not None:
+                wait = self.users.take(rate_key)
+                if wait:
+                    response = _rejection(429, 'too many requests for this user', wait)
+                    return await response(scope, receive, send)
+            if path in STREAM_PATHS or ADMISSION_CONCURRENCY <= 0:
+                return await self.app(scope, receive, send)
+            limiter = self.writes if _is_write(scope) else self.reads
+
+        if not await limiter.acquire():
+            response = _rejection(503, 'server is overloaded, retry later', ADMISSION_QUEUE_TIMEOUT)
+            return await response(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+
+def _rejection(status_code: int, detail: str, retry_after: float):
+    return JSONResponse({'detail': detail}, status_code=status_code,
+                        headers={'Retry-After': str(max(1, math.ceil(retry_after)))})
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import FrozenSet, NamedTuple, Optional
+from uuid import UUID
+
+import asyncpg
+
+from database.listener import listener
+
+AUTH_CACHE_TTL = float(os.getenv('AUTH_CACHE_TTL', 30))
+AUTH_CACHE_SIZE = int(os.getenv('AUTH_CACHE_SIZE', 10000))
+# The triggers of migration 0008 announce every committed change of employee or organization_responsible here.
+MEMBERSHIP_CHANNEL = 'membership_changes'
+
+logger = logging.getLogger('database.cache')
+
+
+class Membership(NamedTuple):
+    user_id: UUID
+    organization_ids: FrozenSet[UUID]
+
+
+class MembershipCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        # Bumped on every clear; a membership read before the last one may be stale and is not stored.
+        self.generation = 0
+
+    def get(self, username: str) -> Optional[Membership]:
+        entry = self._entries.get(username)
+        if entry is None:
+            return None
+        expires_at, membership = entry
+        if expires_at < time.monotonic():
+            del self._entries[username]
+            return None
+        self._entries.move_to_end(username)
+        return membership
+
+    def set(self, username: str, membership: Membership, generation: int):
+        if self.maxsize <= 0 or self.ttl <= 0 or generation != self.generation:
+            return
+        self._entries[username] = (time.monotonic() + self.ttl, membership)
+        self._entries.move_to_end(username)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.generation += 1
+
+
+membership_cache = MembershipCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
+
+def _membership_notified(connection, pid, channel, payload):
+    membership_cache.clear()
+
+
+async def watch_membership():
+    if AUTH_CACHE_SIZE <= 0 or AUTH_CACHE_TTL <= 0:
+        return
+    try:
+        # Anything changed while the connection is down is picked up once the TTL runs out,
+        # dropping the cache just shortens that.
+        await listener.listen(MEMBERSHIP_CHANNEL, _membership_notified, membership_cache.clear)
+    except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as e:
+        logger.warning('membership changes are not watched yet: %s', e)
+        listener.retry()
@@ -0,0 +1,217 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from fastapi import Depends, Request, Response
+
+import database.models as models
+from database.engine import MIN_LSN_HEADER, WEB_CONCURRENCY, WRITE_LSN_HEADER, later_lsn, lsn_text, lsn_value, \
+    read_session
+from database.etags import etag_matches, not_modified
+from database.pagination import NEXT_CURSOR_HEADER
+
+# Response cache for GET /api/tenders. Every page key embeds the generation counters of the service
+# types it covers; writers of tenders, and of bids since pages show bid counts, bump the counters after
+# commit, so changed pages are simply never looked up again and age out of the LRU.
+CATALOG_CACHE_SIZE = int(os.getenv('CATALOG_CACHE_SIZE', 1000))
+CATALOG_CACHE_TTL = float(os.getenv('CATALOG_CACHE_TTL', 300))
+# Empty for a per-process cache, redis://... to share it between workers, fake:// for the in-process fake.
+# A write only bumps the generations of the process that made it, so several workers need the shared one.
+CATALOG_CACHE_URL = os.getenv('CATALOG_CACHE_URL', '')
+CATALOG_CACHE_ENABLED = CATALOG_CACHE_SIZE > 0 or bool(CATALOG_CACHE_URL)
+
+logger = logging.getLogger('database.catalog_cache')
+
+
+class MemoryBackend:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._written = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def generations(self, names: List[str]) -> List[int]:
+        return [self._generations.get(name, 0) for name in names]
+
+    async def written(self, names: List[str]) -> Optional[int]:
+        return max((self._written[name] for name in names if name in self._written), default=None)
+
+    async def bump(self, names: Iterable[str], lsn: Optional[int] = None):
+        for name in names:
+            if lsn is not None:
+                self._written[name] = max(lsn, self._written.get(name, 0))
+            self._generations[name] = self._generations.get(name, 0) + 1
+
+
+class SharedBackend:
+    # Works with any client offering the get/set/mget/incr subset of redis.asyncio. Eviction is left to
+    # the server, which should run with maxmemory-policy allkeys-lru; entries also expire after the TTL.
+    def __init__(self, client, prefix: str = 'catalog:'):
+        self.client = client
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self.client.set(self.prefix + key, value, px=int(ttl * 1000))
+
+    async def generations(self, names: List[str]) -> List[int]:
+        values = await self.client.mget([f'{self.prefix}generation:{name}' for name in names])
+        return [int(value or 0) for value in values]
+
+    async def written(self, names: List[str]) -> Optional[int]:
+        scores = await self.client.zmscore(f'{self.prefix}written', names)
+        return max((int(score) for score in scores if score is not None), default=None)
+
+    async def bump(self, names: Iterable[str], lsn: Optional[int] = None):
+        names = list(names)
+        if lsn is not None and names:
+            # Recorded before the generations move on, so a reader that sees a new generation sees the position.
+            # Scores are doubles, exact for positions below 2^53 bytes of WAL.
+            await self.client.zadd(f'{self.prefix}written', {name: lsn for name in names}, gt=True)
+        for name in names:
+            await self.client.incr(f'{self.prefix}generation:{name}')
+
+
+class FakeRedis:
+    # In-process stand-in for the Redis server behind SharedBackend, for tests and local runs.
+    # Clients created over the same store see each other's writes, like workers sharing a server.
+    def __init__(self, store: Optional[dict] = None):
+        self._store = {} if store is None else store
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._store.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._store[key]
+            return None
+        return value
+
+    async def set(self, key: str, value: bytes, px: Optional[int] = None):
+        self._store[key] = (value, time.monotonic() + px / 1000 if px is not None else None)
+
+    async def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        return [await self.get(key) for key in keys]
+
+    async def incr(self, key: str) -> int:
+        value = int(await self.get(key) or 0) + 1
+        self._store[key] = (str(value).encode(), None)
+        return value
+
+    async def zadd(self, key: str, mapping: dict, gt: bool = False):
+        scores = await self.get(key) or {}
+        for member, score in mapping.items():
+            if not gt or member not in scores or score > scores[member]:
+                scores[member] = float(score)
+        self._store[key] = (scores, None)
+
+    async def zmscore(self, key: str, members: List[str]) -> List[Optional[float]]:
+        scores = await self.get(key) or {}
+        return [scores.get(member) for member in members]
+
+
+def make_backend(url: str, maxsize: int, workers: int = 1):
+    if url and not url.startswith('fake://'):
+        import redis.asyncio
+
+        return SharedBackend(redis.asyncio.from_url(url))
+    if workers > 1:
+        # A write only bumps the generations of its own worker, the others would serve stale pages.
+        logger.warning('catalog cache disabled: a per-process cache cannot be shared by WEB_CONCURRENCY=%d '
+                       'workers, set CATALOG_CACHE_URL=redis://... to cache with several workers', workers)
+        return None
+    return SharedBackend(FakeRedis()) if url else MemoryBackend(maxsize)
+
+
+class CatalogState(NamedTuple):
+    # The generations of every service type, and the furthest commit position of the writes that bumped them.
+    generations: Dict[str, int]
+    lsn: Optional[str]
+
+
+class CatalogCache:
+    def __init__(self, backend, ttl: float, enabled: bool = True):
+        self.backend = backend
+        self.ttl = ttl
+        self.enabled = enabled
+
+    async def state(self) -> CatalogState:
+        names = [service_type.value for service_type in models.TenderServiceTypeEnum]
+        # Generations first: writers record their position before bumping, so it covers what was read.
+        generations = await self.backend.generations(names)
+        written = await self.backend.written(names)
+        return CatalogState(dict(zip(names, generations)), None if written is None else lsn_text(written))
+
+    def key(self, state: CatalogState, service_types, sort: str, limit: int, offset: int,
+            cursor: Optional[str]) -> str:
+        names = sorted({service_type.value for service_type in service_types})
+        covered = ','.join(f'{name}@{state.generations[name]}' for name in names)
+        return f'tenders:{covered}:{sort}:{limit}:{offset}:{cursor or ""}'
+
+    async def get(self, request: Request, key: str) -> Optional[Response]:
+        value = await self.backend.get(key)
+        if value is None:
+            return None
+
+        etag, next_cursor, body = value.split(b'\n', 2)
+        etag = etag.decode()
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        response = Response(body, media_type='application/json', headers={'ETag': etag})
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor.decode()
+        return response
+
+    async def set(self, key: str, response: Response):
+        if response.status_code != 200:
+            return
+        next_cursor = response.headers.get(NEXT_CURSOR_HEADER, '')
+        value = b'\n'.join([response.headers['ETag'].encode(), next_cursor.encode(), response.body])
+        await self.backend.set(key, value, self.ttl)
+
+    async def invalidate(self, response: Response, *service_types: models.TenderServiceTypeEnum):
+        # Called after commit and remember_write, which gives the write's position when there are replicas.
+        if self.enabled:
+            lsn = response.headers.get(WRITE_LSN_HEADER)
+            await self.backend.bump({service_type.value for service_type in service_types},
+                                    lsn_value(lsn) if lsn else None)
+
+
+_backend = make_backend(CATALOG_CACHE_URL, CATALOG_CACHE_SIZE, WEB_CONCURRENCY) if CATALOG_CACHE_ENABLED else None
+tender_catalog = CatalogCache(_backend or MemoryBackend(0), CATALOG_CACHE_TTL, enabled=_backend is not None)
+
+
+async def catalog_state() -> Optional[CatalogState]:
+    return await tender_catalog.state() if tender_catalog.enabled else None
+
+
+async def get_catalog_db(request: Request, state: Optional[CatalogState] = Depends(catalog_state)):
+    # Cache misses read a replica like other reads, but only one that has replayed the writes behind the
+    # generations of the key; a lagging one would store a page older than its key for the whole TTL.
+    min_lsn = request.headers.get(MIN_LSN_HEADER)
+    if state is not None:
+        min_lsn = later_lsn(min_lsn, state.lsn)
+    async with read_session(min_lsn) as session:
+        yield session
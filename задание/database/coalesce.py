@@ -0,0 +1,67 @@
+import asyncio
+import os
+from typing import Optional
+
+from database import metrics
+
+# Identical reads arriving while one is in flight wait for it and share its rows instead of taking
+# a connection each. Callers are authorized before they get here; only the page query is shared.
+READ_COALESCING = os.getenv('READ_COALESCING', '1') == '1'
+
+coalesced_queries = metrics.counter('db_coalesced_queries_total',
+                                    'Coalescable reads by query, executed or served from a concurrent execution.',
+                                    ('query', 'result'))
+
+
+class _Abandoned(Exception):
+    # The executing request was cancelled; whoever was waiting on it has to run the query itself.
+    pass
+
+
+def _retrieve(flight: asyncio.Future):
+    # Marks the exception as seen when nobody was waiting for the flight.
+    if not flight.cancelled():
+        flight.exception()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights = {}
+
+    async def run(self, key: tuple, fetch):
+        flight = self._flights.get(key)
+        if flight is not None:
+            try:
+                result = await asyncio.shield(flight)
+            except _Abandoned:
+                return await self.run(key, fetch)
+            coalesced_queries.inc((key[0], 'shared'))
+            return result
+
+        flight = asyncio.get_running_loop().create_future()
+        flight.add_done_callback(_retrieve)
+        self._flights[key] = flight
+        try:
+            result = await fetch()
+        except asyncio.CancelledError:
+            flight.set_exception(_Abandoned())
+            raise
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            del self._flights[key]
+        coalesced_queries.inc((key[0], 'executed'))
+        flight.set_result(result)
+        return result
+
+
+read_queries = SingleFlight()
+
+
+async def read_rows(fetch, key: Optional[tuple] = None):
+    # fetch is called without arguments and returns the rows. key identifies the read by its normalized
+    # parameters, its first element names it in the metrics.
+    if key is None or not READ_COALESCING:
+        return await fetch()
+    return await read_queries.run(key, fetch)
@@ -1,217 +1,197 @@
 from uuid import UUID
 
 from fastapi import HTTPException
-from sqlalchemy.future import select
-from sqlalchemy.ext.asyncio import AsyncSession
 import database.models as models
 import database.schemas as schemas
+from database.repository import Repository
 
 
-async def get_tenders(db: AsyncSession):
-    result = await db.execute(select(models.Tender))
-    return result.scalars().all()
-
-
-async def create_tender(db: AsyncSession, tender: schemas.TenderCreate):
-    db_tender = models.Tender(**tender.dict())
-    db.add(db_tender)
-    await db.commit()
-    await db.refresh(db_tender)
-    return db_tender
-
-
-async def check_user_organization(db: AsyncSession, obj):
-    user_result = await db.execute(select(models.User).where(models.User.username == obj.creator_username))
-    user = user_result.scalar_one_or_none()
-
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
-
-    organization_result = await db.execute(select(
-        models.Organization).where(models.Organization.id == obj.organization_id))
-    organization = organization_result.scalar_one_or_none()
-
-    if not organization:
-        raise HTTPException(status_code=401, detail="Organization not found")
-
-    responsible_result = await db.execute(
-        select(models.OrganizationResponsible).where(
-            models.OrganizationResponsible.user_id == user.id,
-            models.OrganizationResponsible.organization_id == obj.organization_id
-        )
-    )
-    responsible = responsible_result.scalar_one_or_none()
-
-    if not responsible:
-        raise HTTPException(status_code=403, detail="User does not belong to the specified organization")
-
-
-async def get_user(db: AsyncSession, username: str):
-    if not username:
-        raise HTTPException(status_code=401, detail='user not found')
-
-    user_query = select(models.User).filter(models.User.username == username)
-    user_result = await db.execute(user_query)
-    user = user_result.scalar_one_or_none()
-
-    if not user:
-        raise HTTPException(status_code=401, detail="user not found")
-
-    return user
-
-
-async def check_author(db: AsyncSession, obj):
+async def check_author(repo: Repository, obj):
     if obj.authorType == "Organization":
-        organization_result = await db.execute(select(
-            models.Organization).where(models.Organization.id == obj.authorId))
-        organization = organization_result.scalar_one_or_none()
-
-        if not organization:
+        if not await repo.existing_organizations([obj.authorId]):
             raise HTTPException(status_code=401, detail="Organization not found")
-
-        return organization
     elif obj.authorType == "User":
-        user_result = await db.execute(select(models.User).where(models.User.username == obj.creator_username))
-        user = user_result.scalar_one_or_none()
-
-        if not user:
+        if not await repo.existing_users([obj.authorId]):
             raise HTTPException(status_code=401, detail="User not found")
-        return user
     else:
         raise HTTPException(status_code=401, detail="Incorrect type")
 
 
-async def check_tender(db: AsyncSession, obj):
-    tender_query = select(models.Tender).filter(models.Tender.id == obj.tenderId,
-                                                models.Tender.status == models.TenderStatusEnum.PUBLISHED)
-    tender_result = await db.execute(tender_query)
-    tender = tender_result.scalar_one_or_none()
+def bid_values(bid: schemas.BidCreate):
+    return {
+        'name': bid.name,
+        'description': bid.description,
+        'tender_id': bid.tenderId,
+        'author_type': models.BidAuthorTypeEnum(bid.authorType.value),
+        'author_id': bid.authorId,
+    }
 
-    if not tender:
+
+async def check_tender(repo: Repository, obj):
+    # Returns the service type of the published tender the bid is for.
+    tenders = await repo.published_tenders([obj.tenderId])
+    if obj.tenderId not in tenders:
         raise HTTPException(status_code=404, detail="tender not found")
+    return tenders[obj.tenderId]
 
 
-async def check_user_tender(db: AsyncSession, username: str, tender_id: UUID):
+def _require_username(username: str):
     if not username:
         raise HTTPException(status_code=401, detail='user not found')
 
-    user_query = select(models.User).filter(models.User.username == username)
-    user_result = await db.execute(user_query)
-    user = user_result.scalar_one_or_none()
 
-    if not user:
+def _require_membership(membership):
+    if membership is None:
         raise HTTPException(status_code=401, detail="user not found")
 
-    tender_query = select(models.Tender).filter(models.Tender.id == tender_id)
-    tender_result = await db.execute(tender_query)
-    tender = tender_result.scalar_one_or_none()
-
-    if not tender:
-        raise HTTPException(status_code=404, detail="tender not found")
 
-    return user, tender
+def _author_organizations(bid, organization_ids):
+    # A bid filed by a user belongs to the user's organizations, one filed by an organization to it alone.
+    if bid.author_type == models.BidAuthorTypeEnum.USER:
+        return organization_ids
+    return {bid.author_id}
 
 
-async def check_user_bid(db: AsyncSession, username: str, bid_id: UUID):
-    if not username:
-        raise HTTPException(status_code=401, detail='user not found')
+async def get_membership(repo: Repository, username: str):
+    _require_username(username)
+    membership = await repo.membership(username)
+    _require_membership(membership)
+    return membership
 
-    user_query = select(models.User).filter(models.User.username == username)
-    user_result = await db.execute(user_query)
-    user = user_result.scalar_one_or_none()
 
-    if not user:
-        raise HTTPException(status_code=401, detail="user not found")
+async def authorize_organization(repo: Repository, username: str, organization_id: UUID):
+    membership = await get_membership(repo, username)
 
-    bid_query = select(models.Tender).filter(models.Bid.id == bid_id)
-    bid_result = await db.execute(bid_query)
-    bid = bid_result.scalar_one_or_none()
+    if organization_id not in membership.organization_ids:
+        if not await repo.existing_organizations([organization_id]):
+            raise HTTPException(status_code=401, detail="Organization not found")
+        raise HTTPException(status_code=403, detail="User does not belong to the specified organization")
 
-    if not bid:
-        raise HTTPException(status_code=404, detail="bid not found")
+    return membership
 
-    return user, bid
 
+async def authorize_tender(repo: Repository, username: str, tender_id: UUID, brief: bool = False):
+    _require_username(username)
+    membership, tender = await repo.find_tender(username, tender_id, brief)
+    _require_membership(membership)
 
-async def check_responsible(db, user, db_tender):
-    responsible_query = select(models.OrganizationResponsible).filter(
-        models.OrganizationResponsible.user_id == user.id,
-        models.OrganizationResponsible.organization_id == db_tender.organization_id
-    )
-    responsible_result = await db.execute(responsible_query)
-    responsible = responsible_result.scalar_one_or_none()
+    if tender is None:
+        raise HTTPException(status_code=404, detail="tender not found")
 
-    if not responsible:
+    if tender.organization_id not in membership.organization_ids:
         raise HTTPException(status_code=403, detail="user does not have access to this tender")
 
-
-async def check_responsible_bid(db, user, bid):
-    if bid.author_type == models.BidAuthorTypeEnum.USER:
-        responsible_query_1 = select(models.OrganizationResponsible).filter(
-            models.OrganizationResponsible.user_id == bid.author_id
-        )
-        responsible_result = await db.execute(responsible_query_1)
-        responsible_1 = responsible_result.scalar_one_or_none()
-
-        responsible_query_2 = select(models.OrganizationResponsible).filter(
-            models.OrganizationResponsible.user_id == user.id
-        )
-        responsible_result = await db.execute(responsible_query_2)
-        responsible_2 = responsible_result.scalar_one_or_none()
-
-        if not responsible_1 or not responsible_2:
-            raise HTTPException(status_code=403, detail="user does not have access to this tender")
-
-        if not responsible_1.organization_id == responsible_2.organization_id:
-            raise HTTPException(status_code=403, detail="user does not have access to this tender")
-    else:
-        responsible_query = select(models.OrganizationResponsible).filter(
-            models.OrganizationResponsible.user_id == user.id,
-            models.OrganizationResponsible.organization_id == bid.author_id
-        )
-        responsible_result = await db.execute(responsible_query)
-        responsible = responsible_result.scalar_one_or_none()
-        if not responsible:
-            raise HTTPException(status_code=403, detail="user does not have access to this tender")
+    return membership, tender
 
 
-async def get_bid(db: AsyncSession, bid_id: UUID):
-    if not bid_id:
-        raise HTTPException(status_code=401, detail='bid not found')
+def _public(bid, published_public: bool) -> bool:
+    # Any existing user may read the status of a published bid, not only those it belongs to.
+    return published_public and bid.status == models.BidStatusEnum.PUBLISHED
 
-    bid_query = select(models.Bid).filter(models.Bid.id == bid_id)
-    bid_result = await db.execute(bid_query)
-    bid = bid_result.scalar_one_or_none()
 
-    if not bid:
-        raise HTTPException(status_code=401, detail="bid not found")
-
-    return bid
+async def authorize_bid(repo: Repository, username: str, bid_id: UUID, brief: bool = False,
+                        published_public: bool = False):
+    _require_username(username)
+    membership, bid, organization_ids = await repo.find_bid(username, bid_id, brief)
+    _require_membership(membership)
 
+    if bid is None:
+        raise HTTPException(status_code=404, detail="bid not found")
 
-async def get_tender(db: AsyncSession, tender_id: UUID):
-    if not tender_id:
-        raise HTTPException(status_code=404, detail='tender not found')
+    if _public(bid, published_public):
+        return membership, bid
+    if membership.organization_ids.isdisjoint(_author_organizations(bid, organization_ids)):
+        raise HTTPException(status_code=403, detail="user does not have access to this tender")
 
-    tender_query = select(models.Tender).filter(models.Tender.id == tender_id)
-    tender_result = await db.execute(tender_query)
-    tender = tender_result.scalar_one_or_none()
+    return membership, bid
+
+
+async def authorize_tenders(repo: Repository, username: str, tender_ids):
+    # Batch form of authorize_tender: the membership lookup plus one lookup for any number of ids.
+    # Maps every id to its brief tender, or to the HTTPException the single lookup would raise.
+    membership = await get_membership(repo, username)
+    tenders = await repo.tenders_by_id(tender_ids)
+
+    resolved = {}
+    for tender_id in tender_ids:
+        tender = tenders.get(tender_id)
+        if tender is None:
+            resolved[tender_id] = HTTPException(status_code=404, detail="tender not found")
+        elif tender.organization_id not in membership.organization_ids:
+            resolved[tender_id] = HTTPException(status_code=403, detail="user does not have access to this tender")
+        else:
+            resolved[tender_id] = tender
+    return resolved
+
+
+async def authorize_bids(repo: Repository, username: str, bid_ids, published_public: bool = False):
+    # Batch form of authorize_bid, same shape of result as authorize_tenders.
+    membership = await get_membership(repo, username)
+    bids = await repo.bids_by_id(bid_ids)
+
+    resolved = {}
+    for bid_id in bid_ids:
+        if bid_id not in bids:
+            resolved[bid_id] = HTTPException(status_code=404, detail="bid not found")
+            continue
+
+        bid, organization_ids = bids[bid_id]
+        if _public(bid, published_public):
+            resolved[bid_id] = bid
+        elif membership.organization_ids.isdisjoint(_author_organizations(bid, organization_ids)):
+            resolved[bid_id] = HTTPException(status_code=403, detail="user does not have access to this tender")
+        else:
+            resolved[bid_id] = bid
+    return resolved
+
+
+async def authorize_decision(repo: Repository, username: str, bid_id: UUID):
+    _require_username(username)
+    membership, bid, tender = await repo.find_decision(username, bid_id)
+    _require_membership(membership)
+
+    if bid is None:
+        raise HTTPException(status_code=401, detail="bid not found")
 
     if not tender:
         raise HTTPException(status_code=404, detail="tender not found")
 
-    return tender
-
-
-async def get_user_organization(db: AsyncSession, user):
-    responsible_result = await db.execute(
-        select(models.OrganizationResponsible).where(
-            models.OrganizationResponsible.user_id == user.id,
-        )
-    )
-    responsible = responsible_result.scalar_one_or_none()
-
-    if not responsible:
+    if tender.organization_id not in membership.organization_ids:
         raise HTTPException(status_code=403, detail="User does not belong to the specified organization")
 
-    return responsible.organization_id
+    return membership, bid, tender
+
+
+async def validate_tender_batch(repo: Repository, tenders):
+    # Same checks as authorize_organization for every item, in two lookups regardless of the batch size.
+    memberships = await repo.memberships({tender.creator_username for tender in tenders})
+    organizations = await repo.existing_organizations({tender.organization_id for tender in tenders})
+
+    errors = {}
+    for index, tender in enumerate(tenders):
+        if tender.creator_username not in memberships:
+            errors[index] = (401, "User not found")
+        elif tender.organization_id not in organizations:
+            errors[index] = (401, "Organization not found")
+        elif tender.organization_id not in memberships[tender.creator_username]:
+            errors[index] = (403, "User does not belong to the specified organization")
+    return errors
+
+
+async def validate_bid_batch(repo: Repository, bids):
+    # Same checks as check_author and check_tender for every item, in three lookups regardless of the batch size.
+    tenders = await repo.published_tenders({bid.tenderId for bid in bids})
+    organizations = await repo.existing_organizations(
+        {bid.authorId for bid in bids if bid.authorType == schemas.BidAuthorTypeEnum.ORGANIZATION})
+    users = await repo.existing_users(
+        {bid.authorId for bid in bids if bid.authorType == schemas.BidAuthorTypeEnum.USER})
+
+    errors = {}
+    for index, bid in enumerate(bids):
+        if bid.authorType == schemas.BidAuthorTypeEnum.ORGANIZATION and bid.authorId not in organizations:
+            errors[index] = (401, "Organization not found")
+        elif bid.authorType == schemas.BidAuthorTypeEnum.USER and bid.authorId not in users:
+            errors[index] = (401, "User not found")
+        elif bid.tenderId not in tenders:
+            errors[index] = (404, "tender not found")
+    return errors, tenders
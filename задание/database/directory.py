@@ -0,0 +1,243 @@
+import csv
+import itertools
+import json
+import uuid
+from typing import Callable, Iterator, NamedTuple, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+import database.models as models
+
+# Loads employee, organization and organization_responsible rows in bulk. Input is read in batches; every
+# batch is copied into a temporary staging table, checked against the database with a few set-based
+# statements and merged into the target table in one transaction. Rows that cannot be loaded are reported
+# one by one and the rest of the batch goes in.
+
+DEFAULT_BATCH_SIZE = 10000
+
+
+class Reject(NamedTuple):
+    line: int
+    reason: str
+    row: Optional[dict]
+
+
+class Entity(NamedTuple):
+    table: str
+    # Columns of the staging table staging_<table>, after the input line number.
+    staging: str
+    columns: Tuple[str, ...]
+    parse: Callable[[dict], tuple]
+    # Staging columns that must be unique within the input: of two rows, the later one wins.
+    keys: Tuple[str, ...]
+    # Statements completing the staging rows before they are checked.
+    resolve: Tuple[str, ...]
+    # (reason, condition on staging row s) pairs; matching rows are rejected.
+    checks: Tuple[Tuple[str, str], ...]
+    # INSERT ... RETURNING (xmax::text = '0') AS inserted, i.e. true for new rows and false for updated ones.
+    merge: str
+
+
+def _optional(row: dict, name: str, max_length: Optional[int] = None) -> Optional[str]:
+    value = row.get(name)
+    if value is None or value == '':
+        return None
+    value = str(value)
+    if max_length is not None and len(value) > max_length:
+        raise ValueError(f'{name} is longer than {max_length} characters')
+    return value
+
+
+def _required(row: dict, name: str, max_length: Optional[int] = None) -> str:
+    value = _optional(row, name, max_length)
+    if value is None:
+        raise ValueError(f'{name} is required')
+    return value
+
+
+def _uuid(row: dict, name: str, required: bool = True) -> Optional[uuid.UUID]:
+    value = _required(row, name) if required else _optional(row, name)
+    if value is None:
+        return None
+    try:
+        return uuid.UUID(value)
+    except ValueError:
+        raise ValueError(f'{name} is not a valid UUID')
+
+
+def _parse_employee(row: dict) -> tuple:
+    return (_uuid(row, 'id', required=False), _required(row, 'username', 50), _optional(row, 'first_name', 50),
+            _optional(row, 'last_name', 50))
+
+
+def _parse_organization(row: dict) -> tuple:
+    organization_type = _required(row, 'type')
+    if organization_type not in models.OrganizationTypeEnum.__members__:
+        raise ValueError(f'type must be one of {", ".join(models.OrganizationTypeEnum.__members__)}')
+    return (_uuid(row, 'id'), _required(row, 'name', 100), _optional(row, 'description'), organization_type)
+
+
+def _parse_responsible(row: dict) -> tuple:
+    user_id, username = _uuid(row, 'user_id', required=False), _optional(row, 'username', 50)
+    if user_id is None and username is None:
+        raise ValueError('user_id or username is required')
+    return _uuid(row, 'organization_id'), user_id, username
+
+
+ENTITIES = {
+    'employee': Entity(
+        table='employee',
+        staging='id uuid, username varchar(50), first_name varchar(50), last_name varchar(50)',
+        columns=('id', 'username', 'first_name', 'last_name'),
+        parse=_parse_employee,
+        keys=('username', 'id'),
+        # Employees without an id are matched by username, new ones get one.
+        resolve=(
+            'UPDATE staging_employee s SET id = e.id FROM employee e WHERE s.id IS NULL AND e.username = s.username',
+            'UPDATE staging_employee SET id = gen_random_uuid() WHERE id IS NULL',
+        ),
+        # Tenders refer to their creator by username, so it is never changed by a load.
+        checks=(
+            ('username belongs to another employee',
+             'EXISTS (SELECT 1 FROM employee e WHERE e.username = s.username AND e.id <> s.id)'),
+            ('employee exists with another username',
+             'EXISTS (SELECT 1 FROM employee e WHERE e.id = s.id AND e.username <> s.username)'),
+        ),
+        merge="""
+            INSERT INTO employee (id, username, first_name, last_name)
+            SELECT id, username, first_name, last_name FROM staging_employee
+            ON CONFLICT (id) DO UPDATE SET first_name = excluded.first_name, last_name = excluded.last_name,
+                updated_at = now()
+            RETURNING xmax::text = '0' AS inserted
+        """,
+    ),
+    'organization': Entity(
+        table='organization',
+        staging='id uuid, name varchar(100), description text, type organizationtypeenum',
+        columns=('id', 'name', 'description', 'type'),
+        parse=_parse_organization,
+        keys=('id',),
+        resolve=(),
+        checks=(),
+        merge="""
+            INSERT INTO organization (id, name, description, type)
+            SELECT id, name, description, type FROM staging_organization
+            ON CONFLICT (id) DO UPDATE SET name = excluded.name, description = excluded.description,
+                type = excluded.type, updated_at = now()
+            RETURNING xmax::text = '0' AS inserted
+        """,
+    ),
+    'organization_responsible': Entity(
+        table='organization_responsible',
+        staging='organization_id uuid, user_id uuid, username varchar(50)',
+        columns=('organization_id', 'user_id', 'username'),
+        parse=_parse_responsible,
+        keys=(),
+        resolve=(
+            'UPDATE staging_organization_responsible s SET user_id = e.id FROM employee e '
+            'WHERE s.user_id IS NULL AND e.username = s.username',
+        ),
+        checks=(
+            ('unknown employee', 'NOT EXISTS (SELECT 1 FROM employee e WHERE e.id = s.user_id)'),
+            ('unknown organization', 'NOT EXISTS (SELECT 1 FROM organization o WHERE o.id = s.organization_id)'),
+        ),
+        # Existing memberships are left as they are; repeated rows collapse into one.
+        merge="""
+            INSERT INTO organization_responsible (id, organization_id, user_id)
+            SELECT gen_random_uuid(), organization_id, user_id
+            FROM (SELECT DISTINCT organization_id, user_id FROM staging_organization_responsible) s
+            ON CONFLICT (user_id, organization_id) DO NOTHING
+            RETURNING xmax::text = '0' AS inserted
+        """,
+    ),
+}
+
+
+def read_rows(file, file_format: str) -> Iterator[Tuple[int, dict]]:
+    # Yields (line number, row) pairs without reading more of the file than the current row.
+    if file_format == 'csv':
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else None
+
+
+class LoadResult:
+    def __init__(self):
+        self.read = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.rejected = 0
+
+
+async def _load_batch(driver, entity: Entity, rows: dict, records: list, result: LoadResult, on_reject):
+    staging = f'staging_{entity.table}'
+
+    def reject(lines, reason):
+        for line in lines:
+            result.rejected += 1
+            on_reject(Reject(line, reason, rows[line]))
+
+    async with driver.transaction():
+        await driver.execute(f'CREATE TEMP TABLE {staging} (line integer, {entity.staging}) ON COMMIT DROP')
+        await driver.copy_records_to_table(staging, records=records, columns=('line', *entity.columns))
+
+        for key in entity.keys:
+            duplicates = await driver.fetch(
+                f'DELETE FROM {staging} s USING (SELECT {key}, max(line) AS line FROM {staging} GROUP BY {key}) t '
+                f'WHERE s.{key} = t.{key} AND s.line < t.line RETURNING s.line, t.line AS later'
+            )
+            for line, later in sorted(duplicates):
+                reject([line], f'{key} repeated on line {later}')
+
+        for statement in entity.resolve:
+            await driver.execute(statement)
+        for reason, condition in entity.checks:
+            bad = await driver.fetch(f'DELETE FROM {staging} s WHERE {condition} RETURNING s.line')
+            reject(sorted(record['line'] for record in bad), reason)
+
+        staged = await driver.fetchval(f'SELECT count(*) FROM {staging}')
+        merged = await driver.fetch(entity.merge)
+        inserted = sum(1 for record in merged if record['inserted'])
+        result.inserted += inserted
+        result.updated += len(merged) - inserted
+        result.unchanged += staged - len(merged)
+
+
+async def load(engine: AsyncEngine, entity_name: str, rows, on_reject, batch_size: int = DEFAULT_BATCH_SIZE):
+    entity = ENTITIES[entity_name]
+    result = LoadResult()
+
+    async with engine.connect() as conn:
+        raw = await conn.get_raw_connection()
+        driver = raw.driver_connection
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+
+            by_line, records = {}, []
+            for line, row in batch:
+                result.read += 1
+                by_line[line] = row
+                try:
+                    if row is None:
+                        raise ValueError('not a JSON object')
+                    records.append((line, *entity.parse(row)))
+                except ValueError as e:
+                    result.rejected += 1
+                    on_reject(Reject(line, str(e), row))
+            if records:
+                await _load_batch(driver, entity, by_line, records, result, on_reject)
+    return result
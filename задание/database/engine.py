@@ -1,9 +1,21 @@
+import itertools
+import logging
 import os
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from fastapi import Request, Response
+from sqlalchemy import URL, event, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from dotenv import load_dotenv
 
+from database import metrics
+
 load_dotenv()
 
 
@@ -12,15 +24,205 @@ POSTGRES_PASSWORD = os.getenv('POSTGRES_PASSWORD')
 POSTGRES_HOST = os.getenv('POSTGRES_HOST')
 POSTGRES_PORT = os.getenv('POSTGRES_PORT')
 POSTGRES_DB = os.getenv('POSTGRES_DATABASE')
+# Comma separated host[:port] list of read replicas; the primary's port is used when omitted.
+POSTGRES_REPLICA_HOSTS = os.getenv('POSTGRES_REPLICA_HOSTS', '')
+
+# DB_MAX_CONNECTIONS is the connection budget of the whole deployment; it is split evenly
+# between the WEB_CONCURRENCY worker processes unless the pool is sized explicitly.
+WEB_CONCURRENCY = max(1, int(os.getenv('WEB_CONCURRENCY', 1)))
+DB_MAX_CONNECTIONS = int(os.getenv('DB_MAX_CONNECTIONS', 0))
+_WORKER_CONNECTIONS = max(1, DB_MAX_CONNECTIONS // WEB_CONCURRENCY) if DB_MAX_CONNECTIONS else 0
+
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', _WORKER_CONNECTIONS or 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', max(0, _WORKER_CONNECTIONS - DB_POOL_SIZE)
+                                if _WORKER_CONNECTIONS else 10))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '0') == '1'
+DB_CONNECT_TIMEOUT = float(os.getenv('DB_CONNECT_TIMEOUT', 5))
+DB_REPLICA_RETRY = float(os.getenv('DB_REPLICA_RETRY', 10))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', 500))
+DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', 0))
+DB_LOG_SQL = os.getenv('DB_LOG_SQL', '0') == '1'
+
+DB_URL = URL.create(
+    'postgresql+asyncpg',
+    username=POSTGRES_USERNAME,
+    password=POSTGRES_PASSWORD,
+    host=POSTGRES_HOST,
+    port=int(POSTGRES_PORT) if POSTGRES_PORT else None,
+    database=POSTGRES_DB,
+)
+
+sql_logger = logging.getLogger('database.sql')
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            metrics.record_pool_wait(time.perf_counter() - started)
+
+
+def _instrument(engine: AsyncEngine):
+    @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        metrics.record_query_started()
+        context.query_started_at = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - context.query_started_at
+        metrics.record_query(duration)
+        if DB_LOG_SQL:
+            # Parameters are deliberately left out: they carry user data.
+            sql_logger.info('%.2fms %s', duration * 1000, statement, extra={
+                'statement': statement,
+                'duration_ms': duration * 1000,
+                'executemany': executemany,
+            })
+
 
-DB_URL = f'postgresql+asyncpg://{POSTGRES_USERNAME}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}'
-print(DB_URL)
+def make_engine(url: URL) -> AsyncEngine:
+    server_settings = {}
+    if DB_STATEMENT_TIMEOUT:
+        server_settings['statement_timeout'] = str(DB_STATEMENT_TIMEOUT)
 
-engine = create_async_engine(DB_URL, echo=True)
-SessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    engine = create_async_engine(
+        # SQLAlchemy keeps up to this many asyncpg prepared statements per connection,
+        # so the identical crud queries are parsed and planned once per connection.
+        url.update_query_dict({'prepared_statement_cache_size': str(DB_STATEMENT_CACHE_SIZE)}),
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        poolclass=TimedQueuePool,
+        connect_args={
+            'timeout': DB_CONNECT_TIMEOUT,
+            'statement_cache_size': DB_STATEMENT_CACHE_SIZE,
+            'server_settings': server_settings,
+        },
+    )
+    _instrument(engine)
+    return engine
+
+
+def _replica_url(address: str) -> URL:
+    host, _, port = address.strip().partition(':')
+    return DB_URL.set(host=host, port=int(port) if port else DB_URL.port)
+
+
+# Engines are created on first use, so every worker process opens its own pool after the fork
+# instead of inheriting sockets from the parent that ran the migrations.
+_engine = None
+_replica_engines = None
+SessionLocal = async_sessionmaker(class_=AsyncSession, expire_on_commit=False)
 Base = declarative_base()
 
+REPLICA_ADDRESSES = [address.strip() for address in POSTGRES_REPLICA_HOSTS.split(',') if address.strip()]
+_replica_order = itertools.cycle(range(len(REPLICA_ADDRESSES)))
+_replica_down_until = [0.0] * len(REPLICA_ADDRESSES)
+
+
+def get_engine() -> AsyncEngine:
+    global _engine
+    if _engine is None:
+        _engine = make_engine(DB_URL)
+    return _engine
+
+
+def get_replica_engines() -> List[AsyncEngine]:
+    global _replica_engines
+    if _replica_engines is None:
+        _replica_engines = [make_engine(_replica_url(address)) for address in REPLICA_ADDRESSES]
+    return _replica_engines
+
+
+async def dispose_engines():
+    # Closes the pooled connections; checked out ones are closed as soon as they are returned.
+    global _engine, _replica_engines
+    for engine in [_engine, *(_replica_engines or [])]:
+        if engine is not None:
+            await engine.dispose()
+    _engine = _replica_engines = None
+
+
+# Read-your-writes: writes report the primary's WAL position in WRITE_LSN_HEADER and a client that
+# sends it back in MIN_LSN_HEADER is only served by a replica that has replayed at least that far.
+WRITE_LSN_HEADER = 'X-Write-LSN'
+MIN_LSN_HEADER = 'X-Min-LSN'
+_LSN = re.compile(r'[0-9A-Fa-f]{1,8}/[0-9A-Fa-f]{1,8}')
+
 
 async def get_db() -> AsyncSession:
-    async with SessionLocal() as session:
+    async with SessionLocal(bind=get_engine()) as session:
         yield session
+
+
+async def _open_replica_session(min_lsn):
+    replicas = get_replica_engines()
+    for _ in range(len(replicas)):
+        index = next(_replica_order)
+        if _replica_down_until[index] > time.monotonic():
+            continue
+
+        session = SessionLocal(bind=replicas[index])
+        try:
+            if min_lsn is None:
+                await session.connection()
+                return session
+            # pg_last_wal_replay_lsn() is NULL outside of recovery, i.e. on a standalone server.
+            result = await session.execute(
+                text('SELECT COALESCE(pg_last_wal_replay_lsn(), pg_current_wal_lsn()) >= CAST(:lsn AS pg_lsn)'),
+                {'lsn': min_lsn},
+            )
+            if result.scalar():
+                return session
+        except (OSError, DBAPIError):
+            _replica_down_until[index] = time.monotonic() + DB_REPLICA_RETRY
+        await session.close()
+    return None
+
+
+def lsn_value(lsn: str) -> int:
+    high, _, low = lsn.partition('/')
+    return int(high, 16) << 32 | int(low, 16)
+
+
+def lsn_text(value: int) -> str:
+    return f'{value >> 32:X}/{value & 0xFFFFFFFF:X}'
+
+
+def later_lsn(first: Optional[str], second: Optional[str]) -> Optional[str]:
+    # The position a read has to wait for to see both; a malformed one is kept, so that the primary answers.
+    if first is None or second is None:
+        return second if first is None else first
+    for lsn in (first, second):
+        if not _LSN.fullmatch(lsn):
+            return lsn
+    return max(first, second, key=lsn_value)
+
+
+@asynccontextmanager
+async def read_session(min_lsn: Optional[str] = None):
+    # A replica that has replayed at least min_lsn if there is one, otherwise the primary.
+    session = None
+    if REPLICA_ADDRESSES and (min_lsn is None or _LSN.fullmatch(min_lsn)):
+        session = await _open_replica_session(min_lsn)
+
+    async with session or SessionLocal(bind=get_engine()) as session:
+        yield session
+
+
+async def get_read_db(request: Request) -> AsyncSession:
+    async with read_session(request.headers.get(MIN_LSN_HEADER)) as session:
+        yield session
+
+
+async def remember_write(db: AsyncSession, response: Response):
+    if REPLICA_ADDRESSES:
+        result = await db.execute(text('SELECT CAST(pg_current_wal_lsn() AS text)'))
+        response.headers[WRITE_LSN_HEADER] = result.scalar()
@@ -0,0 +1,65 @@
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response
+
+import database.models as models
+from database.coalesce import read_rows
+from database.engine import MIN_LSN_HEADER
+from database.pagination import set_next_cursor
+from database.projections import rows_response
+
+
+def entity_etag(version: int, status) -> str:
+    # Status changes do not bump the version, so both go into the tag.
+    return f'"{version}-{status.value}"'
+
+
+# What a page's tag covers: the columns of its rows that change without a new version.
+ETAG_COLUMNS = {
+    models.Tender: ('id', 'version', 'status', 'bid_count'),
+    models.Bid: ('id', 'version', 'status'),
+}
+
+
+def rows_etag(rows, model) -> str:
+    names = ETAG_COLUMNS[model]
+    digest = hashlib.blake2b(digest_size=12)
+    for row in rows:
+        digest.update((':'.join(str(getattr(row, name)) for name in names) + ';').encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(',')]
+    return '*' in tags or etag in (tag.removeprefix('W/') for tag in tags)
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={'ETag': etag})
+
+
+async def page_response(request: Request, fetch, model, limit: int, cursor_key: str = 'name',
+                        key: Optional[tuple] = None) -> Response:
+    # fetch(versions) reads the page, with versions=True it only needs the ETAG_COLUMNS of the rows.
+    # key makes concurrent requests for the same page share one execution; a client asking for
+    # its own writes through MIN_LSN_HEADER always runs the query itself.
+    if request.headers.get(MIN_LSN_HEADER):
+        key = None
+
+    # A conditional request first reads the same page over the ETAG_COLUMNS only,
+    # and skips loading and serializing the rows when the client's copy is current.
+    if request.headers.get('If-None-Match'):
+        versions = await read_rows(lambda: fetch(True), key and (*key, 'versions'))
+        etag = rows_etag(versions, model)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+    rows = await read_rows(lambda: fetch(False), key)
+    response = rows_response(rows)
+    response.headers['ETag'] = rows_etag(rows, model)
+    set_next_cursor(response, rows, limit, cursor_key)
+    return response
@@ -0,0 +1,91 @@
+import csv
+import enum
+import io
+import os
+from datetime import datetime
+
+import anyio
+import orjson
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Rows fetched from the server-side cursor at a time, and written to the client as one chunk.
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+
+EXPORT_MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _encode_ndjson(rows) -> bytes:
+    return b''.join(orjson.dumps(row._asdict(), default=str, option=orjson.OPT_APPEND_NEWLINE) for row in rows)
+
+
+def _encode_csv(rows) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([_csv_value(value) for value in row] for row in rows)
+    return buffer.getvalue().encode()
+
+
+async def stream_rows(db: AsyncSession, query):
+    # Yields the rows of the query in batches of EXPORT_BATCH_SIZE from a server-side cursor, so memory does
+    # not grow with the table: the next batch is only fetched once the previous one has been consumed.
+    # The session has its transaction from the authorization queries; the export gets a fresh one,
+    # which sees every row as of its first fetch however long the client takes to read.
+    await db.commit()
+    await db.execute(text('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY'))
+    result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    completed = False
+    try:
+        async for rows in result.partitions():
+            yield rows
+        completed = True
+    finally:
+        if not completed:
+            # The client went away, possibly cancelling a fetch halfway: the connection is closed rather than
+            # returned to the pool. Shielded, since the cancelled response would cancel this await as well.
+            with anyio.CancelScope(shield=True):
+                await db.invalidate()
+
+
+async def _export_rows(batches, columns, file_format: str):
+    if file_format == 'csv':
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(columns)
+        yield buffer.getvalue().encode()
+    encode = _encode_csv if file_format == 'csv' else _encode_ndjson
+
+    try:
+        async for rows in batches:
+            yield encode(rows)
+    finally:
+        # Leaving early, the batches are closed here and now rather than whenever they are collected:
+        # a database export has to let go of its connection before the session is returned.
+        with anyio.CancelScope(shield=True):
+            await batches.aclose()
+
+
+def export_response(batches, columns, file_format: str, filename: str) -> StreamingResponse:
+    # batches is an async iterator of row batches, as the repositories' exports return them; each batch
+    # is written to the client as one chunk.
+    if file_format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_MEDIA_TYPES)}")
+    return StreamingResponse(
+        _export_rows(batches, columns, file_format),
+        media_type=EXPORT_MEDIA_TYPES[file_format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}.{file_format}"'},
+    )
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import os
+
+from sqlalchemy import delete, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+import database.models as models
+
+# Versions kept in the history tables: the last HISTORY_KEEP_VERSIONS before the current one and every
+# HISTORY_CHECKPOINT_EVERY-th (0 for none). Older ones are moved to the archive tables, where rollback still
+# finds them.
+HISTORY_KEEP_VERSIONS = int(os.getenv('HISTORY_KEEP_VERSIONS', 10))
+HISTORY_CHECKPOINT_EVERY = int(os.getenv('HISTORY_CHECKPOINT_EVERY', 10))
+# Rows moved per transaction, so that the row locks are short-lived.
+HISTORY_COMPACT_BATCH = int(os.getenv('HISTORY_COMPACT_BATCH', 1000))
+# Seconds between compaction runs in the server; 0 leaves it to `python migrate.py compact`.
+HISTORY_COMPACT_INTERVAL = float(os.getenv('HISTORY_COMPACT_INTERVAL', 0))
+
+# Only one compaction runs at a time, whatever the number of workers.
+COMPACTION_LOCK_ID = 7_262_025
+
+HISTORIES = (
+    (models.TenderHistory, models.TenderHistoryArchive, models.Tender, 'tender_id'),
+    (models.BidHistory, models.BidHistoryArchive, models.Bid, 'bid_id'),
+)
+
+logger = logging.getLogger('database.history')
+
+
+def archive_batch(history, archive, live, key: str, after, keep: int, every: int, batch_size: int):
+    # Moves up to batch_size compactable rows of the entities from `after` on, in entity order, and returns
+    # their entity ids. Rows locked by a concurrent rollback are skipped and left for the next run.
+    owner = getattr(history, key)
+    conditions = [owner == live.id, history.version < live.version - keep]
+    if after is not None:
+        conditions.append(owner >= after)
+    if every:
+        conditions.append(history.version % every != 0)
+    doomed = select(history.id).where(*conditions).order_by(owner).limit(batch_size) \
+        .with_for_update(of=history, skip_locked=True).cte('doomed')
+
+    columns = [column.name for column in history.__table__.columns]
+    moved = delete(history).where(history.id == doomed.c.id).returning(*history.__table__.columns).cte('moved')
+    archived = insert(archive).from_select(columns, select(*[moved.c[name] for name in columns])) \
+        .returning(getattr(archive, key)).cte('archived')
+    return select(archived.c[key])
+
+
+async def compact_history(conn: AsyncConnection, keep: int = HISTORY_KEEP_VERSIONS,
+                          every: int = HISTORY_CHECKPOINT_EVERY, batch_size: int = HISTORY_COMPACT_BATCH):
+    result = await conn.execute(text('SELECT pg_try_advisory_lock(:id)'), {'id': COMPACTION_LOCK_ID})
+    acquired = result.scalar()
+    await conn.commit()
+    if not acquired:
+        return None
+
+    moved = {}
+    try:
+        for history, archive, live, key in HISTORIES:
+            total, after = 0, None
+            while True:
+                result = await conn.execute(archive_batch(history, archive, live, key, after, keep, every, batch_size))
+                owners = result.scalars().all()
+                await conn.commit()
+                total += len(owners)
+                if len(owners) < batch_size:
+                    break
+                after = max(owners)
+            moved[history.__tablename__] = total
+    finally:
+        await conn.rollback()
+        await conn.execute(text('SELECT pg_advisory_unlock(:id)'), {'id': COMPACTION_LOCK_ID})
+        await conn.commit()
+    return moved
+
+
+async def compaction_loop(engine: AsyncEngine, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with engine.connect() as conn:
+                moved = await compact_history(conn)
+            if moved:
+                logger.info('archived %s', ', '.join(f'{count} {table} rows' for table, count in moved.items()))
+        except Exception:
+            logger.exception('history compaction failed')
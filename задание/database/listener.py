@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import os
+
+import asyncpg
+
+from database.engine import DB_CONNECT_TIMEOUT, DB_URL
+
+# Seconds between attempts to get the LISTEN connection back after it was lost.
+LISTEN_RETRY = float(os.getenv('LISTEN_RETRY', 5))
+
+logger = logging.getLogger('database.listener')
+
+
+class Listener:
+    # One LISTEN connection per worker process, outside of the pool, shared by every channel.
+    # Each channel has a callback for its notifications and one for when the connection is lost,
+    # since notifications sent until it is back are never delivered.
+    def __init__(self):
+        self._connection = None
+        self._connecting = asyncio.Lock()
+        self._channels = {}
+        self._reconnecting = None
+        self._closed = False
+
+    async def listen(self, channel: str, callback, lost):
+        self._closed = False
+        async with self._connecting:
+            if self._connection is not None and not self._connection.is_closed():
+                if channel not in self._channels:
+                    await self._connection.add_listener(channel, callback)
+                self._channels[channel] = (callback, lost)
+                return
+            self._channels[channel] = (callback, lost)
+            await self._connect()
+
+    def retry(self):
+        # Keeps trying to connect in the background, for channels that must stay subscribed.
+        if self._reconnecting is None or self._reconnecting.done():
+            self._reconnecting = asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _connect(self):
+        dsn = DB_URL.set(drivername='postgresql').render_as_string(hide_password=False)
+        connection = await asyncpg.connect(dsn, timeout=DB_CONNECT_TIMEOUT)
+        for channel, (callback, _) in self._channels.items():
+            await connection.add_listener(channel, callback)
+        connection.add_termination_listener(self._terminated)
+        self._connection = connection
+
+    async def _reconnect(self):
+        while not self._closed:
+            await asyncio.sleep(LISTEN_RETRY)
+            try:
+                async with self._connecting:
+                    if self._connection is None or self._connection.is_closed():
+                        await self._connect()
+                return
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as e:
+                logger.warning('cannot reconnect the LISTEN connection: %s', e)
+
+    def _terminated(self, connection):
+        if connection is not self._connection:
+            return
+        self._connection = None
+        for _, lost in list(self._channels.values()):
+            lost()
+        if not self._closed:
+            self.retry()
+
+    async def close(self):
+        self._closed = True
+        if self._reconnecting is not None:
+            self._reconnecting.cancel()
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            await connection.close()
+
+
+listener = Listener()
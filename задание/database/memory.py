@@ -0,0 +1,539 @@
+import bisect
+import heapq
+import itertools
+import re
+import uuid
+from collections import namedtuple
+from datetime import datetime
+from operator import attrgetter
+from typing import Dict, List, NamedTuple, Optional
+
+from fastapi import HTTPException
+
+import database.models as models
+from database.cache import Membership
+from database.export import EXPORT_BATCH_SIZE
+from database.pagination import decode_page_cursor
+from database.projections import BID_READ_FIELDS, REVIEW_READ_FIELDS, TENDER_READ_FIELDS
+from database.repository import BID_HISTORY_COLUMNS, TENDER_HISTORY_COLUMNS, Repository
+from database.status_stream import status_broadcaster
+
+# Storage in the worker process, with the lookups of the database's indexes: dicts for the primary and
+# unique keys, and sorted lists of (sort key, id) for every order the listings page through. Records are
+# immutable and replaced on change, so a page or an export keeps the state it was read from. No method
+# awaits while it touches the store, which makes each one atomic on the event loop, like a transaction.
+
+
+class Tender(NamedTuple):
+    id: uuid.UUID
+    name: str
+    description: Optional[str]
+    service_type: models.TenderServiceTypeEnum
+    status: models.TenderStatusEnum
+    version: int
+    organization_id: uuid.UUID
+    creator_username: str
+    createdAt: datetime
+    bid_count: int = 0
+
+
+class Bid(NamedTuple):
+    id: uuid.UUID
+    name: str
+    description: Optional[str]
+    status: models.BidStatusEnum
+    version: int
+    tender_id: uuid.UUID
+    author_type: models.BidAuthorTypeEnum
+    author_id: uuid.UUID
+    createdAt: datetime
+
+
+class Review(NamedTuple):
+    id: uuid.UUID
+    content: str
+    bid_id: uuid.UUID
+    creator_username: str
+    createdAt: datetime
+
+
+# List rows, with the columns the SQL pages select.
+TenderRow = namedtuple('TenderRow', TENDER_READ_FIELDS)
+SearchRow = namedtuple('SearchRow', (*TENDER_READ_FIELDS, 'rank'))
+BidRow = namedtuple('BidRow', BID_READ_FIELDS)
+ReviewRow = namedtuple('ReviewRow', REVIEW_READ_FIELDS)
+
+_tender_row = attrgetter(*TENDER_READ_FIELDS)
+_bid_row = attrgetter(*BID_READ_FIELDS)
+
+ENUMS = {
+    'service_type': models.TenderServiceTypeEnum,
+    'author_type': models.BidAuthorTypeEnum,
+}
+STATUS_ENUMS = {Tender: models.TenderStatusEnum, Bid: models.BidStatusEnum}
+NOT_NULL_COLUMNS = ('name', 'service_type', 'status')
+
+# Weights of a match in the name and in the description, as setweight gives them to search_vector.
+SEARCH_WEIGHTS = (1.0, 0.4)
+_WORD = re.compile(r'-?\w+')
+
+
+def _enum(enum, value):
+    # Members of the schemas' enums, values, or the names the database stores, like the dataset's 'USER'.
+    if isinstance(value, str) and value in enum.__members__:
+        return enum[value]
+    return enum(value)
+
+
+def _values(record_type, values: dict) -> dict:
+    converted = {}
+    for name, value in values.items():
+        enum = STATUS_ENUMS[record_type] if name == 'status' else ENUMS.get(name)
+        converted[name] = _enum(enum, value) if enum is not None and value is not None else value
+    return converted
+
+
+def _service_types(service_types):
+    # Filters of either the schemas' or the models' enum, as the records hold the models' one.
+    return {models.TenderServiceTypeEnum(service_type) for service_type in service_types} if service_types else None
+
+
+def _words(text: Optional[str]) -> List[str]:
+    return _WORD.findall(text.lower()) if text else []
+
+
+def _ordered(keys: list, position: Optional[tuple] = None, descending: bool = False):
+    # Entries of a sorted list after the cursor position, in ascending order or, descending, from the end.
+    if descending:
+        end = len(keys) if position is None else bisect.bisect_left(keys, position)
+        return (keys[i] for i in range(end - 1, -1, -1))
+    start = 0 if position is None else bisect.bisect_right(keys, position)
+    return (keys[i] for i in range(start, len(keys)))
+
+
+def _page(entries, page, cursor_used: bool):
+    offset = 0 if cursor_used else page.offset
+    return itertools.islice(entries, offset, offset + page.limit)
+
+
+def _insert(index: dict, key, entry):
+    bisect.insort(index.setdefault(key, []), entry)
+
+
+def _delete(entries: list, entry):
+    del entries[bisect.bisect_left(entries, entry)]
+
+
+class MemoryStore:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.user_ids = {}
+        self.organizations = set()
+        self.organization_ids = {}
+        self.tenders: Dict[uuid.UUID, Tender] = {}
+        self.tenders_by_name = []
+        self.tenders_by_service_type = {}
+        self.tenders_by_creator = {}
+        self.tenders_by_bid_count = []
+        self.tender_words = {}
+        self.tender_history = {}
+        self.bids: Dict[uuid.UUID, Bid] = {}
+        self.bids_by_tender = {}
+        self.bids_by_author = {}
+        self.bid_history = {}
+        self.reviews: Dict[uuid.UUID, Review] = {}
+        self.reviews_by_bid = {}
+
+    def load(self, rows: dict, columns: dict):
+        # Takes rows per table as tuples of the given columns, like the benchmark dataset has them.
+        def records(table):
+            names = columns[table]
+            return (dict(zip(names, row)) for row in rows.get(table, ()))
+
+        for employee in records('employee'):
+            self.add_user(employee['username'], employee['id'])
+        for organization in records('organization'):
+            self.add_organization(organization['id'])
+        for responsible in records('organization_responsible'):
+            self.organization_ids.setdefault(responsible['user_id'], set()).add(responsible['organization_id'])
+
+        now = datetime.now()
+        for tender in records('tenders'):
+            self.insert_tender(dict(tender, createdAt=tender.get('createdAt', now)))
+        for bid in records('bids'):
+            self.insert_bid(dict(bid, createdAt=bid.get('createdAt', now)))
+        for history in records('tender_history'):
+            values = _values(Tender, history)
+            self.tender_history.setdefault(values['tender_id'], {})[values['version']] = \
+                tuple(values[column] for column in TENDER_HISTORY_COLUMNS)
+        for history in records('bid_history'):
+            values = _values(Bid, history)
+            self.bid_history.setdefault(values['bid_id'], {})[values['version']] = \
+                tuple(values[column] for column in BID_HISTORY_COLUMNS)
+        for review in records('review'):
+            self.add_review(review['content'], review['bid_id'], review['creator_username'], review['id'],
+                            review.get('createdAt', now))
+
+    def add_user(self, username: str, user_id: Optional[uuid.UUID] = None, organization_ids=()) -> uuid.UUID:
+        user_id = user_id or uuid.uuid4()
+        self.user_ids[username] = user_id
+        self.organization_ids.setdefault(user_id, set()).update(organization_ids)
+        return user_id
+
+    def add_organization(self, organization_id: Optional[uuid.UUID] = None) -> uuid.UUID:
+        organization_id = organization_id or uuid.uuid4()
+        self.organizations.add(organization_id)
+        return organization_id
+
+    def add_review(self, content: str, bid_id: uuid.UUID, creator_username: str, review_id=None, created_at=None):
+        review = Review(review_id or uuid.uuid4(), content, bid_id, creator_username, created_at or datetime.now())
+        self.reviews[review.id] = review
+        _insert(self.reviews_by_bid, bid_id, (review.createdAt, review.id))
+        return review
+
+    def membership(self, username: str) -> Optional[Membership]:
+        user_id = self.user_ids.get(username)
+        if user_id is None:
+            return None
+        return Membership(user_id, frozenset(self.organization_ids.get(user_id, ())))
+
+    def _index_tender(self, tender: Tender):
+        entry = (tender.name, tender.id)
+        bisect.insort(self.tenders_by_name, entry)
+        _insert(self.tenders_by_service_type, tender.service_type, entry)
+        _insert(self.tenders_by_creator, tender.creator_username, entry)
+        bisect.insort(self.tenders_by_bid_count, (tender.bid_count, tender.id))
+        for word in set(_words(tender.name) + _words(tender.description)):
+            self.tender_words.setdefault(word, set()).add(tender.id)
+
+    def _unindex_tender(self, tender: Tender):
+        entry = (tender.name, tender.id)
+        _delete(self.tenders_by_name, entry)
+        _delete(self.tenders_by_service_type[tender.service_type], entry)
+        _delete(self.tenders_by_creator[tender.creator_username], entry)
+        _delete(self.tenders_by_bid_count, (tender.bid_count, tender.id))
+        for word in set(_words(tender.name) + _words(tender.description)):
+            self.tender_words[word].discard(tender.id)
+
+    def _replace_tender(self, tender: Tender, **changes) -> Tender:
+        updated = tender._replace(**changes)
+        if changes.keys() - {'status', 'version', 'bid_count'}:
+            self._unindex_tender(tender)
+            self._index_tender(updated)
+        elif updated.bid_count != tender.bid_count:
+            _delete(self.tenders_by_bid_count, (tender.bid_count, tender.id))
+            bisect.insort(self.tenders_by_bid_count, (updated.bid_count, tender.id))
+        self.tenders[tender.id] = updated
+        if updated.status != tender.status or updated.version != tender.version:
+            status_broadcaster.publish('tender', dict(id=str(tender.id), status=updated.status.value,
+                                                      version=updated.version))
+        return updated
+
+    def insert_tender(self, values: dict) -> Tender:
+        values = _values(Tender, values)
+        tender = Tender(**{
+            'id': uuid.uuid4(),
+            'status': models.TenderStatusEnum.CREATED,
+            'version': 1,
+            'createdAt': datetime.now(),
+            **values,
+        })
+        self.tenders[tender.id] = tender
+        self._index_tender(tender)
+        return tender
+
+    def _count_bids(self, tender_id: uuid.UUID, delta: int):
+        tender = self.tenders[tender_id]
+        self._replace_tender(tender, bid_count=tender.bid_count + delta)
+
+    def _replace_bid(self, bid: Bid, **changes) -> Bid:
+        updated = bid._replace(**changes)
+        if updated.name != bid.name:
+            _delete(self.bids_by_tender[bid.tender_id], (bid.name, bid.id))
+            _delete(self.bids_by_author[bid.author_id], (bid.name, bid.id))
+            _insert(self.bids_by_tender, bid.tender_id, (updated.name, bid.id))
+            _insert(self.bids_by_author, bid.author_id, (updated.name, bid.id))
+        self.bids[bid.id] = updated
+        canceled = models.BidStatusEnum.CANCELED
+        if (updated.status == canceled) != (bid.status == canceled):
+            self._count_bids(bid.tender_id, -1 if updated.status == canceled else 1)
+        if updated.status != bid.status or updated.version != bid.version:
+            status_broadcaster.publish('bid', dict(id=str(bid.id), status=updated.status.value,
+                                                   version=updated.version))
+        return updated
+
+    def insert_bid(self, values: dict) -> Bid:
+        values = _values(Bid, values)
+        bid = Bid(**{
+            'id': uuid.uuid4(),
+            'status': models.BidStatusEnum.CREATED,
+            'version': 1,
+            'author_type': models.BidAuthorTypeEnum.USER,
+            'createdAt': datetime.now(),
+            **values,
+        })
+        self.bids[bid.id] = bid
+        _insert(self.bids_by_tender, bid.tender_id, (bid.name, bid.id))
+        _insert(self.bids_by_author, bid.author_id, (bid.name, bid.id))
+        if bid.status != models.BidStatusEnum.CANCELED:
+            self._count_bids(bid.tender_id, 1)
+        return bid
+
+    def _edit(self, records: dict, histories: dict, columns, replace, entity, changes: dict):
+        current = records.get(entity.id)
+        if current is None or current.version != entity.version:
+            raise HTTPException(status_code=409, detail="version conflict, reload and retry")
+        # The columns the database declares NOT NULL, rejected as its constraint would be.
+        missing = [name for name in NOT_NULL_COLUMNS if name in changes and changes[name] is None]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"{', '.join(missing)} must not be null")
+        histories.setdefault(current.id, {})[current.version] = tuple(getattr(current, c) for c in columns)
+        return replace(current, **changes, version=current.version + 1)
+
+    def _rollback(self, records: dict, histories: dict, columns, replace, entity, version: int):
+        # A missing version is reported before a concurrent edit, as the database tells them apart.
+        if version not in histories.get(entity.id, {}):
+            raise HTTPException(status_code=404, detail="version not found")
+        restored = dict(zip(columns, histories[entity.id][version]))
+        del restored['version']
+        return self._edit(records, histories, columns, replace, entity, restored)
+
+    def edit_tender(self, tender, changes: dict) -> Tender:
+        return self._edit(self.tenders, self.tender_history, TENDER_HISTORY_COLUMNS, self._replace_tender,
+                          tender, _values(Tender, changes))
+
+    def rollback_tender(self, tender, version: int) -> Tender:
+        return self._rollback(self.tenders, self.tender_history, TENDER_HISTORY_COLUMNS, self._replace_tender,
+                              tender, version)
+
+    def edit_bid(self, bid, changes: dict) -> Bid:
+        return self._edit(self.bids, self.bid_history, BID_HISTORY_COLUMNS, self._replace_bid,
+                          bid, _values(Bid, changes))
+
+    def rollback_bid(self, bid, version: int) -> Bid:
+        return self._rollback(self.bids, self.bid_history, BID_HISTORY_COLUMNS, self._replace_bid, bid, version)
+
+    def decide(self, bid, decision: str) -> Bid:
+        # Re-read here, like the database does under the tender's lock.
+        bid = self.bids[bid.id]
+        tender = self.tenders[bid.tender_id]
+        if tender.status == models.TenderStatusEnum.CLOSED:
+            raise HTTPException(status_code=409, detail="tender is already closed")
+
+        if decision == 'Rejected':
+            return self._replace_bid(bid, status=models.BidStatusEnum.CANCELED)
+        if bid.status == models.BidStatusEnum.CANCELED:
+            raise HTTPException(status_code=409, detail="bid is canceled")
+        self._replace_tender(tender, status=models.TenderStatusEnum.CLOSED)
+        for _, other_id in list(self.bids_by_tender[tender.id]):
+            other = self.bids[other_id]
+            if other_id != bid.id and other.status != models.BidStatusEnum.CANCELED:
+                self._replace_bid(other, status=models.BidStatusEnum.CANCELED)
+        return bid
+
+    def _created_by(self, username: str):
+        return (self.tenders[tender_id] for _, tender_id in self.tenders_by_creator.get(username, ()))
+
+    def tender_keys(self, page, sort: str, service_types, creator_username: Optional[str]):
+        selected = _service_types(service_types)
+        if sort == 'popularity':
+            position = decode_page_cursor(page.cursor, 'bid_count') if page.cursor else None
+            if creator_username is not None:
+                keys = sorted((tender.bid_count, tender.id) for tender in self._created_by(creator_username))
+                ordered = _ordered(keys, position, descending=True)
+            else:
+                ordered = _ordered(self.tenders_by_bid_count, position, descending=True)
+        else:
+            position = decode_page_cursor(page.cursor, 'name') if page.cursor else None
+            if creator_username is not None:
+                ordered = _ordered(self.tenders_by_creator.get(creator_username, []), position)
+            elif selected is not None:
+                # Like the (service_type, name, id) index: one ordered run per type, merged.
+                ordered = heapq.merge(*(_ordered(self.tenders_by_service_type.get(service_type, []), position)
+                                        for service_type in selected))
+                selected = None
+            else:
+                ordered = _ordered(self.tenders_by_name, position)
+
+        if selected is not None:
+            ordered = (key for key in ordered if self.tenders[key[1]].service_type in selected)
+        return _page(ordered, page, bool(page.cursor))
+
+    def search(self, q: str, page, service_types):
+        # websearch_to_tsquery without the stemming: every word has to occur, -word must not. Ranked by the
+        # weighted number of occurrences of the words.
+        terms = _words(q)
+        included = [term for term in terms if not term.startswith('-') and term != 'or']
+        excluded = [term[1:] for term in terms if term.startswith('-')]
+        if not included:
+            return []
+        ids = set.intersection(*(self.tender_words.get(term, set()) for term in included))
+        for term in excluded:
+            ids -= self.tender_words.get(term, set())
+
+        selected = _service_types(service_types)
+        ranked = []
+        for tender_id in ids:
+            tender = self.tenders[tender_id]
+            if selected is not None and tender.service_type not in selected:
+                continue
+            name, description = _words(tender.name), _words(tender.description)
+            rank = sum(SEARCH_WEIGHTS[0] * name.count(term) + SEARCH_WEIGHTS[1] * description.count(term)
+                       for term in included)
+            ranked.append((rank, tender_id))
+        ranked.sort()
+
+        position = decode_page_cursor(page.cursor, 'rank') if page.cursor else None
+        return [SearchRow(*_tender_row(self.tenders[tender_id]), rank)
+                for rank, tender_id in itertools.islice(_ordered(ranked, position, descending=True), page.limit)]
+
+    def reviews_for(self, tender_id: uuid.UUID, author: Membership, page) -> list:
+        bid_ids = [bid_id for author_id in (author.user_id, *author.organization_ids)
+                   for _, bid_id in self.bids_by_author.get(author_id, ())]
+        if not any(self.bids[bid_id].tender_id == tender_id for bid_id in bid_ids):
+            return []
+        keys = sorted(key for bid_id in bid_ids for key in self.reviews_by_bid.get(bid_id, ()))
+        position = decode_page_cursor(page.cursor, 'createdAt') if page.cursor else None
+        return [ReviewRow(review.id, review.content, review.createdAt)
+                for review in (self.reviews[review_id] for _, review_id in
+                               _page(_ordered(keys, position, descending=True), page, bool(page.cursor)))]
+
+    def facets(self, service_types, creator_username: Optional[str]) -> dict:
+        tenders = self.tenders.values() if creator_username is None else self._created_by(creator_username)
+        selected = _service_types(service_types)
+        facets = dict(service_type={}, status={})
+        for tender in tenders:
+            count = facets['service_type'].setdefault(tender.service_type, dict(tenders=0, bids=0))
+            count['tenders'] += 1
+            count['bids'] += tender.bid_count
+            if selected is None or tender.service_type in selected:
+                count = facets['status'].setdefault(tender.status, dict(tenders=0, bids=0))
+                count['tenders'] += 1
+                count['bids'] += tender.bid_count
+        return facets
+
+
+memory_store = MemoryStore()
+
+
+async def _batches(rows: list):
+    for start in range(0, len(rows), EXPORT_BATCH_SIZE):
+        yield rows[start:start + EXPORT_BATCH_SIZE]
+
+
+class MemoryRepository(Repository):
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    async def membership(self, username):
+        return self.store.membership(username)
+
+    async def memberships(self, usernames):
+        return {username: set(self.store.organization_ids.get(self.store.user_ids[username], ()))
+                for username in usernames if username in self.store.user_ids}
+
+    async def existing_organizations(self, organization_ids):
+        return set(organization_ids) & self.store.organizations
+
+    async def existing_users(self, user_ids):
+        return set(user_ids) & set(self.store.organization_ids)
+
+    async def find_tender(self, username, tender_id, brief=False):
+        return self.store.membership(username), self.store.tenders.get(tender_id)
+
+    def _bid_with_author(self, bid_id):
+        bid = self.store.bids.get(bid_id)
+        if bid is None:
+            return None, set()
+        return bid, self.store.organization_ids.get(bid.author_id, set())
+
+    async def find_bid(self, username, bid_id, brief=False):
+        return (self.store.membership(username), *self._bid_with_author(bid_id))
+
+    async def find_decision(self, username, bid_id):
+        bid = self.store.bids.get(bid_id)
+        return self.store.membership(username), bid, bid and self.store.tenders.get(bid.tender_id)
+
+    async def tenders_by_id(self, tender_ids):
+        return {tender_id: self.store.tenders[tender_id] for tender_id in tender_ids if tender_id in self.store.tenders}
+
+    async def bids_by_id(self, bid_ids):
+        return {bid_id: self._bid_with_author(bid_id) for bid_id in bid_ids if bid_id in self.store.bids}
+
+    async def published_tenders(self, tender_ids):
+        tenders = (self.store.tenders.get(tender_id) for tender_id in tender_ids)
+        return {tender.id: tender.service_type for tender in tenders
+                if tender is not None and tender.status == models.TenderStatusEnum.PUBLISHED}
+
+    async def lock_tender(self, tender_id):
+        return self.store.tenders[tender_id].service_type
+
+    async def tender_page(self, page, sort='name', service_types=None, creator_username=None, versions=False):
+        keys = self.store.tender_keys(page, sort, service_types, creator_username)
+        return [TenderRow._make(_tender_row(self.store.tenders[tender_id])) for _, tender_id in keys]
+
+    async def search_page(self, q, page, service_types=None, versions=False):
+        return self.store.search(q, page, service_types)
+
+    async def bid_page(self, page, tender_id=None, author_id=None, versions=False):
+        position = decode_page_cursor(page.cursor, 'name') if page.cursor else None
+        if tender_id is not None:
+            ordered = _ordered(self.store.bids_by_tender.get(tender_id, []), position)
+            if author_id is not None:
+                ordered = (key for key in ordered if self.store.bids[key[1]].author_id == author_id)
+        else:
+            ordered = _ordered(self.store.bids_by_author.get(author_id, []), position)
+        keys = _page(ordered, page, bool(page.cursor))
+        return [BidRow._make(_bid_row(self.store.bids[bid_id])) for _, bid_id in keys]
+
+    async def review_page(self, tender_id, author, page):
+        return self.store.reviews_for(tender_id, author, page)
+
+    async def tender_facets(self, service_types=None, creator_username=None):
+        return self.store.facets(service_types, creator_username)
+
+    def export_tenders(self, service_types=None):
+        selected = _service_types(service_types)
+        tenders = (self.store.tenders[tender_id] for _, tender_id in self.store.tenders_by_name)
+        return _batches([TenderRow._make(_tender_row(tender)) for tender in tenders
+                         if selected is None or tender.service_type in selected])
+
+    def export_bids(self, tender_id):
+        return _batches([BidRow._make(_bid_row(self.store.bids[bid_id]))
+                         for _, bid_id in self.store.bids_by_tender.get(tender_id, ())])
+
+    async def create_tender(self, values):
+        return self.store.insert_tender(values)
+
+    async def create_tenders(self, rows):
+        return [self.store.insert_tender(values) for values in rows]
+
+    async def create_bid(self, values):
+        return self.store.insert_bid(values)
+
+    async def create_bids(self, rows):
+        return [self.store.insert_bid(values) for values in rows]
+
+    async def set_tender_status(self, tender, status):
+        return self.store._replace_tender(self.store.tenders[tender.id], status=_enum(models.TenderStatusEnum, status))
+
+    async def edit_tender(self, tender, changes):
+        return self.store.edit_tender(tender, changes)
+
+    async def rollback_tender(self, tender, version):
+        return self.store.rollback_tender(tender, version)
+
+    async def set_bid_status(self, bid, status):
+        return self.store._replace_bid(self.store.bids[bid.id], status=_enum(models.BidStatusEnum, status))
+
+    async def edit_bid(self, bid, changes):
+        return self.store.edit_bid(bid, changes)
+
+    async def rollback_bid(self, bid, version):
+        return self.store.rollback_bid(bid, version)
+
+    async def decide(self, bid, tender, decision):
+        return self.store.decide(bid, decision)
+
@@ -0,0 +1,176 @@
+import bisect
+import contextvars
+import logging
+import os
+import time
+
+# Log a warning for every request that runs more statements than this; 0 turns it off.
+DB_QUERY_COUNT_WARNING = int(os.getenv('DB_QUERY_COUNT_WARNING', 0))
+
+logger = logging.getLogger('database.metrics')
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 8, 13, 21, 34, 55)
+STREAM_BUCKETS = (1, 10, 60, 300, 900, 1800, 3600, 3 * 3600, 12 * 3600)
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'db_time', 'pool_wait')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.pool_wait = 0.0
+
+
+# Set for the duration of each HTTP request by MetricsMiddleware; engine and pool hooks add to it.
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+def record_query_started():
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.queries += 1
+
+
+def record_query(duration: float):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.db_time += duration
+
+
+def record_pool_wait(duration: float):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.pool_wait += duration
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels: tuple, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self, label_names):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, (counts, total) in sorted(self._series.items()):
+            base = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}'
+            cumulative += counts[-1]
+            yield f'{self.name}_bucket{{{base},le="+Inf"}} {cumulative}'
+            yield f'{self.name}_sum{{{base}}} {total}'
+            yield f'{self.name}_count{{{base}}} {cumulative}'
+
+
+class Counter:
+    def __init__(self, name: str, help: str, label_names):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self._values = {}
+
+    def inc(self, labels: tuple, value: int = 1):
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in sorted(self._values.items()):
+            base = ','.join(f'{name}="{_escape(label)}"' for name, label in zip(self.label_names, labels))
+            yield f'{self.name}{{{base}}} {value}'
+
+
+COUNTERS = []
+
+
+def counter(name: str, help: str, label_names) -> Counter:
+    # Counters registered here are included in render().
+    instance = Counter(name, help, label_names)
+    COUNTERS.append(instance)
+    return instance
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+LABELS = ('method', 'route')
+
+request_duration = Histogram('http_request_duration_seconds', 'Total request latency.', LATENCY_BUCKETS)
+request_queries = Histogram('db_queries_per_request', 'SQL statements executed per request.', QUERY_COUNT_BUCKETS)
+request_db_time = Histogram('db_time_seconds', 'Time per request spent executing SQL statements.', LATENCY_BUCKETS)
+request_pool_wait = Histogram('db_pool_wait_seconds', 'Time per request spent checking connections out of the pool.',
+                              LATENCY_BUCKETS)
+# Event streams stay open for as long as the client watches, so their lifetimes are kept out of the latency.
+stream_duration = Histogram('http_stream_duration_seconds', 'Time event streams stayed open.', STREAM_BUCKETS)
+HISTOGRAMS = (request_duration, stream_duration, request_queries, request_db_time, request_pool_wait)
+responses = counter('http_responses_total', 'Responses by route and status code.', ('method', 'route', 'status'))
+
+
+def observe(method: str, route: str, status_code: int, duration: float, metrics: RequestMetrics,
+            stream: bool = False):
+    labels = (method, route)
+    (stream_duration if stream else request_duration).observe(labels, duration)
+    request_queries.observe(labels, metrics.queries)
+    request_db_time.observe(labels, metrics.db_time)
+    request_pool_wait.observe(labels, metrics.pool_wait)
+    responses.inc((method, route, str(status_code)))
+
+    if DB_QUERY_COUNT_WARNING and metrics.queries > DB_QUERY_COUNT_WARNING:
+        logger.warning('%s %s ran %d queries (%.1fms in the database)', method, route, metrics.queries,
+                       metrics.db_time * 1000)
+
+
+def render() -> str:
+    lines = []
+    for instance in COUNTERS:
+        lines.extend(instance.render())
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render(LABELS))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    # Plain ASGI rather than BaseHTTPMiddleware: the handler has to run in this task's context
+    # for the engine hooks to find the request's RequestMetrics.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        status_code = 500
+        stream = False
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code, stream
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                stream = any(name == b'content-type' and value.startswith(b'text/event-stream')
+                             for name, value in message.get('headers', ()))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - started
+            _current.reset(token)
+            # The router stores the matched route in the scope; templates keep the label set bounded.
+            route = getattr(scope.get('route'), 'path', None) or 'unmatched'
+            observe(scope['method'], route, status_code, duration, metrics, stream)
@@ -0,0 +1,48 @@
+import importlib
+import pkgutil
+import re
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Arbitrary application-wide key: concurrent runners wait for each other instead of racing on DDL.
+MIGRATION_LOCK_ID = 7_262_024
+
+
+def load_migrations():
+    migrations = []
+    for module in pkgutil.iter_modules(__path__):
+        match = re.fullmatch(r'v(\d+)_(\w+)', module.name)
+        if match:
+            migrations.append((int(match[1]), match[2], importlib.import_module(f'{__name__}.{module.name}')))
+    return sorted(migrations, key=lambda migration: migration[0])
+
+
+async def upgrade(engine: AsyncEngine):
+    applied_now = []
+    async with engine.connect() as conn:
+        await conn.execute(text('SELECT pg_advisory_lock(:id)'), {'id': MIGRATION_LOCK_ID})
+        await conn.commit()
+        try:
+            await conn.execute(text(
+                'CREATE TABLE IF NOT EXISTS schema_migrations ('
+                'version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at TIMESTAMP DEFAULT now())'
+            ))
+            result = await conn.execute(text('SELECT version FROM schema_migrations'))
+            applied = set(result.scalars())
+            await conn.commit()
+
+            for version, name, module in load_migrations():
+                if version in applied:
+                    continue
+                for statement in module.STATEMENTS:
+                    await conn.exec_driver_sql(statement)
+                await conn.execute(text('INSERT INTO schema_migrations (version, name) VALUES (:version, :name)'),
+                                   {'version': version, 'name': name})
+                await conn.commit()
+                applied_now.append((version, name))
+        finally:
+            await conn.rollback()
+            await conn.execute(text('SELECT pg_advisory_unlock(:id)'), {'id': MIGRATION_LOCK_ID})
+            await conn.commit()
+    return applied_now
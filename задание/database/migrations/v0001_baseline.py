@@ -0,0 +1,142 @@
+# Schema as previously created by Base.metadata.create_all on startup.
+# Every statement is idempotent so databases bootstrapped that way adopt it unchanged.
+
+STATEMENTS = (
+    """
+    DO $$ BEGIN
+        CREATE TYPE organizationtypeenum AS ENUM ('IE', 'LLC', 'JSC');
+    EXCEPTION WHEN duplicate_object THEN NULL;
+    END $$
+    """,
+    """
+    DO $$ BEGIN
+        CREATE TYPE tenderstatusenum AS ENUM ('CREATED', 'PUBLISHED', 'CLOSED');
+    EXCEPTION WHEN duplicate_object THEN NULL;
+    END $$
+    """,
+    """
+    DO $$ BEGIN
+        CREATE TYPE tenderservicetypeenum AS ENUM ('CONSTRUCTION', 'DELIVERY', 'MANUFACTURE');
+    EXCEPTION WHEN duplicate_object THEN NULL;
+    END $$
+    """,
+    """
+    DO $$ BEGIN
+        CREATE TYPE bidstatusenum AS ENUM ('CREATED', 'PUBLISHED', 'CANCELED');
+    EXCEPTION WHEN duplicate_object THEN NULL;
+    END $$
+    """,
+    """
+    DO $$ BEGIN
+        CREATE TYPE bidauthortypeenum AS ENUM ('ORGANIZATION', 'USER');
+    EXCEPTION WHEN duplicate_object THEN NULL;
+    END $$
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS employee (
+        id UUID NOT NULL,
+        username VARCHAR(50) NOT NULL,
+        first_name VARCHAR(50),
+        last_name VARCHAR(50),
+        created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+        updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+        PRIMARY KEY (id),
+        UNIQUE (username)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS organization (
+        id UUID NOT NULL,
+        name VARCHAR(100) NOT NULL,
+        description TEXT,
+        type organizationtypeenum NOT NULL,
+        created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+        updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+        PRIMARY KEY (id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS organization_responsible (
+        id UUID NOT NULL,
+        organization_id UUID,
+        user_id UUID,
+        PRIMARY KEY (id),
+        FOREIGN KEY (organization_id) REFERENCES organization (id) ON DELETE CASCADE,
+        FOREIGN KEY (user_id) REFERENCES employee (id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS tenders (
+        id UUID NOT NULL,
+        name VARCHAR NOT NULL,
+        description TEXT,
+        service_type tenderservicetypeenum NOT NULL,
+        status tenderstatusenum NOT NULL,
+        version INTEGER NOT NULL,
+        organization_id UUID,
+        creator_username VARCHAR(50),
+        "createdAt" TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+        PRIMARY KEY (id),
+        FOREIGN KEY (organization_id) REFERENCES organization (id) ON DELETE CASCADE,
+        FOREIGN KEY (creator_username) REFERENCES employee (username) ON DELETE CASCADE
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_tenders_name ON tenders (name)",
+    """
+    CREATE TABLE IF NOT EXISTS bids (
+        id UUID NOT NULL,
+        name VARCHAR,
+        description TEXT,
+        status bidstatusenum NOT NULL,
+        version INTEGER NOT NULL,
+        tender_id UUID,
+        author_type bidauthortypeenum NOT NULL,
+        author_id UUID,
+        "createdAt" TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+        PRIMARY KEY (id),
+        FOREIGN KEY (tender_id) REFERENCES tenders (id) ON DELETE CASCADE
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_bids_name ON bids (name)",
+    """
+    CREATE TABLE IF NOT EXISTS tender_history (
+        id UUID NOT NULL,
+        tender_id UUID NOT NULL,
+        name VARCHAR NOT NULL,
+        description TEXT,
+        service_type tenderservicetypeenum NOT NULL,
+        status tenderstatusenum NOT NULL,
+        version INTEGER NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY (tender_id) REFERENCES tenders (id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_tender_history_name ON tender_history (name)",
+    "CREATE INDEX IF NOT EXISTS ix_tender_history_version ON tender_history (version)",
+    """
+    CREATE TABLE IF NOT EXISTS bid_history (
+        id UUID NOT NULL,
+        bid_id UUID NOT NULL,
+        name VARCHAR NOT NULL,
+        description TEXT,
+        status bidstatusenum NOT NULL,
+        version INTEGER NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY (bid_id) REFERENCES bids (id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_bid_history_name ON bid_history (name)",
+    "CREATE INDEX IF NOT EXISTS ix_bid_history_version ON bid_history (version)",
+    """
+    CREATE TABLE IF NOT EXISTS review (
+        id UUID NOT NULL,
+        content TEXT NOT NULL,
+        "createdAt" TIMESTAMP WITHOUT TIME ZONE DEFAULT now() NOT NULL,
+        bid_id UUID NOT NULL,
+        creator_username VARCHAR(50),
+        PRIMARY KEY (id),
+        FOREIGN KEY (bid_id) REFERENCES bids (id) ON DELETE CASCADE,
+        FOREIGN KEY (creator_username) REFERENCES employee (username) ON DELETE CASCADE
+    )
+    """,
+)
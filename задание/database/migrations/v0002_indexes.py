@@ -0,0 +1,43 @@
+# Indexes for the authorization, listing and history lookups.
+
+STATEMENTS = (
+    # Keyset pagination: every list endpoint is a range scan over (filter, name, id).
+    "CREATE INDEX IF NOT EXISTS ix_tenders_name_id ON tenders (name, id)",
+    "CREATE INDEX IF NOT EXISTS ix_tenders_service_type_name_id ON tenders (service_type, name, id)",
+    "CREATE INDEX IF NOT EXISTS ix_tenders_creator_username_name_id ON tenders (creator_username, name, id)",
+    "CREATE INDEX IF NOT EXISTS ix_bids_tender_id_name_id ON bids (tender_id, name, id)",
+    "CREATE INDEX IF NOT EXISTS ix_bids_author_id_name_id ON bids (author_id, name, id)",
+    "DROP INDEX IF EXISTS ix_tenders_name",
+    "DROP INDEX IF EXISTS ix_bids_name",
+
+    # Membership lookups by user, and at most one row per (user, organization).
+    """
+    DELETE FROM organization_responsible a
+    USING organization_responsible b
+    WHERE a.user_id = b.user_id AND a.organization_id = b.organization_id AND a.id > b.id
+    """,
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS uq_organization_responsible_user_id_organization_id
+    ON organization_responsible (user_id, organization_id)
+    """,
+
+    "CREATE INDEX IF NOT EXISTS ix_review_bid_id ON review (bid_id)",
+
+    # Rollback looks history up by (entity, version); a version may only be recorded once.
+    """
+    DELETE FROM tender_history a
+    USING tender_history b
+    WHERE a.tender_id = b.tender_id AND a.version = b.version AND a.id > b.id
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_tender_history_tender_id_version ON tender_history (tender_id, version)",
+    "DROP INDEX IF EXISTS ix_tender_history_name",
+    "DROP INDEX IF EXISTS ix_tender_history_version",
+    """
+    DELETE FROM bid_history a
+    USING bid_history b
+    WHERE a.bid_id = b.bid_id AND a.version = b.version AND a.id > b.id
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_bid_history_bid_id_version ON bid_history (bid_id, version)",
+    "DROP INDEX IF EXISTS ix_bid_history_name",
+    "DROP INDEX IF EXISTS ix_bid_history_version",
+)
@@ -0,0 +1,12 @@
+# Full-text search over tender names and descriptions.
+
+STATEMENTS = (
+    # Names weigh more than descriptions in the ranking. Adding a stored generated column rewrites the table.
+    """
+    ALTER TABLE tenders ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_tenders_search_vector ON tenders USING gin (search_vector)",
+)
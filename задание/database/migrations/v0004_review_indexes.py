@@ -0,0 +1,7 @@
+# Reviews of a bid newest first, and by reviewer (also used by the ON DELETE CASCADE from employee).
+
+STATEMENTS = (
+    'CREATE INDEX IF NOT EXISTS ix_review_bid_id_created_at ON review (bid_id, "createdAt")',
+    'CREATE INDEX IF NOT EXISTS ix_review_creator_username_created_at ON review (creator_username, "createdAt")',
+    "DROP INDEX IF EXISTS ix_review_bid_id",
+)
@@ -0,0 +1,26 @@
+# Status and version changes of tenders and bids are published on the status_changes channel;
+# NOTIFY is transactional, so listeners only hear about committed changes.
+
+STATEMENTS = (
+    """
+    CREATE OR REPLACE FUNCTION notify_status_change() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('status_changes', json_build_object(
+            'kind', TG_ARGV[0], 'id', NEW.id, 'status', NEW.status, 'version', NEW.version)::text);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS tenders_status_notify ON tenders",
+    """
+    CREATE TRIGGER tenders_status_notify AFTER UPDATE OF status, version ON tenders FOR EACH ROW
+    WHEN (OLD.status IS DISTINCT FROM NEW.status OR OLD.version IS DISTINCT FROM NEW.version)
+    EXECUTE FUNCTION notify_status_change('tender')
+    """,
+    "DROP TRIGGER IF EXISTS bids_status_notify ON bids",
+    """
+    CREATE TRIGGER bids_status_notify AFTER UPDATE OF status, version ON bids FOR EACH ROW
+    WHEN (OLD.status IS DISTINCT FROM NEW.status OR OLD.version IS DISTINCT FROM NEW.version)
+    EXECUTE FUNCTION notify_status_change('bid')
+    """,
+)
@@ -0,0 +1,30 @@
+# Cold storage for old versions, filled by the history compaction job.
+
+STATEMENTS = (
+    """
+    CREATE TABLE IF NOT EXISTS tender_history_archive (
+        id UUID PRIMARY KEY,
+        tender_id UUID NOT NULL REFERENCES tenders (id),
+        name VARCHAR NOT NULL,
+        description TEXT,
+        service_type tenderservicetypeenum NOT NULL,
+        status tenderstatusenum NOT NULL,
+        version INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS uq_tender_history_archive_tender_id_version
+    ON tender_history_archive (tender_id, version)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS bid_history_archive (
+        id UUID PRIMARY KEY,
+        bid_id UUID NOT NULL REFERENCES bids (id),
+        name VARCHAR NOT NULL,
+        description TEXT,
+        status bidstatusenum NOT NULL,
+        version INTEGER NOT NULL
+    )
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_bid_history_archive_bid_id_version ON bid_history_archive (bid_id, version)",
+)
@@ -0,0 +1,57 @@
+# Number of bids of a tender that are not canceled, kept on the tender row for listings and popularity sort.
+# Statement-level triggers apply the changes of a whole statement at once, so a bulk insert or the
+# cancellation of all competing bids on a decision updates each tender once, in the same transaction.
+
+STATEMENTS = (
+    "ALTER TABLE tenders ADD COLUMN IF NOT EXISTS bid_count integer NOT NULL DEFAULT 0",
+    """
+    CREATE OR REPLACE FUNCTION count_bids() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            UPDATE tenders t SET bid_count = t.bid_count + c.delta
+            FROM (SELECT tender_id, count(*) AS delta FROM new_bids WHERE status <> 'CANCELED' GROUP BY tender_id) c
+            WHERE t.id = c.tender_id;
+        ELSIF TG_OP = 'UPDATE' THEN
+            UPDATE tenders t SET bid_count = t.bid_count + c.delta
+            FROM (
+                SELECT n.tender_id, sum((n.status <> 'CANCELED')::int - (o.status <> 'CANCELED')::int) AS delta
+                FROM new_bids n JOIN old_bids o ON o.id = n.id
+                WHERE n.status IS DISTINCT FROM o.status
+                GROUP BY n.tender_id
+            ) c
+            WHERE t.id = c.tender_id AND c.delta <> 0;
+        ELSE
+            UPDATE tenders t SET bid_count = t.bid_count - c.delta
+            FROM (SELECT tender_id, count(*) AS delta FROM old_bids WHERE status <> 'CANCELED' GROUP BY tender_id) c
+            WHERE t.id = c.tender_id;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS bids_count_insert ON bids",
+    """
+    CREATE TRIGGER bids_count_insert AFTER INSERT ON bids REFERENCING NEW TABLE AS new_bids
+    FOR EACH STATEMENT EXECUTE FUNCTION count_bids()
+    """,
+    # Transition tables cannot be combined with a column list, edits of other columns find no status change.
+    "DROP TRIGGER IF EXISTS bids_count_update ON bids",
+    """
+    CREATE TRIGGER bids_count_update AFTER UPDATE ON bids REFERENCING OLD TABLE AS old_bids NEW TABLE AS new_bids
+    FOR EACH STATEMENT EXECUTE FUNCTION count_bids()
+    """,
+    "DROP TRIGGER IF EXISTS bids_count_delete ON bids",
+    """
+    CREATE TRIGGER bids_count_delete AFTER DELETE ON bids REFERENCING OLD TABLE AS old_bids
+    FOR EACH STATEMENT EXECUTE FUNCTION count_bids()
+    """,
+    # Counted once the triggers are in place: creating them locks bids against writes until the migration commits.
+    """
+    UPDATE tenders t SET bid_count = c.bid_count
+    FROM (SELECT tender_id, count(*) AS bid_count FROM bids WHERE status <> 'CANCELED' GROUP BY tender_id) c
+    WHERE t.id = c.tender_id AND t.bid_count <> c.bid_count
+    """,
+    # Every change of the counter now updates this index too, which rules out HOT updates for it; only the
+    # catalog sort needs it, the tenders of one creator are few enough to sort.
+    "CREATE INDEX IF NOT EXISTS ix_tenders_bid_count_id ON tenders (bid_count, id)",
+)
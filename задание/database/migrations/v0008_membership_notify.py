@@ -0,0 +1,26 @@
+# Changes of employees and of who is responsible for which organization are announced on the
+# membership_changes channel, whoever makes them. NOTIFY is delivered on commit, so the workers drop
+# their cached memberships only once the change is visible on the primary; a read replica may not have
+# replayed it yet, which is why cache misses are always filled from the primary.
+
+STATEMENTS = (
+    """
+    CREATE OR REPLACE FUNCTION notify_membership_change() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('membership_changes', TG_TABLE_NAME);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS employee_membership_notify ON employee",
+    """
+    CREATE TRIGGER employee_membership_notify AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON employee
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_membership_change()
+    """,
+    "DROP TRIGGER IF EXISTS organization_responsible_membership_notify ON organization_responsible",
+    """
+    CREATE TRIGGER organization_responsible_membership_notify
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON organization_responsible
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_membership_change()
+    """,
+)
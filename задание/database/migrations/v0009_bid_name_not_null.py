@@ -0,0 +1,7 @@
+# Bids are paged by (name, id) and the cursor carries the last name; a NULL name would end the page walk there,
+# since the row comparison with NULL is never true. The API always sets a name, earlier rows may lack one.
+
+STATEMENTS = (
+    "UPDATE bids SET name = '' WHERE name IS NULL",
+    "ALTER TABLE bids ALTER COLUMN name SET NOT NULL",
+)
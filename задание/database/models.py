@@ -1,7 +1,7 @@
 from .engine import Base
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, Enum, TIMESTAMP, func
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Computed, Integer, String, Text, ForeignKey, Enum, Index, TIMESTAMP, func
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID
+from sqlalchemy.orm import deferred, relationship
 import enum
 import uuid
 
@@ -35,6 +35,10 @@ class BidAuthorTypeEnum(enum.Enum):
     USER = "User"
 
 
+# The russian configuration stems latin words with the english stemmer, so it suits mixed catalogs.
+TENDER_SEARCH_CONFIG = 'russian'
+
+
 class User(Base):
     __tablename__ = "employee"
 
@@ -47,7 +51,6 @@ class User(Base):
 
     responsibilities = relationship("OrganizationResponsible", back_populates="user", cascade="all, delete")
     reviews = relationship("Review", back_populates="creator", cascade="all, delete-orphan")
-    bids = relationship("Bid", back_populates="creator")
 
 
 class Organization(Base):
@@ -65,6 +68,9 @@ class Organization(Base):
 
 class OrganizationResponsible(Base):
     __tablename__ = "organization_responsible"
+    __table_args__ = (
+        Index("uq_organization_responsible_user_id_organization_id", "user_id", "organization_id", unique=True),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     organization_id = Column(UUID(as_uuid=True), ForeignKey("organization.id", ondelete="CASCADE"))
@@ -76,9 +82,16 @@ class OrganizationResponsible(Base):
 
 class Tender(Base):
     __tablename__ = "tenders"
+    __table_args__ = (
+        Index("ix_tenders_name_id", "name", "id"),
+        Index("ix_tenders_service_type_name_id", "service_type", "name", "id"),
+        Index("ix_tenders_creator_username_name_id", "creator_username", "name", "id"),
+        Index("ix_tenders_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_tenders_bid_count_id", "bid_count", "id"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    name = Column(String, index=True, nullable=False)
+    name = Column(String, nullable=False)
     description = Column(Text)
     service_type = Column(Enum(TenderServiceTypeEnum), nullable=False)
     status = Column(Enum(TenderStatusEnum), nullable=False, default=TenderStatusEnum.CREATED)
@@ -86,6 +99,13 @@ class Tender(Base):
     organization_id = Column(UUID(as_uuid=True), ForeignKey('organization.id', ondelete='CASCADE'))
     creator_username = Column(String(50), ForeignKey('employee.username', ondelete='CASCADE'))
     createdAt = Column(TIMESTAMP, server_default=func.now())
+    # Bids that are not canceled, maintained by the triggers of migration 0007.
+    bid_count = Column(Integer, nullable=False, server_default='0')
+    search_vector = deferred(Column(TSVECTOR, Computed(
+        f"setweight(to_tsvector('{TENDER_SEARCH_CONFIG}', coalesce(name, '')), 'A') || "
+        f"setweight(to_tsvector('{TENDER_SEARCH_CONFIG}', coalesce(description, '')), 'B')",
+        persisted=True,
+    )))
 
     bids = relationship("Bid", back_populates="tender", cascade="all, delete-orphan")
     history = relationship("TenderHistory", back_populates="tender")
@@ -93,23 +113,46 @@ class Tender(Base):
 
 class TenderHistory(Base):
     __tablename__ = "tender_history"
+    __table_args__ = (
+        Index("uq_tender_history_tender_id_version", "tender_id", "version", unique=True),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     tender_id = Column(UUID(as_uuid=True), ForeignKey("tenders.id"), nullable=False)
-    name = Column(String, index=True, nullable=False)
+    name = Column(String, nullable=False)
     description = Column(Text)
     service_type = Column(Enum(TenderServiceTypeEnum), nullable=False)
     status = Column(Enum(TenderStatusEnum), nullable=False)
-    version = Column(Integer, nullable=False, index=True)
+    version = Column(Integer, nullable=False)
 
     tender = relationship("Tender", back_populates="history")
 
 
+# Versions moved out of tender_history by the compaction job; still read by rollbacks.
+class TenderHistoryArchive(Base):
+    __tablename__ = "tender_history_archive"
+    __table_args__ = (
+        Index("uq_tender_history_archive_tender_id_version", "tender_id", "version", unique=True),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    tender_id = Column(UUID(as_uuid=True), ForeignKey("tenders.id"), nullable=False)
+    name = Column(String, nullable=False)
+    description = Column(Text)
+    service_type = Column(Enum(TenderServiceTypeEnum), nullable=False)
+    status = Column(Enum(TenderStatusEnum), nullable=False)
+    version = Column(Integer, nullable=False)
+
+
 class Bid(Base):
     __tablename__ = "bids"
+    __table_args__ = (
+        Index("ix_bids_tender_id_name_id", "tender_id", "name", "id"),
+        Index("ix_bids_author_id_name_id", "author_id", "name", "id"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    name = Column(String, index=True)
+    name = Column(String, nullable=False)
     description = Column(Text)
     status = Column(Enum(BidStatusEnum), nullable=False, default=BidStatusEnum.CREATED)
     version = Column(Integer, nullable=False, default=1)
@@ -125,19 +168,40 @@ class Bid(Base):
 
 class BidHistory(Base):
     __tablename__ = "bid_history"
+    __table_args__ = (
+        Index("uq_bid_history_bid_id_version", "bid_id", "version", unique=True),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     bid_id = Column(UUID(as_uuid=True), ForeignKey("bids.id"), nullable=False)
-    name = Column(String, index=True, nullable=False)
+    name = Column(String, nullable=False)
     description = Column(Text)
     status = Column(Enum(BidStatusEnum), nullable=False)
-    version = Column(Integer, nullable=False, index=True)
+    version = Column(Integer, nullable=False)
 
     bid = relationship("Bid", back_populates="history")
 
 
+class BidHistoryArchive(Base):
+    __tablename__ = "bid_history_archive"
+    __table_args__ = (
+        Index("uq_bid_history_archive_bid_id_version", "bid_id", "version", unique=True),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    bid_id = Column(UUID(as_uuid=True), ForeignKey("bids.id"), nullable=False)
+    name = Column(String, nullable=False)
+    description = Column(Text)
+    status = Column(Enum(BidStatusEnum), nullable=False)
+    version = Column(Integer, nullable=False)
+
+
 class Review(Base):
     __tablename__ = 'review'
+    __table_args__ = (
+        Index("ix_review_bid_id_created_at", "bid_id", "createdAt"),
+        Index("ix_review_creator_username_created_at", "creator_username", "createdAt"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     content = Column(Text, nullable=False)
@@ -0,0 +1,91 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+def encode_cursor(key, id: UUID) -> str:
+    payload = json.dumps([key, str(id)], separators=(',', ':'), default=str).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key, id = json.loads(payload)
+        return key, UUID(id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+
+def _of_type(*types):
+    def check(value):
+        if not isinstance(value, types):
+            raise TypeError(value)
+        return value
+    return check
+
+
+# Parses the value a cursor carries for the column it was taken from.
+CURSOR_VALUES = {
+    'name': _of_type(str),
+    'rank': _of_type(int, float),
+    'bid_count': _of_type(int),
+    'createdAt': datetime.fromisoformat,
+}
+
+
+def decode_page_cursor(cursor: str, key: str):
+    value, id = decode_cursor(cursor)
+    try:
+        return CURSOR_VALUES[key](value), id
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+
+def paginate(query, model, limit: int, offset: int, cursor: Optional[str] = None):
+    query = query.order_by(model.name, model.id).limit(limit)
+    if cursor:
+        name, id = decode_page_cursor(cursor, 'name')
+        return query.where(tuple_(model.name, model.id) > tuple_(name, id))
+    return query.offset(offset)
+
+
+def paginate_by_rank(query, rank, model, limit: int, cursor: Optional[str] = None):
+    # Best matches first; the cursor carries the last (rank, id) seen.
+    query = query.order_by(rank.desc(), model.id.desc()).limit(limit)
+    if cursor:
+        value, id = decode_page_cursor(cursor, 'rank')
+        return query.where(tuple_(rank, model.id) < tuple_(value, id))
+    return query
+
+
+def paginate_by_popularity(query, model, limit: int, offset: int, cursor: Optional[str] = None):
+    # Most bids first; the cursor carries the last (bid_count, id) seen.
+    query = query.order_by(model.bid_count.desc(), model.id.desc()).limit(limit)
+    if cursor:
+        value, id = decode_page_cursor(cursor, 'bid_count')
+        return query.where(tuple_(model.bid_count, model.id) < tuple_(value, id))
+    return query.offset(offset)
+
+
+def paginate_by_recency(query, model, limit: int, offset: int, cursor: Optional[str] = None):
+    # Newest first; the cursor carries the last (createdAt, id) seen.
+    query = query.order_by(model.createdAt.desc(), model.id.desc()).limit(limit)
+    if cursor:
+        created_at, id = decode_page_cursor(cursor, 'createdAt')
+        return query.where(tuple_(model.createdAt, model.id) < tuple_(created_at, id))
+    return query.offset(offset)
+
+
+def set_next_cursor(response: Response, items, limit: int, key: str = 'name'):
+    if limit and len(items) == limit:
+        last = items[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(getattr(last, key), last.id)
@@ -0,0 +1,137 @@
+import json
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+import database.models as models
+from database.cache import Membership
+from database.engine import get_engine
+from database.pagination import encode_cursor
+from database.repository import Page, SqlRepository
+
+SEQ_SCAN_MIN_ROWS = 10000
+
+
+class _NoRows:
+    def all(self):
+        return []
+
+    def first(self):
+        return None
+
+    def scalars(self):
+        return self
+
+    def __iter__(self):
+        return iter(())
+
+    def scalar_one_or_none(self):
+        return None
+
+    scalar_one = scalar = scalar_one_or_none
+
+
+class _RecordingSession:
+    # Stands in for the session of a SqlRepository and keeps the statements it is given instead of running
+    # them, so the check explains exactly what the repository sends. Bound like a primary session, so
+    # membership lookups take the joined form they have there.
+    def __init__(self):
+        self.bind = get_engine()
+        self.statements = []
+
+    async def execute(self, statement, parameters=None):
+        self.statements.append(statement)
+        return _NoRows()
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+
+async def representative_queries():
+    # The statements of the requests, recorded from the repository with arguments matching nothing. Left out
+    # are writes that insert or update a row by its key, the facets of the whole catalog, which count every
+    # tender, and history compaction: each of its batches reads a range of the history in entity order, for
+    # which a sequential scan is the right plan until the table is large.
+    session = _RecordingSession()
+    repo = SqlRepository(session)
+    some_id = uuid.uuid4()
+    # Never cached, so every authorization lookup is the joined one a cache miss runs.
+    username = f'plans-{some_id}'
+    service_types = [models.TenderServiceTypeEnum.CONSTRUCTION]
+    author = Membership(some_id, frozenset([uuid.uuid4()]))
+    tender = SimpleNamespace(id=some_id, version=2, status=models.TenderStatusEnum.PUBLISHED)
+    bid = SimpleNamespace(id=some_id, version=2, status=models.BidStatusEnum.PUBLISHED)
+    by_name = Page(5, 0, encode_cursor('m', some_id))
+    calls = {
+        'membership': lambda: repo.membership(username),
+        'memberships': lambda: repo.memberships([username]),
+        'existing organizations': lambda: repo.existing_organizations([some_id]),
+        'existing users': lambda: repo.existing_users([some_id]),
+        'find tender': lambda: repo.find_tender(username, some_id),
+        'find bid': lambda: repo.find_bid(username, some_id, brief=True),
+        'find decision': lambda: repo.find_decision(username, some_id),
+        'tenders by id': lambda: repo.tenders_by_id([some_id]),
+        'bids by id': lambda: repo.bids_by_id([some_id]),
+        'published tenders': lambda: repo.published_tenders([some_id]),
+        'lock tender': lambda: repo.lock_tender(some_id),
+        'tenders': lambda: repo.tender_page(by_name),
+        'tenders by service type': lambda: repo.tender_page(by_name, service_types=service_types),
+        'tenders by popularity': lambda: repo.tender_page(Page(5, 0, encode_cursor(3, some_id)), 'popularity'),
+        'my tenders': lambda: repo.tender_page(by_name, creator_username=username),
+        'tender search': lambda: repo.search_page('word', Page(5, 0, encode_cursor(0.5, some_id))),
+        'my tender facets': lambda: repo.tender_facets(creator_username=username),
+        'bids by tender': lambda: repo.bid_page(by_name, tender_id=some_id),
+        'my bids': lambda: repo.bid_page(by_name, author_id=some_id),
+        'reviews by author': lambda: repo.review_page(
+            some_id, author, Page(5, 0, encode_cursor(datetime(2024, 1, 1), some_id))),
+        'tender edit': lambda: repo.edit_tender(tender, {'name': 'name'}),
+        'tender rollback': lambda: repo.rollback_tender(tender, 1),
+        'bid edit': lambda: repo.edit_bid(bid, {'name': 'name'}),
+        'bid rollback': lambda: repo.rollback_bid(bid, 1),
+        'decision': lambda: repo.decide(bid, tender, 'Approved'),
+    }
+
+    queries = {}
+    for name, call in calls.items():
+        recorded = len(session.statements)
+        try:
+            await call()
+        except HTTPException:
+            # Nothing matched, as intended; the statements up to there are recorded.
+            pass
+        for index, statement in enumerate(session.statements[recorded:]):
+            queries[name if index == 0 else f'{name} #{index + 1}'] = statement
+    return queries
+
+
+def _seq_scans(plan):
+    if plan.get('Node Type') == 'Seq Scan':
+        yield plan['Relation Name']
+    for child in plan.get('Plans', ()):
+        yield from _seq_scans(child)
+
+
+async def check_plans(engine: AsyncEngine, min_rows: int = SEQ_SCAN_MIN_ROWS):
+    failures = []
+    async with engine.connect() as conn:
+        # Only the tables the queries resolve to, not namesakes in other schemas.
+        result = await conn.execute(text(
+            "SELECT relname, reltuples FROM pg_class WHERE relkind = 'r' AND pg_table_is_visible(oid)"))
+        sizes = dict(result.all())
+        for name, query in (await representative_queries()).items():
+            sql = query.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True})
+            result = await conn.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {sql}')
+            plan = result.scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            for relation in _seq_scans(plan[0]['Plan']):
+                if sizes.get(relation, 0) >= min_rows:
+                    failures.append((name, relation))
+    return failures
@@ -0,0 +1,52 @@
+import orjson
+from starlette.responses import Response
+
+import database.models as models
+
+# Columns of TenderRead / BidRead, labelled with the keys those schemas serialize to. List endpoints
+# select exactly these and hand the rows to orjson, skipping ORM entities and pydantic validation.
+TENDER_READ_COLUMNS = (
+    models.Tender.id,
+    models.Tender.name,
+    models.Tender.description,
+    models.Tender.service_type,
+    models.Tender.status,
+    models.Tender.version,
+    models.Tender.createdAt,
+    models.Tender.bid_count,
+)
+
+BID_READ_COLUMNS = (
+    models.Bid.id,
+    models.Bid.name,
+    models.Bid.description,
+    models.Bid.status,
+    models.Bid.tender_id,
+    models.Bid.author_type,
+    models.Bid.author_id,
+    models.Bid.version,
+    models.Bid.createdAt,
+)
+
+
+REVIEW_READ_COLUMNS = (
+    models.Review.id,
+    models.Review.content.label('description'),
+    models.Review.createdAt,
+)
+
+TENDER_READ_FIELDS = tuple(column.key for column in TENDER_READ_COLUMNS)
+BID_READ_FIELDS = tuple(column.key for column in BID_READ_COLUMNS)
+REVIEW_READ_FIELDS = tuple(column.key for column in REVIEW_READ_COLUMNS)
+
+
+class RowsResponse(Response):
+    media_type = 'application/json'
+
+    def render(self, content) -> bytes:
+        # asyncpg returns its own UUID subclass, which orjson only serializes through the fallback.
+        return orjson.dumps(content, default=str)
+
+
+def rows_response(rows) -> RowsResponse:
+    return RowsResponse([row._asdict() for row in rows])
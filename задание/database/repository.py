@@ -0,0 +1,608 @@
+import os
+import uuid
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Set, Tuple
+from uuid import UUID
+
+from fastapi import Depends, HTTPException, Response
+from sqlalchemy import and_, cast, func, insert, literal, true, union_all, update
+from sqlalchemy.dialects.postgresql import REGCONFIG, UUID as PG_UUID
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Bundle, aliased
+
+import database.models as models
+from database.cache import Membership, membership_cache
+from database.catalog_cache import get_catalog_db
+from database.engine import SessionLocal, get_db, get_engine, get_read_db, remember_write
+from database.etags import ETAG_COLUMNS
+from database.export import stream_rows
+from database.pagination import paginate, paginate_by_popularity, paginate_by_rank, paginate_by_recency
+from database.projections import BID_READ_COLUMNS, REVIEW_READ_COLUMNS, TENDER_READ_COLUMNS
+
+# postgres keeps the data in the database. memory keeps it in the worker process, to benchmark and test
+# the API layer without one; it starts empty and is filled through database.memory.memory_store.
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'postgres')
+
+TENDER_HISTORY_COLUMNS = ('name', 'description', 'service_type', 'status', 'version')
+BID_HISTORY_COLUMNS = ('name', 'description', 'status', 'version')
+
+
+class Page(NamedTuple):
+    limit: int
+    offset: int = 0
+    cursor: Optional[str] = None
+
+
+class Repository(ABC):
+    # Everything the API reads and writes: tenders, bids, their version history, reviews and memberships.
+    # Entities and rows have the attributes of the models, list rows the READ columns of projections.
+    # Writes are committed when they return; who may do what is decided by the callers in crud.
+
+    @abstractmethod
+    async def membership(self, username: str) -> Optional[Membership]:
+        ...
+
+    @abstractmethod
+    async def memberships(self, usernames) -> Dict[str, Set[UUID]]:
+        # Organization ids by username, for the users that exist.
+        ...
+
+    @abstractmethod
+    async def existing_organizations(self, organization_ids) -> Set[UUID]:
+        ...
+
+    @abstractmethod
+    async def existing_users(self, user_ids) -> Set[UUID]:
+        ...
+
+    # Authorization lookups return the user's membership along with the target, None for either one
+    # that does not exist; brief targets only need id, organization or author, version and status.
+    @abstractmethod
+    async def find_tender(self, username: str, tender_id: UUID, brief: bool = False):
+        ...
+
+    @abstractmethod
+    async def find_bid(self, username: str, bid_id: UUID, brief: bool = False):
+        # Returns (membership, bid, organization ids of the bid's author if it is a user).
+        ...
+
+    @abstractmethod
+    async def find_decision(self, username: str, bid_id: UUID):
+        # Returns (membership, bid, its tender).
+        ...
+
+    @abstractmethod
+    async def tenders_by_id(self, tender_ids) -> Dict[UUID, object]:
+        ...
+
+    @abstractmethod
+    async def bids_by_id(self, bid_ids) -> Dict[UUID, Tuple[object, Set[UUID]]]:
+        ...
+
+    @abstractmethod
+    async def published_tenders(self, tender_ids) -> Dict[UUID, models.TenderServiceTypeEnum]:
+        ...
+
+    @abstractmethod
+    async def lock_tender(self, tender_id: UUID) -> models.TenderServiceTypeEnum:
+        # Serializes changes of the tender's bids, before one of them changes status; returns the service type.
+        ...
+
+    # Pages; with versions=True the rows only need the ETAG_COLUMNS.
+    @abstractmethod
+    async def tender_page(self, page: Page, sort: str = 'name', service_types=None,
+                          creator_username: Optional[str] = None, versions: bool = False) -> list:
+        ...
+
+    @abstractmethod
+    async def search_page(self, q: str, page: Page, service_types=None, versions: bool = False) -> list:
+        ...
+
+    @abstractmethod
+    async def bid_page(self, page: Page, tender_id: Optional[UUID] = None, author_id: Optional[UUID] = None,
+                       versions: bool = False) -> list:
+        ...
+
+    @abstractmethod
+    async def review_page(self, tender_id: UUID, author: Membership, page: Page) -> list:
+        ...
+
+    @abstractmethod
+    async def tender_facets(self, service_types=None, creator_username: Optional[str] = None) -> dict:
+        ...
+
+    # Exports are async iterators of row batches in name order, all from one consistent state.
+    @abstractmethod
+    def export_tenders(self, service_types=None) -> AsyncIterator[list]:
+        ...
+
+    @abstractmethod
+    def export_bids(self, tender_id: UUID) -> AsyncIterator[list]:
+        ...
+
+    @abstractmethod
+    async def create_tender(self, values: dict):
+        ...
+
+    @abstractmethod
+    async def create_tenders(self, rows: List[dict]) -> list:
+        ...
+
+    @abstractmethod
+    async def create_bid(self, values: dict):
+        ...
+
+    @abstractmethod
+    async def create_bids(self, rows: List[dict]) -> list:
+        ...
+
+    @abstractmethod
+    async def set_tender_status(self, tender, status: models.TenderStatusEnum):
+        ...
+
+    # Edits and rollbacks apply to the version the caller read, and raise 409 when it is no longer current.
+    @abstractmethod
+    async def edit_tender(self, tender, changes: dict):
+        ...
+
+    @abstractmethod
+    async def rollback_tender(self, tender, version: int):
+        ...
+
+    @abstractmethod
+    async def set_bid_status(self, bid, status: models.BidStatusEnum):
+        ...
+
+    @abstractmethod
+    async def edit_bid(self, bid, changes: dict):
+        ...
+
+    @abstractmethod
+    async def rollback_bid(self, bid, version: int):
+        ...
+
+    @abstractmethod
+    async def decide(self, bid, tender, decision: str):
+        ...
+
+    async def remember_write(self, response: Response):
+        # Lets the client read its writes back, see database.engine.
+        pass
+
+    async def close(self):
+        # Releases whatever the repository holds before a long-lived response.
+        pass
+
+
+def tender_search(q: str):
+    # websearch_to_tsquery accepts free user input: quotes, "or" and -exclusions, never a syntax error.
+    query = func.websearch_to_tsquery(cast(literal(models.TENDER_SEARCH_CONFIG), REGCONFIG), q)
+    return models.Tender.search_vector.op('@@')(query), func.ts_rank(models.Tender.search_vector, query)
+
+
+# Just what authorization and conditional requests need, instead of the whole entity.
+TENDER_VERSION = Bundle('tender', models.Tender.id, models.Tender.organization_id, models.Tender.version,
+                        models.Tender.status)
+BID_VERSION = Bundle('bid', models.Bid.id, models.Bid.author_type, models.Bid.author_id, models.Bid.version,
+                     models.Bid.status)
+
+
+def _present(target):
+    # An outer-joined entity comes back as None, an outer-joined Bundle as a row of NULLs.
+    return target is not None and target.id is not None
+
+
+def _membership_query(username: str):
+    return select(models.User.id, models.OrganizationResponsible.organization_id).outerjoin(
+        models.OrganizationResponsible, models.OrganizationResponsible.user_id == models.User.id
+    ).where(models.User.username == username)
+
+
+def _remember_membership(username: str, rows, generation: int):
+    if not rows:
+        return None
+
+    membership = Membership(rows[0][0], frozenset(row[1] for row in rows if row[1] is not None))
+    membership_cache.set(username, membership, generation)
+    return membership
+
+
+def reviews_query(tender_id: UUID, author: Membership):
+    # Bids by the author are those filed in their own name or by one of their organizations.
+    # Only visible to a tender whose bids include one of them.
+    authors = [author.user_id, *author.organization_ids]
+    bid_on_tender = select(models.Bid.id).where(
+        models.Bid.tender_id == tender_id, models.Bid.author_id.in_(authors)).exists()
+    return select(*REVIEW_READ_COLUMNS).join(models.Bid, models.Bid.id == models.Review.bid_id).where(
+        models.Bid.author_id.in_(authors), bid_on_tender)
+
+
+UNIQUE_VIOLATION = '23505'
+
+
+def _snapshot(model, history, key: str, columns, current):
+    # Copies the row matched by `current` into its history table, as a CTE of the statement that changes it.
+    # All parts of a statement see the same snapshot, so this records the row as it was before the update.
+    return insert(history).from_select(
+        ['id', key, *columns],
+        select(literal(uuid.uuid4(), PG_UUID(as_uuid=True)), model.id, *[getattr(model, c) for c in columns])
+        .where(current),
+    ).cte(f'{history.__tablename__}_snapshot')
+
+
+def _restored_version(history, archive, key: str, entity_id: UUID, version: int, columns):
+    # The version to roll back to, from the history table or, once compacted, from its archive.
+    return union_all(*(
+        select(*[getattr(table, c) for c in (key, *columns)]).where(getattr(table, key) == entity_id,
+                                                                     table.version == version)
+        for table in (history, archive)
+    )).subquery('restored')
+
+
+def _page_columns(model, columns, versions: bool):
+    return [getattr(model, name) for name in ETAG_COLUMNS[model]] if versions else columns
+
+
+class SqlRepository(Repository):
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    def _on_replica(self) -> bool:
+        return self.db.bind is not get_engine()
+
+    async def _primary_membership(self, username: str):
+        # A replica may not have replayed a change that was already notified and cleared the cache, and would
+        # refill it with the old membership for the whole TTL; so cache misses on a replica read the primary.
+        generation = membership_cache.generation
+        async with SessionLocal(bind=get_engine()) as primary:
+            result = await primary.execute(_membership_query(username))
+            return _remember_membership(username, result.all(), generation)
+
+    async def _resolve(self, username: str, columns, joins):
+        # joins[0] is (entity, criterion identifying the target row); the rest are outer joins from it.
+        # On a cache miss on the primary the membership and the target are fetched in a single joined query.
+        membership = membership_cache.get(username)
+        if membership is None and self._on_replica():
+            membership = await self._primary_membership(username)
+            if membership is None:
+                return None, []
+        elif membership is None:
+            generation = membership_cache.generation
+            query = _membership_query(username).add_columns(*columns)
+            for target, onclause in joins:
+                query = query.outerjoin(target, onclause)
+            result = await self.db.execute(query)
+            rows = result.all()
+            membership = _remember_membership(username, rows, generation)
+            return membership, [row[2:] for row in rows if _present(row[2])]
+
+        (_, criterion), rest = joins[0], joins[1:]
+        query = select(*columns).where(criterion)
+        for target, onclause in rest:
+            query = query.outerjoin(target, onclause)
+        result = await self.db.execute(query)
+        return membership, result.all()
+
+    async def membership(self, username):
+        membership = membership_cache.get(username)
+        if membership is None and self._on_replica():
+            membership = await self._primary_membership(username)
+        elif membership is None:
+            generation = membership_cache.generation
+            result = await self.db.execute(_membership_query(username))
+            membership = _remember_membership(username, result.all(), generation)
+        return membership
+
+    async def memberships(self, usernames):
+        result = await self.db.execute(
+            select(models.User.username, models.OrganizationResponsible.organization_id).outerjoin(
+                models.OrganizationResponsible, models.OrganizationResponsible.user_id == models.User.id
+            ).where(models.User.username.in_(set(usernames)))
+        )
+        memberships = {}
+        for username, organization_id in result.all():
+            memberships.setdefault(username, set()).add(organization_id)
+        return memberships
+
+    async def existing_organizations(self, organization_ids):
+        result = await self.db.execute(
+            select(models.Organization.id).where(models.Organization.id.in_(set(organization_ids))))
+        return set(result.scalars())
+
+    async def existing_users(self, user_ids):
+        result = await self.db.execute(select(models.User.id).where(models.User.id.in_(set(user_ids))))
+        return set(result.scalars())
+
+    async def find_tender(self, username, tender_id, brief=False):
+        membership, rows = await self._resolve(username, [TENDER_VERSION if brief else models.Tender],
+                                               [(models.Tender, models.Tender.id == tender_id)])
+        return membership, rows[0][0] if rows else None
+
+    async def find_bid(self, username, bid_id, brief=False):
+        author = aliased(models.OrganizationResponsible)
+        target = BID_VERSION if brief else models.Bid
+        membership, rows = await self._resolve(username, [target, author.organization_id], [
+            (models.Bid, models.Bid.id == bid_id),
+            (author, author.user_id == models.Bid.author_id),
+        ])
+        if not rows:
+            return membership, None, set()
+        return membership, rows[0][0], {row[1] for row in rows}
+
+    async def find_decision(self, username, bid_id):
+        membership, rows = await self._resolve(username, [models.Bid, models.Tender], [
+            (models.Bid, models.Bid.id == bid_id),
+            (models.Tender, models.Tender.id == models.Bid.tender_id),
+        ])
+        if not rows:
+            return membership, None, None
+        bid, tender = rows[0]
+        return membership, bid, tender
+
+    async def tenders_by_id(self, tender_ids):
+        result = await self.db.execute(select(TENDER_VERSION).where(models.Tender.id.in_(set(tender_ids))))
+        return {tender.id: tender for tender in result.scalars()}
+
+    async def bids_by_id(self, bid_ids):
+        author = aliased(models.OrganizationResponsible)
+        result = await self.db.execute(
+            select(BID_VERSION, author.organization_id).outerjoin(author, author.user_id == models.Bid.author_id)
+            .where(models.Bid.id.in_(set(bid_ids)))
+        )
+        bids = {}
+        for bid, organization_id in result.all():
+            bids.setdefault(bid.id, (bid, set()))[1].add(organization_id)
+        return bids
+
+    async def published_tenders(self, tender_ids):
+        result = await self.db.execute(select(models.Tender.id, models.Tender.service_type).where(
+            models.Tender.id.in_(set(tender_ids)), models.Tender.status == models.TenderStatusEnum.PUBLISHED))
+        return dict(result.all())
+
+    async def lock_tender(self, tender_id):
+        # A bid status change fires the trigger that updates the tender's bid_count: locking the tender first,
+        # like decide does, keeps the two from deadlocking.
+        result = await self.db.execute(select(models.Tender.service_type).where(models.Tender.id == tender_id)
+                                       .with_for_update(key_share=True))
+        return result.scalar_one()
+
+    async def _rows(self, query):
+        result = await self.db.execute(query)
+        return result.all()
+
+    async def tender_page(self, page, sort='name', service_types=None, creator_username=None, versions=False):
+        query = select(*_page_columns(models.Tender, TENDER_READ_COLUMNS, versions))
+        if service_types:
+            query = query.where(models.Tender.service_type.in_(service_types))
+        if creator_username is not None:
+            query = query.where(models.Tender.creator_username == creator_username)
+        if sort == 'popularity':
+            return await self._rows(paginate_by_popularity(query, models.Tender, *page))
+        return await self._rows(paginate(query, models.Tender, *page))
+
+    async def search_page(self, q, page, service_types=None, versions=False):
+        matches, rank = tender_search(q)
+        columns = _page_columns(models.Tender, [*TENDER_READ_COLUMNS, rank.label('rank')], versions)
+        query = select(*columns).where(matches)
+        if service_types:
+            query = query.where(models.Tender.service_type.in_(service_types))
+        return await self._rows(paginate_by_rank(query, rank, models.Tender, page.limit, page.cursor))
+
+    async def bid_page(self, page, tender_id=None, author_id=None, versions=False):
+        query = select(*_page_columns(models.Bid, BID_READ_COLUMNS, versions))
+        if tender_id is not None:
+            query = query.where(models.Bid.tender_id == tender_id)
+        if author_id is not None:
+            query = query.where(models.Bid.author_id == author_id)
+        return await self._rows(paginate(query, models.Bid, *page))
+
+    async def review_page(self, tender_id, author, page):
+        return await self._rows(paginate_by_recency(reviews_query(tender_id, author), models.Review, *page))
+
+    async def tender_facets(self, service_types=None, creator_username=None):
+        # Both facets in one grouped scan. Counts per service type leave out the service type filter, so that
+        # the other types can still be offered; counts per status apply it.
+        conditions = [] if creator_username is None else [models.Tender.creator_username == creator_username]
+        selected = models.Tender.service_type.in_(service_types) if service_types else true()
+        bid_count = models.Tender.bid_count
+        result = await self.db.execute(
+            select(
+                func.grouping(models.Tender.service_type), models.Tender.service_type, models.Tender.status,
+                func.count(), func.coalesce(func.sum(bid_count), 0),
+                func.count().filter(selected), func.coalesce(func.sum(bid_count).filter(selected), 0),
+            ).where(*conditions).group_by(func.grouping_sets(models.Tender.service_type, models.Tender.status))
+        )
+        facets = dict(service_type={}, status={})
+        for by_status, service_type, status, tenders, bids, selected_tenders, selected_bids in result.all():
+            if not by_status:
+                facets['service_type'][service_type] = dict(tenders=tenders, bids=bids)
+            elif selected_tenders:
+                facets['status'][status] = dict(tenders=selected_tenders, bids=selected_bids)
+        return facets
+
+    def export_tenders(self, service_types=None):
+        query = select(*TENDER_READ_COLUMNS)
+        if service_types:
+            query = query.where(models.Tender.service_type.in_(service_types))
+        # The order of the list pages, which the (service_type, name, id) and (name, id) indexes return unsorted.
+        return stream_rows(self.db, query.order_by(models.Tender.name, models.Tender.id))
+
+    def export_bids(self, tender_id):
+        query = select(*BID_READ_COLUMNS).where(models.Bid.tender_id == tender_id)
+        return stream_rows(self.db, query.order_by(models.Bid.name, models.Bid.id))
+
+    async def _commit(self, *refresh):
+        try:
+            await self.db.commit()
+            for entity in refresh:
+                await self.db.refresh(entity)
+        except Exception as e:
+            await self.db.rollback()
+            raise HTTPException(status_code=400, detail=str(e))
+
+    async def create_tender(self, values):
+        tender = models.Tender(**values)
+        self.db.add(tender)
+        await self._commit(tender)
+        return tender
+
+    async def _insert_many(self, model, rows):
+        # Sent as multi-row INSERT ... RETURNING statements, results in the order of `rows`.
+        if not rows:
+            return []
+        try:
+            result = await self.db.execute(insert(model).returning(model, sort_by_parameter_order=True), rows)
+            created = result.scalars().all()
+        except Exception as e:
+            await self.db.rollback()
+            raise HTTPException(status_code=400, detail=str(e))
+        await self._commit()
+        return created
+
+    async def create_tenders(self, rows):
+        return await self._insert_many(models.Tender, rows)
+
+    async def create_bid(self, values):
+        bid = models.Bid(**values)
+        self.db.add(bid)
+        await self._commit(bid)
+        return bid
+
+    async def create_bids(self, rows):
+        return await self._insert_many(models.Bid, rows)
+
+    async def set_tender_status(self, tender, status):
+        tender.status = status
+        await self.db.commit()
+        await self.db.refresh(tender)
+        return tender
+
+    async def _apply_versioned(self, model, statement):
+        query = select(model).from_statement(statement.returning(model)).execution_options(populate_existing=True)
+        try:
+            result = await self.db.execute(query)
+        except IntegrityError as e:
+            await self.db.rollback()
+            if getattr(e.orig, 'sqlstate', None) == UNIQUE_VIOLATION:
+                raise HTTPException(status_code=409, detail="version conflict, reload and retry")
+            raise HTTPException(status_code=400, detail=str(e))
+        return result.scalar_one_or_none()
+
+    async def _version_conflict(self, history_query):
+        # Called once an update matched no row; tells a missing target version from a concurrent edit.
+        await self.db.rollback()
+        result = await self.db.execute(history_query.limit(1))
+        if result.first() is None:
+            raise HTTPException(status_code=404, detail="version not found")
+        raise HTTPException(status_code=409, detail="version conflict, reload and retry")
+
+    async def _edit(self, model, history, key: str, columns, entity, changes: dict):
+        current = and_(model.id == entity.id, model.version == entity.version)
+        statement = update(model).where(current).values(
+            **changes, version=model.version + 1
+        ).add_cte(_snapshot(model, history, key, columns, current))
+
+        updated = await self._apply_versioned(model, statement)
+        if updated is None:
+            await self.db.rollback()
+            raise HTTPException(status_code=409, detail="version conflict, reload and retry")
+        await self.db.commit()
+        return updated
+
+    async def _rollback(self, model, history, archive, key: str, columns, entity, version: int):
+        current = and_(model.id == entity.id, model.version == entity.version)
+        restored = _restored_version(history, archive, key, entity.id, version, columns)
+        statement = update(model).where(current, getattr(restored.c, key) == model.id).values(
+            **{column: getattr(restored.c, column) for column in columns if column != 'version'},
+            version=model.version + 1,
+        ).add_cte(_snapshot(model, history, key, columns, current))
+
+        updated = await self._apply_versioned(model, statement)
+        if updated is None:
+            await self._version_conflict(select(restored.c.version))
+        await self.db.commit()
+        return updated
+
+    async def edit_tender(self, tender, changes):
+        return await self._edit(models.Tender, models.TenderHistory, 'tender_id', TENDER_HISTORY_COLUMNS,
+                                tender, changes)
+
+    async def rollback_tender(self, tender, version):
+        return await self._rollback(models.Tender, models.TenderHistory, models.TenderHistoryArchive, 'tender_id',
+                                    TENDER_HISTORY_COLUMNS, tender, version)
+
+    async def set_bid_status(self, bid, status):
+        bid.status = status
+        await self.db.commit()
+        await self.db.refresh(bid)
+        return bid
+
+    async def edit_bid(self, bid, changes):
+        return await self._edit(models.Bid, models.BidHistory, 'bid_id', BID_HISTORY_COLUMNS, bid, changes)
+
+    async def rollback_bid(self, bid, version):
+        return await self._rollback(models.Bid, models.BidHistory, models.BidHistoryArchive, 'bid_id',
+                                    BID_HISTORY_COLUMNS, bid, version)
+
+    async def decide(self, bid, tender, decision):
+        # Decisions on a tender are serialized on its row lock. The bid and the tender are re-read under it,
+        # so a decision that lost the race to an approval finds the tender closed.
+        await self.db.execute(
+            select(models.Tender, models.Bid).join(models.Bid, models.Bid.tender_id == models.Tender.id)
+            .where(models.Bid.id == bid.id).with_for_update().execution_options(populate_existing=True)
+        )
+        if tender.status == models.TenderStatusEnum.CLOSED:
+            await self.db.rollback()
+            raise HTTPException(status_code=409, detail="tender is already closed")
+
+        if decision == 'Rejected':
+            bid.status = models.BidStatusEnum.CANCELED
+        elif bid.status == models.BidStatusEnum.CANCELED:
+            await self.db.rollback()
+            raise HTTPException(status_code=409, detail="bid is canceled")
+        else:
+            tender.status = models.TenderStatusEnum.CLOSED
+            # One statement for all competing bids, however many there are.
+            await self.db.execute(update(models.Bid).where(
+                models.Bid.tender_id == tender.id,
+                models.Bid.id != bid.id,
+                models.Bid.status != models.BidStatusEnum.CANCELED,
+            ).values(status=models.BidStatusEnum.CANCELED))
+        await self.db.commit()
+        return bid
+
+    async def remember_write(self, response):
+        await remember_write(self.db, response)
+
+    async def close(self):
+        await self.db.close()
+
+
+async def get_sql_repository(db: AsyncSession = Depends(get_db)) -> Repository:
+    return SqlRepository(db)
+
+
+async def get_read_sql_repository(db: AsyncSession = Depends(get_read_db)) -> Repository:
+    return SqlRepository(db)
+
+
+async def get_catalog_sql_repository(db: AsyncSession = Depends(get_catalog_db)) -> Repository:
+    return SqlRepository(db)
+
+
+# The dependencies the handlers take their repository from: for writes, for reads that may go to a replica
+# and for the tender catalog, whose reads may only go to a replica that has its latest writes.
+if STORAGE_BACKEND == 'memory':
+    async def get_repository() -> Repository:
+        # database.memory builds on this module, so it is only looked up once requests come in.
+        from database.memory import memory_store, MemoryRepository
+        return MemoryRepository(memory_store)
+
+    get_read_repository = get_catalog_repository = get_repository
+elif STORAGE_BACKEND == 'postgres':
+    get_repository, get_read_repository = get_sql_repository, get_read_sql_repository
+    get_catalog_repository = get_catalog_sql_repository
+else:
+    raise RuntimeError(f'unknown STORAGE_BACKEND {STORAGE_BACKEND!r}, expected postgres or memory')
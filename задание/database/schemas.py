@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Dict, Optional
 from uuid import UUID
 from datetime import datetime
 from enum import Enum
@@ -103,11 +103,26 @@ class TenderRead(BaseModel):
     status: TenderStatusEnum
     version: int
     createdAt: datetime
+    bid_count: int = 0
 
     class Config:
         orm_mode = True
 
 
+class TenderSearchResult(TenderRead):
+    rank: float
+
+
+class FacetCount(BaseModel):
+    tenders: int
+    bids: int
+
+
+class TenderFacets(BaseModel):
+    service_type: Dict[TenderServiceTypeEnum, FacetCount]
+    status: Dict[TenderStatusEnum, FacetCount]
+
+
 class BidBase(BaseModel):
     id: UUID
     name: str
@@ -116,6 +131,7 @@ class BidBase(BaseModel):
     tenderId: UUID = Field(..., alias='tender_id')
     authorType: BidAuthorTypeEnum = Field(..., alias='author_type')
     authorId: UUID = Field(..., alias='author_id')
+    version: int
     createdAt: datetime
 
 
@@ -141,6 +157,36 @@ class BidRead(BidBase):
         orm_mode = True
 
 
+class TenderBulkResult(BaseModel):
+    index: int
+    status_code: int
+    detail: Optional[str] = None
+    tender: Optional[TenderRead] = None
+
+
+class BidBulkResult(BaseModel):
+    index: int
+    status_code: int
+    detail: Optional[str] = None
+    bid: Optional[BidRead] = None
+
+
+class TenderStatusResult(BaseModel):
+    id: UUID
+    status_code: int
+    detail: Optional[str] = None
+    status: Optional[TenderStatusEnum] = None
+    version: Optional[int] = None
+
+
+class BidStatusResult(BaseModel):
+    id: UUID
+    status_code: int
+    detail: Optional[str] = None
+    status: Optional[BidStatusEnum] = None
+    version: Optional[int] = None
+
+
 class ReviewBase(BaseModel):
     content: str
     bid_id: UUID
@@ -151,10 +197,10 @@ class ReviewCreate(ReviewBase):
     pass
 
 
-class ReviewRead(ReviewBase):
+class ReviewRead(BaseModel):
     id: UUID
-    created_at: datetime
-    updated_at: datetime
+    description: str
+    createdAt: datetime
 
     class Config:
         orm_mode = True
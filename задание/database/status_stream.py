@@ -0,0 +1,102 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Iterable
+
+from database.listener import listener
+from database.repository import STORAGE_BACKEND
+
+# Filled by the triggers of migration 0005 on every status or version change of a tender or a bid.
+STATUS_CHANNEL = 'status_changes'
+# Events buffered per stream; a client that falls further behind is disconnected and has to resubscribe.
+STATUS_STREAM_QUEUE = int(os.getenv('STATUS_STREAM_QUEUE', 100))
+# Seconds between keepalive comments on an idle stream, so that proxies keep it open.
+STATUS_STREAM_KEEPALIVE = float(os.getenv('STATUS_STREAM_KEEPALIVE', 15))
+
+logger = logging.getLogger('database.status_stream')
+
+
+class Subscription:
+    def __init__(self, keys):
+        self.keys = keys
+        self.queue = asyncio.Queue(STATUS_STREAM_QUEUE)
+        self.closed = False
+
+
+class StatusBroadcaster:
+    # Fans the notifications of the worker's LISTEN connection out to all of its open streams.
+    def __init__(self, channel: str):
+        self.channel = channel
+        self._subscriptions = {}
+
+    async def subscribe(self, keys: Iterable[tuple]) -> Subscription:
+        # Without a database the memory repository publishes its changes itself.
+        if STORAGE_BACKEND == 'postgres':
+            await listener.listen(self.channel, self._notified, self._lost)
+        subscription = Subscription(set(keys))
+        for key in subscription.keys:
+            self._subscriptions.setdefault(key, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for key in subscription.keys:
+            subscribers = self._subscriptions.get(key)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[key]
+
+    def _notified(self, connection, pid, channel, payload):
+        event = json.loads(payload)
+        self.publish(event.pop('kind'), event)
+
+    def publish(self, kind: str, event: dict):
+        # event has the id, status and version of the tender or bid, as strings and numbers.
+        for subscription in list(self._subscriptions.get((kind, event['id']), ())):
+            try:
+                subscription.queue.put_nowait((kind, event))
+            except asyncio.QueueFull:
+                logger.warning('closing a status stream that fell %d events behind', STATUS_STREAM_QUEUE)
+                self._end(subscription)
+
+    def _end(self, subscription: Subscription):
+        if subscription.closed:
+            return
+        self.unsubscribe(subscription)
+        subscription.closed = True
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(None)
+
+    def _lost(self):
+        # Notifications may have been missed while reconnecting: end every stream, clients
+        # resubscribe and get the current state first.
+        for subscribers in list(self._subscriptions.values()):
+            for subscription in list(subscribers):
+                self._end(subscription)
+
+
+status_broadcaster = StatusBroadcaster(STATUS_CHANNEL)
+
+
+def format_event(kind: str, data: dict) -> str:
+    return f'event: {kind}\ndata: {json.dumps(data)}\n\n'
+
+
+async def stream_events(subscription: Subscription, initial):
+    # Server-sent events: the current state of every subscribed entity, then its changes as they commit.
+    try:
+        for kind, data in initial:
+            yield format_event(kind, data)
+        while True:
+            try:
+                item = await asyncio.wait_for(subscription.queue.get(), STATUS_STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if item is None:
+                return
+            yield format_event(*item)
+    finally:
+        status_broadcaster.unsubscribe(subscription)
@@ -0,0 +1,45 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from database.directory import DEFAULT_BATCH_SIZE, ENTITIES, load, read_rows
+from database.engine import dispose_engines, get_engine
+
+FORMATS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+
+async def main(args):
+    file_format = args.format or FORMATS.get(os.path.splitext(args.file)[1].lower())
+    if file_format is None:
+        print(f'cannot tell the format of {args.file}, pass --format', file=sys.stderr)
+        return 2
+
+    rejects = open(args.rejects, 'w', encoding='utf-8') if args.rejects else sys.stderr
+
+    def on_reject(reject):
+        rejects.write(json.dumps(reject._asdict(), ensure_ascii=False, default=str) + '\n')
+
+    file = sys.stdin if args.file == '-' else open(args.file, newline='', encoding='utf-8')
+    try:
+        result = await load(get_engine(), args.entity, read_rows(file, file_format), on_reject, args.batch_size)
+    finally:
+        await dispose_engines()
+        file.close()
+        if args.rejects:
+            rejects.close()
+
+    print(f'{args.entity}: read {result.read}, inserted {result.inserted}, updated {result.updated}, '
+          f'unchanged {result.unchanged}, rejected {result.rejected}')
+    return 1 if result.rejected else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk load employees, organizations and their responsibles.')
+    parser.add_argument('entity', choices=ENTITIES)
+    parser.add_argument('file', help='CSV with a header row or NDJSON, - for standard input')
+    parser.add_argument('--format', choices=('csv', 'ndjson'), help='by default taken from the file extension')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='rows per transaction')
+    parser.add_argument('--rejects', metavar='PATH', help='write rejected rows here instead of standard error')
+    sys.exit(asyncio.run(main(parser.parse_args())))
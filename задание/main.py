@@ -1,24 +1,92 @@
-from fastapi import FastAPI, HTTPException, Depends, Query
-from sqlalchemy import select, delete, asc
-from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import os
+
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from uuid import UUID
 from typing import List, Optional
 
-from database.engine import get_db, Base, engine
-from database.models import Tender as DBTender, Bid as DBBid, Review as DBReview, TenderHistory, BidHistory, \
-    TenderStatusEnum, TenderServiceTypeEnum, BidStatusEnum
+from database.engine import dispose_engines, get_engine
+from database.models import Tender as DBTender, Bid as DBBid, TenderStatusEnum, TenderServiceTypeEnum, BidStatusEnum
 from database.schemas import TenderCreate, TenderRead, BidCreate, BidRead, ReviewRead, \
-    TenderUpdate, BidUpdate
-from database.crud import check_user_organization, check_user_tender, check_responsible, check_author, check_tender, \
-    get_user, check_user_bid, check_responsible_bid, get_bid, get_tender, get_user_organization
+    TenderUpdate, BidUpdate, TenderSearchResult, TenderBulkResult, BidBulkResult, TenderStatusResult, BidStatusResult, \
+    TenderFacets
+from database.crud import check_author, check_tender, get_membership, authorize_organization, authorize_tender, \
+    authorize_bid, authorize_decision, bid_values, validate_tender_batch, validate_bid_batch, authorize_tenders, \
+    authorize_bids
+from database.repository import STORAGE_BACKEND, Page, Repository, get_catalog_repository, get_read_repository, \
+    get_repository
+from database.pagination import set_next_cursor
+from database.projections import BID_READ_FIELDS, TENDER_READ_FIELDS, rows_response
+from database.etags import entity_etag, etag_matches, not_modified, page_response
+from database.export import export_response
+from database import metrics
+from database.admission import AdmissionMiddleware
+from database.catalog_cache import CatalogState, catalog_state, tender_catalog
+from database.status_stream import status_broadcaster, stream_events
+from database.history import HISTORY_COMPACT_INTERVAL, compaction_loop
+from database.listener import listener
+from database.cache import watch_membership
 
 app = FastAPI()
+# Metrics wrap admission control, so that shed requests are counted too.
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+
+BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', 5000))
+STREAM_MAX_ITEMS = int(os.getenv('STREAM_MAX_ITEMS', 100))
+# The largest page the list endpoints return, as the API specification allows.
+PAGE_MAX_LIMIT = int(os.getenv('PAGE_MAX_LIMIT', 50))
+# The database's background work: membership notifications from other processes and history compaction.
+DATABASE_TASKS = STORAGE_BACKEND == 'postgres'
+
+# Column each sort order of the tender listings takes its cursor from.
+TENDER_SORTS = {'name': 'name', 'popularity': 'bid_count'}
+
+
+@app.exception_handler(RequestValidationError)
+async def invalid_request(request: Request, exc: RequestValidationError):
+    # Malformed parameters and bodies are answered 400, like the API's other checks of its input.
+    return JSONResponse({'detail': jsonable_encoder(exc.errors())}, status_code=400)
 
 
 @app.on_event("startup")
 async def on_startup():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    if not DATABASE_TASKS:
+        return
+    await watch_membership()
+    if HISTORY_COMPACT_INTERVAL > 0:
+        app.state.compaction = asyncio.create_task(compaction_loop(get_engine(), HISTORY_COMPACT_INTERVAL))
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    if DATABASE_TASKS and HISTORY_COMPACT_INTERVAL > 0:
+        app.state.compaction.cancel()
+    # Runs once the server has stopped accepting connections and in-flight requests have finished.
+    await listener.close()
+    await dispose_engines()
+
+
+def status_result(id: UUID, resolved):
+    if isinstance(resolved, HTTPException):
+        return dict(id=id, status_code=resolved.status_code, detail=resolved.detail)
+    return dict(id=id, status_code=200, status=resolved.status, version=resolved.version)
+
+
+def parse_service_types(service_type: List[str]):
+    try:
+        return [TenderServiceTypeEnum(st) for st in service_type]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid service type provided.")
+
+
+def tender_cursor_key(sort: str):
+    if sort not in TENDER_SORTS:
+        raise HTTPException(status_code=400, detail="Invalid sort provided.")
+    return TENDER_SORTS[sort]
 
 
 @app.get("/api/ping", response_model=str)
@@ -26,293 +94,375 @@ async def ping():
     return "ok"
 
 
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
+
+
 @app.get("/api/tenders", response_model=List[TenderRead])
 async def get_tenders(
+        request: Request,
         service_type: Optional[List[str]] = Query(None),
-        limit: int = 5,
-        offset: int = 0,
-        db: AsyncSession = Depends(get_db)
+        sort: str = 'name',
+        limit: int = Query(5, ge=0, le=PAGE_MAX_LIMIT),
+        offset: int = Query(0, ge=0),
+        cursor: Optional[str] = None,
+        catalog: Optional[CatalogState] = Depends(catalog_state),
+        repo: Repository = Depends(get_catalog_repository)
 ):
-    query = select(DBTender)
-
-    print(service_type)
     if service_type:
-        try:
-            service_types_enum = [TenderServiceTypeEnum(st) for st in service_type]
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid service type provided.")
-        query = query.where(DBTender.service_type.in_(service_types_enum))
+        service_types = selected = parse_service_types(service_type)
+    else:
+        service_types, selected = list(TenderServiceTypeEnum), None
+    cursor_key = tender_cursor_key(sort)
+    page = Page(limit, offset, cursor)
+
+    if tender_catalog.enabled:
+        # Embeds the generations, so a request after an invalidation never joins an older execution.
+        key = tender_catalog.key(catalog, service_types, sort, limit, offset, cursor)
+        cached = await tender_catalog.get(request, key)
+        if cached is not None:
+            return cached
+    else:
+        covered = ",".join(sorted(st.value for st in service_types))
+        key = f'tenders:{covered}:{sort}:{limit}:{offset}:{cursor or ""}'
+
+    response = await page_response(request, lambda versions: repo.tender_page(page, sort, selected, versions=versions),
+                                   DBTender, limit, cursor_key, key=('tenders', key))
+
+    if tender_catalog.enabled:
+        await tender_catalog.set(key, response)
+    return response
+
+
+@app.get("/api/tenders/facets", response_model=TenderFacets)
+async def get_tender_facets(service_type: Optional[List[str]] = Query(None),
+                            repo: Repository = Depends(get_read_repository)):
+    service_types = parse_service_types(service_type) if service_type else None
+    return await repo.tender_facets(service_types)
+
+
+@app.get("/api/tenders/search", response_model=List[TenderSearchResult])
+async def search_tenders(
+        request: Request,
+        q: str = Query(..., min_length=1),
+        service_type: Optional[List[str]] = Query(None),
+        limit: int = Query(5, ge=0, le=PAGE_MAX_LIMIT),
+        cursor: Optional[str] = None,
+        repo: Repository = Depends(get_read_repository)
+):
+    service_types = parse_service_types(service_type) if service_type else None
+    page = Page(limit, cursor=cursor)
+    return await page_response(request, lambda versions: repo.search_page(q, page, service_types, versions),
+                               DBTender, limit, cursor_key='rank')
 
-    query = query.order_by(asc(DBTender.name))
-    query = query.limit(limit).offset(offset)
 
-    result = await db.execute(query)
-    tenders = result.scalars().all()
-    return tenders
+@app.get("/api/tenders/export")
+async def export_tenders(
+        service_type: Optional[List[str]] = Query(None),
+        format: str = 'ndjson',
+        repo: Repository = Depends(get_read_repository)
+):
+    service_types = parse_service_types(service_type) if service_type else None
+    return export_response(repo.export_tenders(service_types), TENDER_READ_FIELDS, format, 'tenders')
 
 
 @app.post("/api/tenders/new", response_model=TenderRead)
-async def create_tender(tender: TenderCreate, db: AsyncSession = Depends(get_db)):
-    db_tender = DBTender(**tender.dict())
-    await check_user_organization(db, tender)
-    db.add(db_tender)
-    try:
-        await db.commit()
-        await db.refresh(db_tender)
-    except Exception as e:
-        await db.rollback()
-        raise HTTPException(status_code=400, detail=str(e))
+async def create_tender(tender: TenderCreate, response: Response, repo: Repository = Depends(get_repository)):
+    await authorize_organization(repo, tender.creator_username, tender.organization_id)
+    db_tender = await repo.create_tender(tender.dict())
+    await repo.remember_write(response)
+    await tender_catalog.invalidate(response, db_tender.service_type)
     return db_tender
 
 
+@app.post("/api/tenders/bulk", response_model=List[TenderBulkResult])
+async def create_tenders_bulk(tenders: List[TenderCreate], response: Response,
+                              repo: Repository = Depends(get_repository)):
+    if len(tenders) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"at most {BULK_MAX_ITEMS} tenders per request")
+
+    errors = await validate_tender_batch(repo, tenders) if tenders else {}
+    valid = [index for index in range(len(tenders)) if index not in errors]
+    created = await repo.create_tenders([tenders[index].dict() for index in valid])
+    await repo.remember_write(response)
+    await tender_catalog.invalidate(response, *(tender.service_type for tender in created))
+
+    results = [dict(index=index, status_code=status_code, detail=detail)
+               for index, (status_code, detail) in errors.items()]
+    results += [dict(index=index, status_code=200, tender=tender) for index, tender in zip(valid, created)]
+    return sorted(results, key=lambda result: result['index'])
+
+
 @app.get("/api/tenders/my", response_model=List[TenderRead])
 async def get_my_tenders(
         username: str,
-        limit: int = 5,
-        offset: int = 0,
-        db: AsyncSession = Depends(get_db)
+        request: Request,
+        sort: str = 'name',
+        limit: int = Query(5, ge=0, le=PAGE_MAX_LIMIT),
+        offset: int = Query(0, ge=0),
+        cursor: Optional[str] = None,
+        repo: Repository = Depends(get_read_repository)
 ):
     if not username:
         raise HTTPException(status_code=401, detail='user not found')
 
-    query = select(DBTender).filter(DBTender.creator_username == username).order_by(DBTender.name).limit(limit).offset(
-        offset)
+    cursor_key = tender_cursor_key(sort)
+    page = Page(limit, offset, cursor)
+    return await page_response(
+        request, lambda versions: repo.tender_page(page, sort, creator_username=username, versions=versions),
+        DBTender, limit, cursor_key)
 
-    result = await db.execute(query)
-    tenders = result.scalars().all()
 
-    return tenders
+@app.get("/api/tenders/my/facets", response_model=TenderFacets)
+async def get_my_tender_facets(username: str, service_type: Optional[List[str]] = Query(None),
+                               repo: Repository = Depends(get_read_repository)):
+    if not username:
+        raise HTTPException(status_code=401, detail='user not found')
+
+    service_types = parse_service_types(service_type) if service_type else None
+    return await repo.tender_facets(service_types, creator_username=username)
 
 
 @app.get("/api/tenders/{tender_id}/status")
-async def get_tender_status(tender_id: UUID, username: str, db: AsyncSession = Depends(get_db)):
-    user, tender = await check_user_tender(db, username, tender_id)
-    await check_responsible(db, user, tender)
+async def get_tender_status(tender_id: UUID, username: str, request: Request, response: Response,
+                            repo: Repository = Depends(get_read_repository)):
+    _, tender = await authorize_tender(repo, username, tender_id, brief=True)
+    etag = entity_etag(tender.version, tender.status)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers['ETag'] = etag
     return tender.status
 
 
+@app.post("/api/tenders/status/batch", response_model=List[TenderStatusResult])
+async def get_tender_statuses(tender_ids: List[UUID], username: str,
+                              repo: Repository = Depends(get_read_repository)):
+    if len(tender_ids) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"at most {BULK_MAX_ITEMS} tenders per request")
+
+    resolved = await authorize_tenders(repo, username, tender_ids)
+    return [status_result(tender_id, resolved[tender_id]) for tender_id in tender_ids]
+
+
 @app.put("/api/tenders/{tender_id}/status", response_model=TenderRead)
 async def update_tender_status(tender_id: UUID, status: TenderStatusEnum, username: str,
-                               db: AsyncSession = Depends(get_db)):
-    user, tender = await check_user_tender(db, username, tender_id)
-    await check_responsible(db, user, tender)
-    tender.status = status
-    await db.commit()
-    await db.refresh(tender)
+                               response: Response, repo: Repository = Depends(get_repository)):
+    _, tender = await authorize_tender(repo, username, tender_id)
+    tender = await repo.set_tender_status(tender, status)
+    await repo.remember_write(response)
+    await tender_catalog.invalidate(response, tender.service_type)
     return tender
 
 
 @app.patch("/api/tenders/{tender_id}/edit", response_model=TenderRead)
-async def update_tender(tender_id: UUID, username: str, update_data: TenderUpdate, db: AsyncSession = Depends(get_db)):
-    user, tender = await check_user_tender(db, username, tender_id)
-    await check_responsible(db, user, tender)
-
-    history = TenderHistory(
-        tender_id=tender.id,
-        name=tender.name,
-        description=tender.description,
-        service_type=tender.service_type,
-        status=tender.status,
-        version=tender.version
-    )
-    db.add(history)
-
-    try:
-        for key, value in update_data.dict(exclude_unset=True).items():
-            setattr(tender, key, value)
-        tender.version += 1
-        await db.commit()
-        await db.refresh(tender)
-        return tender
-    except Exception as e:
-        await db.rollback()
-        raise HTTPException(status_code=400, detail=str(e))
+async def update_tender(tender_id: UUID, username: str, update_data: TenderUpdate, response: Response,
+                        repo: Repository = Depends(get_repository)):
+    _, tender = await authorize_tender(repo, username, tender_id)
+    service_type = tender.service_type
+    tender = await repo.edit_tender(tender, update_data.dict(exclude_unset=True))
+    await repo.remember_write(response)
+    await tender_catalog.invalidate(response, service_type, tender.service_type)
+    return tender
 
 
 @app.put("/api/tenders/{tender_id}/rollback/{version}", response_model=TenderRead)
-async def rollback_tender(tender_id: UUID, username: str, version: int, db: AsyncSession = Depends(get_db)):
-    user, tender = await check_user_tender(db, username, tender_id)
-    await check_responsible(db, user, tender)
+async def rollback_tender(tender_id: UUID, username: str, version: int, response: Response,
+                          repo: Repository = Depends(get_repository)):
+    _, tender = await authorize_tender(repo, username, tender_id)
     if tender.version < version or version < 1:
         raise HTTPException(status_code=404, detail="version not found")
     if tender.version == version:
         return tender
-    result = await db.execute(select(TenderHistory).filter(
-        TenderHistory.tender_id == tender_id, TenderHistory.version == version))
-    db_old_tender_version = result.scalar_one_or_none()
+    service_type = tender.service_type
+    tender = await repo.rollback_tender(tender, version)
+    await repo.remember_write(response)
+    await tender_catalog.invalidate(response, service_type, tender.service_type)
+    return tender
 
-    tender.name = db_old_tender_version.name
-    tender.description = db_old_tender_version.description
-    tender.service_type = db_old_tender_version.service_type
-    tender.status = db_old_tender_version.status
-    tender.version = db_old_tender_version.version
 
-    await db.execute(delete(TenderHistory).where(
-        TenderHistory.tender_id == tender_id,
-        TenderHistory.version > version
-    ))
+@app.post("/api/bids/new", response_model=BidRead)
+async def create_bid(bid: BidCreate, response: Response, repo: Repository = Depends(get_repository)):
+    await check_author(repo, bid)
+    service_type = await check_tender(repo, bid)
+    db_bid = await repo.create_bid(bid_values(bid))
+    await repo.remember_write(response)
+    await tender_catalog.invalidate(response, service_type)
+    return db_bid
 
-    try:
-        await db.commit()
-        await db.refresh(tender)
-        return tender
-    except Exception as e:
-        await db.rollback()
-        raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/api/bids/bulk", response_model=List[BidBulkResult])
+async def create_bids_bulk(bids: List[BidCreate], response: Response, repo: Repository = Depends(get_repository)):
+    if len(bids) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"at most {BULK_MAX_ITEMS} bids per request")
 
-@app.post("/api/bids/new", response_model=BidRead)
-async def create_bid(bid: BidCreate, db: AsyncSession = Depends(get_db)):
-    db_bid = DBBid(**bid.dict())
-    await check_author(db, bid)
-    await check_tender(db, bid)
-    db.add(db_bid)
-    try:
-        await db.commit()
-        await db.refresh(db_bid)
-    except Exception as e:
-        await db.rollback()
-        raise HTTPException(status_code=400, detail=str(e))
-    return db_bid
+    errors, service_types = await validate_bid_batch(repo, bids) if bids else ({}, {})
+    valid = [index for index in range(len(bids)) if index not in errors]
+    created = await repo.create_bids([bid_values(bids[index]) for index in valid])
+    await repo.remember_write(response)
+    await tender_catalog.invalidate(response, *(service_types[bid.tender_id] for bid in created))
+
+    results = [dict(index=index, status_code=status_code, detail=detail)
+               for index, (status_code, detail) in errors.items()]
+    results += [dict(index=index, status_code=200, bid=bid) for index, bid in zip(valid, created)]
+    return sorted(results, key=lambda result: result['index'])
 
 
 @app.get("/api/bids/my", response_model=List[BidRead])
 async def get_my_bids(
         username: str,
-        limit: int = 5,
-        offset: int = 0,
-        db: AsyncSession = Depends(get_db)
+        request: Request,
+        limit: int = Query(5, ge=0, le=PAGE_MAX_LIMIT),
+        offset: int = Query(0, ge=0),
+        cursor: Optional[str] = None,
+        repo: Repository = Depends(get_read_repository)
 ):
-    user = await get_user(db, username)
-    query = select(DBBid).filter(DBBid.author_id == user.id).order_by(DBBid.name).limit(limit).offset(offset)
-    result = await db.execute(query)
-    bids = result.scalars().all()
-    return bids
+    membership = await get_membership(repo, username)
+    page = Page(limit, offset, cursor)
+    return await page_response(
+        request, lambda versions: repo.bid_page(page, author_id=membership.user_id, versions=versions),
+        DBBid, limit)
 
 
 @app.get("/api/bids/{tender_id}/list", response_model=List[BidRead])
 async def get_bids_by_tender(
         tender_id: UUID,
         username: str,
-        limit: int = 5,
-        offset: int = 0,
-        db: AsyncSession = Depends(get_db)
+        request: Request,
+        limit: int = Query(5, ge=0, le=PAGE_MAX_LIMIT),
+        offset: int = Query(0, ge=0),
+        cursor: Optional[str] = None,
+        repo: Repository = Depends(get_read_repository)
 ):
-    user, tender = await check_user_tender(db, username, tender_id)
-    await check_responsible(db, user, tender)
+    await authorize_tender(repo, username, tender_id)
+
+    page = Page(limit, offset, cursor)
+    return await page_response(request, lambda versions: repo.bid_page(page, tender_id=tender_id, versions=versions),
+                               DBBid, limit, key=('bids', tender_id, limit, offset, cursor))
+
 
-    query = select(DBBid).filter(DBBid.tender_id == tender_id).order_by(DBBid.name).limit(limit).offset(offset)
-    result = await db.execute(query)
-    bids = result.scalars().all()
-    return bids
+@app.get("/api/bids/{tender_id}/export")
+async def export_bids_by_tender(tender_id: UUID, username: str, format: str = 'ndjson',
+                                repo: Repository = Depends(get_read_repository)):
+    await authorize_tender(repo, username, tender_id)
+    return export_response(repo.export_bids(tender_id), BID_READ_FIELDS, format, f'bids-{tender_id}')
 
 
 @app.get("/api/bids/{bidId}/status")
-async def get_bid_status(bidId: UUID, username: str, db: AsyncSession = Depends(get_db)):
-    user, bid = await check_user_bid(db, username, bidId)
-    if bid.status == BidStatusEnum.PUBLISHED:
-        return
-    await check_responsible_bid(db, user, bid)
+async def get_bid_status(bidId: UUID, username: str, request: Request, response: Response,
+                         repo: Repository = Depends(get_read_repository)):
+    _, bid = await authorize_bid(repo, username, bidId, brief=True, published_public=True)
+    etag = entity_etag(bid.version, bid.status)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers['ETag'] = etag
     return bid.status
 
 
+@app.post("/api/bids/status/batch", response_model=List[BidStatusResult])
+async def get_bid_statuses(bid_ids: List[UUID], username: str, repo: Repository = Depends(get_read_repository)):
+    if len(bid_ids) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"at most {BULK_MAX_ITEMS} bids per request")
+
+    resolved = await authorize_bids(repo, username, bid_ids, published_public=True)
+    return [status_result(bid_id, resolved[bid_id]) for bid_id in bid_ids]
+
+
+@app.get("/api/status/stream")
+async def stream_statuses(username: str, tender_id: List[UUID] = Query([]), bid_id: List[UUID] = Query([]),
+                          repo: Repository = Depends(get_repository)):
+    if not tender_id and not bid_id:
+        raise HTTPException(status_code=400, detail="no tenders or bids to watch")
+    if len(tender_id) + len(bid_id) > STREAM_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"at most {STREAM_MAX_ITEMS} tenders and bids per stream")
+
+    # Subscribed before the current state is read, so no change committed in between is lost.
+    subscription = await status_broadcaster.subscribe(
+        [('tender', str(id)) for id in tender_id] + [('bid', str(id)) for id in bid_id])
+    try:
+        resolved = []
+        if tender_id:
+            tenders = await authorize_tenders(repo, username, tender_id)
+            resolved += [('tender', id, row) for id, row in tenders.items()]
+        if bid_id:
+            bids = await authorize_bids(repo, username, bid_id)
+            resolved += [('bid', id, row) for id, row in bids.items()]
+        for _, _, row in resolved:
+            if isinstance(row, HTTPException):
+                raise row
+    except BaseException:
+        status_broadcaster.unsubscribe(subscription)
+        raise
+    # The stream can stay open for hours; it must not hold on to a pooled connection.
+    await repo.close()
+    initial = [(kind, dict(id=str(id), status=row.status.value, version=row.version)) for kind, id, row in resolved]
+    return StreamingResponse(stream_events(subscription, initial), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @app.put("/api/bids/{bidId}/status", response_model=BidRead)
 async def update_bid_status(bidId: UUID, status: BidStatusEnum, username: str,
-                               db: AsyncSession = Depends(get_db)):
-    user, bid = await check_user_bid(db, username, bidId)
-    await check_responsible_bid(db, user, bid)
-    bid.status = status
-    await db.commit()
-    await db.refresh(bid)
+                               response: Response, repo: Repository = Depends(get_repository)):
+    _, bid = await authorize_bid(repo, username, bidId)
+    service_type = await repo.lock_tender(bid.tender_id)
+    bid = await repo.set_bid_status(bid, status)
+    await repo.remember_write(response)
+    await tender_catalog.invalidate(response, service_type)
     return bid
 
 
 @app.patch("/api/bids/{bidId}/edit", response_model=BidRead)
-async def update_bid(bidId: UUID, username: str, update_data: BidUpdate, db: AsyncSession = Depends(get_db)):
-    user, bid = await check_user_bid(db, username, bidId)
-    await check_responsible_bid(db, user, bid)
-
-    history = BidHistory(
-        bid_id=bid.id,
-        name=bid.name,
-        description=bid.description,
-        status=bid.status,
-        version=bid.version
-    )
-    db.add(history)
-
-    try:
-        for key, value in update_data.dict(exclude_unset=True).items():
-            setattr(bid, key, value)
-        bid.version += 1
-        await db.commit()
-        await db.refresh(bid)
-        return bid
-    except Exception as e:
-        await db.rollback()
-        raise HTTPException(status_code=400, detail=str(e))
+async def update_bid(bidId: UUID, username: str, update_data: BidUpdate, response: Response,
+                     repo: Repository = Depends(get_repository)):
+    _, bid = await authorize_bid(repo, username, bidId)
+    bid = await repo.edit_bid(bid, update_data.dict(exclude_unset=True))
+    await repo.remember_write(response)
+    return bid
 
 
 @app.put("/api/bids/{bidId}/rollback/{version}", response_model=BidRead)
-async def rollback_bid(bidId: UUID, username: str, version: int, db: AsyncSession = Depends(get_db)):
-    user, bid = await check_user_bid(db, username, bidId)
-    await check_responsible_bid(db, user, bid)
+async def rollback_bid(bidId: UUID, username: str, version: int, response: Response,
+                       repo: Repository = Depends(get_repository)):
+    _, bid = await authorize_bid(repo, username, bidId)
     if bid.version < version or version < 1:
         raise HTTPException(status_code=404, detail="version not found")
     if bid.version == version:
         return bid
-    result = await db.execute(select(BidHistory).filter(
-        BidHistory.bid_id == bidId, BidHistory.version == version))
-    db_old_bid_version = result.scalar_one_or_none()
-
-    bid.name = db_old_bid_version.name
-    bid.description = db_old_bid_version.description
-    bid.status = db_old_bid_version.status
-    bid.version = db_old_bid_version.version
-
-    await db.execute(delete(BidHistory).where(
-        BidHistory.bid_id == bidId,
-        BidHistory.version > version
-    ))
-
-    try:
-        await db.commit()
-        await db.refresh(bid)
-        return bid
-    except Exception as e:
-        await db.rollback()
-        raise HTTPException(status_code=400, detail=str(e))
+    service_type = await repo.lock_tender(bid.tender_id)
+    bid = await repo.rollback_bid(bid, version)
+    await repo.remember_write(response)
+    await tender_catalog.invalidate(response, service_type)
+    return bid
 
 
 @app.get("/api/bids/{bidId}/submit_decision", response_model=BidRead)
-async def submit_decision(bidId: UUID, decision: str, username: str, db: AsyncSession = Depends(get_db)):
-    bid = await get_bid(db, bidId)
-    tender = await get_tender(db, bid.tender_id)
-    user = await get_user(db, username)
-    user_organization = await get_user_organization(db, user)
-    if tender.organization_id == user_organization:
-        if decision == 'Approved':
-            tender.status = TenderStatusEnum.CLOSED
-            bid.status = BidStatusEnum.CANCELED
-            await db.commit()
-            await db.refresh(tender)
-            return bid
-        elif decision == 'Rejected':
-            bid.status = BidStatusEnum.CANCELED
-            await db.commit()
-            await db.refresh(tender)
-            return bid
-        else:
-            raise HTTPException(status_code=400, detail='decision not found')
+async def submit_decision(bidId: UUID, decision: str, username: str, response: Response,
+                          repo: Repository = Depends(get_repository)):
+    _, bid, tender = await authorize_decision(repo, username, bidId)
+    if decision not in ('Approved', 'Rejected'):
+        raise HTTPException(status_code=400, detail='decision not found')
+
+    bid = await repo.decide(bid, tender, decision)
+    await repo.remember_write(response)
+    await tender_catalog.invalidate(response, tender.service_type)
+    return bid
 
 
 @app.get("/api/bids/{tender_id}/reviews", response_model=List[ReviewRead])
-async def get_reviews(tender_id: UUID, author_username: Optional[str] = None, organization_id: Optional[UUID] = None,
-                      db: AsyncSession = Depends(get_db)):
-    query = db.query(DBReview).join(DBBid).filter(DBBid.tender_id == tender_id)
-    if author_username:
-        query = query.filter(DBReview.creator_username == author_username)
-    if organization_id:
-        query = query.join(DBBid).filter(DBBid.organization_id == organization_id)
-    result = await query.all()
-    return result
+async def get_reviews(
+        tender_id: UUID,
+        authorUsername: str,
+        requesterUsername: str,
+        limit: int = Query(5, ge=0, le=PAGE_MAX_LIMIT),
+        offset: int = Query(0, ge=0),
+        cursor: Optional[str] = None,
+        repo: Repository = Depends(get_read_repository)
+):
+    await authorize_tender(repo, requesterUsername, tender_id, brief=True)
+    author = await get_membership(repo, authorUsername)
+
+    rows = await repo.review_page(tender_id, author, Page(limit, offset, cursor))
+
+    response = rows_response(rows)
+    set_next_cursor(response, rows, limit, 'createdAt')
+    return response
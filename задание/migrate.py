@@ -0,0 +1,38 @@
+import asyncio
+import sys
+
+from database.engine import dispose_engines, get_engine
+from database.history import compact_history
+from database.migrations import upgrade
+from database.plans import SEQ_SCAN_MIN_ROWS, check_plans
+
+
+async def main(argv):
+    engine = get_engine()
+    try:
+        if argv[:1] == ['check']:
+            min_rows = int(argv[1]) if len(argv) > 1 else SEQ_SCAN_MIN_ROWS
+            failures = await check_plans(engine, min_rows)
+            for name, relation in failures:
+                print(f'{name}: sequential scan on {relation}')
+            return 1 if failures else 0
+
+        if argv[:1] == ['compact']:
+            async with engine.connect() as conn:
+                moved = await compact_history(conn)
+            if moved is None:
+                print('another compaction is running')
+                return 1
+            for table, count in moved.items():
+                print(f'{table}: archived {count} rows')
+            return 0
+
+        for version, name in await upgrade(engine):
+            print(f'applied {version:04d}_{name}')
+        return 0
+    finally:
+        await dispose_engines()
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main(sys.argv[1:])))
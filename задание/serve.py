@@ -0,0 +1,50 @@
+import asyncio
+import os
+import sys
+
+import uvicorn
+
+from database.engine import WEB_CONCURRENCY, dispose_engines, get_engine
+from database.migrations import upgrade
+from database.repository import STORAGE_BACKEND
+
+SERVER_ADDRESS = os.getenv('SERVER_ADDRESS', '0.0.0.0:8080')
+# Seconds a stopping worker waits for in-flight requests before closing their connections.
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', 20))
+SKIP_MIGRATIONS = os.getenv('SKIP_MIGRATIONS', '0') == '1'
+
+
+async def bootstrap():
+    try:
+        for version, name in await upgrade(get_engine()):
+            print(f'applied {version:04d}_{name}')
+    finally:
+        # The workers must not share the parent's connections.
+        await dispose_engines()
+
+
+def main():
+    if STORAGE_BACKEND == 'memory':
+        # Every worker would start with an empty store of its own and the API cannot create users.
+        print('STORAGE_BACKEND=memory is for benchmark.py and the tests, serve.py needs postgres', file=sys.stderr)
+        return 1
+
+    if not SKIP_MIGRATIONS:
+        asyncio.run(bootstrap())
+
+    host, _, port = SERVER_ADDRESS.rpartition(':')
+    uvicorn.run(
+        'main:app',
+        host=host or '0.0.0.0',
+        port=int(port),
+        workers=WEB_CONCURRENCY,
+        loop='uvloop',
+        http='httptools',
+        timeout_graceful_shutdown=SHUTDOWN_TIMEOUT,
+        proxy_headers=True,
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import asyncio
+
+from database.admission import AdmissionMiddleware, Limiter, TokenBuckets
+
+
+def test_queue_and_timeout():
+    async def scenario():
+        limiter = Limiter(1, queue=1, timeout=0.05)
+        assert await limiter.acquire()
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        # The only place in the queue is taken, so a third request is turned away at once.
+        assert not await limiter.acquire()
+        assert not await waiting
+        assert limiter.active == 1
+
+    asyncio.run(scenario())
+
+
+def test_release_hands_the_slot_over():
+    async def scenario():
+        limiter = Limiter(1, queue=2, timeout=1)
+        assert await limiter.acquire()
+        first, second = asyncio.create_task(limiter.acquire()), asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        limiter.release()
+        assert await first
+        assert not second.done()
+        limiter.release()
+        assert await second
+        limiter.release()
+        assert limiter.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_token_buckets():
+    buckets = TokenBuckets(rate=1, burst=2, maxsize=10)
+    assert buckets.take('a') == 0
+    assert buckets.take('a') == 0
+    assert 0.9 < buckets.take('a') <= 1
+    assert buckets.take('b') == 0
+
+
+def call(middleware, path: str, query: bytes = b'', client=('10.0.0.1', 1234), method: str = 'GET'):
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query, 'client': client}
+    asyncio.run(middleware(scope, receive, send))
+    start = messages[0]
+    return start['status'], dict(start.get('headers', ()))
+
+
+async def ok(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+def limited():
+    middleware = AdmissionMiddleware(ok)
+    middleware.users = TokenBuckets(rate=0.5, burst=1, maxsize=10)
+    return middleware
+
+
+def test_rate_limit_per_user():
+    middleware = limited()
+    assert call(middleware, '/api/tenders/my', b'username=alice')[0] == 200
+    status, headers = call(middleware, '/api/tenders/my', b'username=alice')
+    assert (status, headers[b'retry-after']) == (429, b'2')
+    assert call(middleware, '/api/tenders/my', b'username=bob')[0] == 200
+
+
+def test_rate_limit_per_address():
+    middleware = limited()
+    assert call(middleware, '/api/tenders/new', method='POST')[0] == 200
+    status, headers = call(middleware, '/api/tenders/new', method='POST')
+    assert (status, headers[b'retry-after']) == (429, b'2')
+    assert call(middleware, '/api/bids/new', client=('10.0.0.2', 1234), method='POST')[0] == 200
+    # Requests naming no user on other routes are not rate limited.
+    assert call(middleware, '/api/tenders')[0] == 200
+    assert call(middleware, '/api/tenders')[0] == 200
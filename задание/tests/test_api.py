@@ -0,0 +1,301 @@
+import asyncio
+import uuid
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import database.models as models
+from database.catalog_cache import MemoryBackend, tender_catalog
+from database.memory import MemoryRepository, memory_store
+from database.pagination import NEXT_CURSOR_HEADER
+from database.repository import get_catalog_repository, get_read_repository, get_repository
+from main import app
+
+# The API against the in-memory store, in process and without a database: the handlers, the authorization
+# and the paging run as they do in the server, only the repository is MemoryRepository.
+TENDER_NAMES = ['alpha', 'bravo', 'charlie', 'delta', 'echo']
+
+
+async def _memory_repository():
+    return MemoryRepository(memory_store)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    memory_store.clear()
+    # Cached catalog pages must not outlive the store they were read from.
+    monkeypatch.setattr(tender_catalog, 'backend', MemoryBackend(100))
+    monkeypatch.setitem(app.dependency_overrides, get_repository, _memory_repository)
+    monkeypatch.setitem(app.dependency_overrides, get_read_repository, _memory_repository)
+    monkeypatch.setitem(app.dependency_overrides, get_catalog_repository, _memory_repository)
+
+    organization_id, other_organization_id = memory_store.add_organization(), memory_store.add_organization()
+    memory_store.add_user('owner', organization_ids=[organization_id])
+    memory_store.add_user('outsider', organization_ids=[other_organization_id])
+    bidder_id = memory_store.add_user('bidder', organization_ids=[organization_id])
+    tenders = [memory_store.insert_tender(dict(name=name, description='', service_type='DELIVERY',
+                                               status='PUBLISHED', organization_id=organization_id,
+                                               creator_username='owner'))
+               for name in TENDER_NAMES]
+    bids = [memory_store.insert_bid(dict(name=name, description='', tender_id=tenders[0].id, author_type='User',
+                                         author_id=bidder_id))
+            for name in ('first', 'second', 'third')]
+    yield tenders, bids
+    memory_store.clear()
+
+
+def request(method: str, url: str, **kwargs) -> httpx.Response:
+    async def send():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+            return await client.request(method, url, **kwargs)
+    return asyncio.run(send())
+
+
+def names(response: httpx.Response):
+    assert response.status_code == 200, response.text
+    return [row['name'] for row in response.json()]
+
+
+def test_tender_access(store):
+    tenders, _ = store
+    url = f'/api/tenders/{tenders[0].id}/status'
+    assert request('GET', url, params={'username': 'owner'}).json() == 'PUBLISHED'
+    assert request('GET', url, params={'username': 'nobody'}).status_code == 401
+    assert request('GET', url, params={'username': 'outsider'}).status_code == 403
+    assert request('GET', f'/api/tenders/{uuid.uuid4()}/status', params={'username': 'owner'}).status_code == 404
+
+
+def test_offset_and_cursor_pages(store):
+    assert names(request('GET', '/api/tenders', params={'limit': 2, 'offset': 2})) == TENDER_NAMES[2:4]
+
+    seen, cursor = [], None
+    while True:
+        response = request('GET', '/api/tenders', params={'limit': 2, **({'cursor': cursor} if cursor else {})})
+        seen += names(response)
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if not cursor:
+            break
+    assert seen == TENDER_NAMES
+
+    assert request('GET', '/api/tenders', params={'cursor': 'garbage'}).status_code == 400
+
+
+def test_bid_pages(store):
+    tenders, _ = store
+    url = f'/api/bids/{tenders[0].id}/list'
+    first = request('GET', url, params={'username': 'owner', 'limit': 2})
+    assert names(first) == ['first', 'second']
+    cursor = first.headers[NEXT_CURSOR_HEADER]
+    assert names(request('GET', url, params={'username': 'owner', 'limit': 2, 'cursor': cursor})) == ['third']
+    assert request('GET', url, params={'username': 'outsider'}).status_code == 403
+
+
+def test_edit_and_rollback(store):
+    tenders, _ = store
+    url = f'/api/tenders/{tenders[0].id}'
+    edited = request('PATCH', f'{url}/edit', params={'username': 'owner'},
+                     json={'name': 'renamed', 'service_type': 'CONSTRUCTION'})
+    assert edited.status_code == 200, edited.text
+    assert (edited.json()['name'], edited.json()['version']) == ('renamed', 2)
+
+    restored = request('PUT', f'{url}/rollback/1', params={'username': 'owner'})
+    assert restored.status_code == 200, restored.text
+    assert restored.json()['name'] == 'alpha'
+    assert restored.json()['service_type'] == 'DELIVERY'
+    assert restored.json()['version'] == 3
+
+    assert request('PUT', f'{url}/rollback/9', params={'username': 'owner'}).status_code == 404
+    assert request('PATCH', f'{url}/edit', params={'username': 'owner'},
+                   json={'name': None, 'service_type': 'DELIVERY'}).status_code == 400
+
+
+def test_stale_version(store):
+    tenders, _ = store
+    memory_store.edit_tender(tenders[0], {'name': 'first edit'})
+    # tenders[0] is still version 1, as a request that read it before the edit would hold it.
+    with pytest.raises(HTTPException) as conflict:
+        memory_store.edit_tender(tenders[0], {'name': 'second edit'})
+    assert conflict.value.status_code == 409
+    with pytest.raises(HTTPException) as missing:
+        memory_store.rollback_tender(memory_store.tenders[tenders[0].id], 5)
+    assert missing.value.status_code == 404
+
+
+def test_decisions(store):
+    tenders, bids = store
+    rejected = request('GET', f'/api/bids/{bids[1].id}/submit_decision',
+                       params={'username': 'owner', 'decision': 'Rejected'})
+    assert rejected.json()['status'] == 'CANCELED'
+
+    approved = request('GET', f'/api/bids/{bids[0].id}/submit_decision',
+                       params={'username': 'owner', 'decision': 'Approved'})
+    assert approved.status_code == 200, approved.text
+    assert memory_store.tenders[tenders[0].id].status == models.TenderStatusEnum.CLOSED
+    assert memory_store.bids[bids[2].id].status == models.BidStatusEnum.CANCELED
+
+    again = request('GET', f'/api/bids/{bids[0].id}/submit_decision',
+                    params={'username': 'owner', 'decision': 'Approved'})
+    assert again.status_code == 409
+    assert request('GET', f'/api/bids/{bids[0].id}/submit_decision',
+                   params={'username': 'outsider', 'decision': 'Approved'}).status_code == 403
+
+
+def test_not_modified(store):
+    tenders, _ = store
+    page = request('GET', '/api/tenders', params={'limit': 3})
+    etag = page.headers['ETag']
+    assert request('GET', '/api/tenders', params={'limit': 3}, headers={'If-None-Match': etag}).status_code == 304
+
+    url = f'/api/tenders/{tenders[0].id}/status'
+    status = request('GET', url, params={'username': 'owner'})
+    assert request('GET', url, params={'username': 'owner'},
+                   headers={'If-None-Match': status.headers['ETag']}).status_code == 304
+
+    request('PUT', url, params={'username': 'owner', 'status': 'CLOSED'})
+    assert request('GET', '/api/tenders', params={'limit': 3}, headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_published_bid_status(store):
+    tenders, bids = store
+    published = memory_store.insert_bid(dict(name='published', description='', tender_id=tenders[0].id,
+                                             author_type='User', author_id=bids[0].author_id, status='PUBLISHED'))
+    # A published bid's status is open to any existing user, a bid in any other status only to its organizations.
+    assert request('GET', f'/api/bids/{published.id}/status', params={'username': 'outsider'}).json() == 'PUBLISHED'
+    assert request('GET', f'/api/bids/{bids[0].id}/status', params={'username': 'outsider'}).status_code == 403
+    assert request('GET', f'/api/bids/{published.id}/status', params={'username': 'nobody'}).status_code == 401
+
+    batch = request('POST', '/api/bids/status/batch', params={'username': 'outsider'},
+                    json=[str(published.id), str(bids[0].id)])
+    assert [result['status_code'] for result in batch.json()] == [200, 403]
+
+
+def test_page_bounds(store):
+    tenders, _ = store
+    for params in ({'limit': -1}, {'limit': 51}, {'offset': -1}, {'limit': 'many'}):
+        assert request('GET', '/api/tenders', params=params).status_code == 400
+        bids = request('GET', f'/api/bids/{tenders[0].id}/list', params={'username': 'owner', **params})
+        assert bids.status_code == 400
+    assert names(request('GET', '/api/tenders', params={'limit': 0})) == []
+
+
+def test_bulk_tenders(store, monkeypatch):
+    tenders, _ = store
+    organization_id = tenders[0].organization_id
+    outsider_organization_id = next(iter(memory_store.membership('outsider').organization_ids))
+    tender = dict(name='bulk', description='', service_type='DELIVERY', organization_id=str(organization_id),
+                  creator_username='owner')
+    items = [
+        tender,
+        dict(tender, creator_username='nobody'),
+        dict(tender, organization_id=str(uuid.uuid4())),
+        dict(tender, organization_id=str(outsider_organization_id)),
+        dict(tender, name='bulk 2'),
+    ]
+    response = request('POST', '/api/tenders/bulk', json=items)
+    assert response.status_code == 200, response.text
+    results = response.json()
+    assert [(result['index'], result['status_code']) for result in results] == \
+        [(0, 200), (1, 401), (2, 401), (3, 403), (4, 200)]
+    assert [results[index]['tender']['name'] for index in (0, 4)] == ['bulk', 'bulk 2']
+    assert len(memory_store.tenders) == len(TENDER_NAMES) + 2
+
+    monkeypatch.setattr('main.BULK_MAX_ITEMS', 2)
+    assert request('POST', '/api/tenders/bulk', json=items).status_code == 400
+
+
+def test_bulk_bids(store):
+    tenders, bids = store
+    draft = memory_store.insert_tender(dict(name='draft', description='', service_type='DELIVERY',
+                                            organization_id=tenders[0].organization_id, creator_username='owner'))
+    bid = dict(name='bulk', description='', tender_id=str(tenders[1].id), author_type='User',
+               author_id=str(bids[0].author_id))
+    items = [
+        bid,
+        dict(bid, author_id=str(uuid.uuid4())),
+        dict(bid, author_type='Organization', author_id=str(tenders[0].organization_id)),
+        dict(bid, author_type='Organization', author_id=str(uuid.uuid4())),
+        dict(bid, tender_id=str(draft.id)),
+        dict(bid, tender_id=str(uuid.uuid4())),
+    ]
+    response = request('POST', '/api/bids/bulk', json=items)
+    assert response.status_code == 200, response.text
+    assert [(result['index'], result['status_code']) for result in response.json()] == \
+        [(0, 200), (1, 401), (2, 200), (3, 401), (4, 404), (5, 404)]
+    assert memory_store.tenders[tenders[1].id].bid_count == 2
+
+
+def test_batch_statuses(store):
+    tenders, bids = store
+    missing = uuid.uuid4()
+    foreign = memory_store.insert_tender(dict(name='foreign', description='', service_type='DELIVERY',
+                                              organization_id=memory_store.add_organization(),
+                                              creator_username='outsider'))
+    response = request('POST', '/api/tenders/status/batch', params={'username': 'owner'},
+                       json=[str(tenders[0].id), str(missing), str(foreign.id)])
+    assert [(result['status_code'], result['status']) for result in response.json()] == \
+        [(200, 'PUBLISHED'), (404, None), (403, None)]
+    assert request('POST', '/api/tenders/status/batch', params={'username': 'nobody'},
+                   json=[str(tenders[0].id)]).status_code == 401
+
+    response = request('POST', '/api/bids/status/batch', params={'username': 'owner'},
+                       json=[str(bids[0].id), str(missing)])
+    assert [(result['id'], result['status_code']) for result in response.json()] == \
+        [(str(bids[0].id), 200), (str(missing), 404)]
+    assert response.json()[0]['version'] == 1
+    assert request('POST', '/api/bids/status/batch', params={'username': 'nobody'},
+                   json=[str(bids[0].id)]).status_code == 401
+
+
+def catalog(**params):
+    response = request('GET', '/api/tenders', params={'limit': 10, **params})
+    assert response.status_code == 200, response.text
+    return [(row['name'], row['status'], row['bid_count']) for row in response.json()]
+
+
+def test_catalog_invalidation(store):
+    tenders, _ = store
+    organization_id = tenders[0].organization_id
+    before = catalog()
+    # Changed behind the API's back, so nothing is invalidated and the cached page is served as it was.
+    memory_store.insert_tender(dict(name='aardvark', description='', service_type='DELIVERY',
+                                    organization_id=organization_id, creator_username='owner'))
+    assert catalog() == before
+
+    created = request('POST', '/api/tenders/new', json=dict(
+        name='abacus', description='', service_type='DELIVERY', organization_id=str(organization_id),
+        creator_username='owner'))
+    assert created.status_code == 200, created.text
+    assert [row[0] for row in catalog()[:3]] == ['aardvark', 'abacus', 'alpha']
+
+    url = f'/api/tenders/{tenders[1].id}'
+    request('PATCH', f'{url}/edit', params={'username': 'owner'}, json={'name': 'zulu', 'service_type': 'DELIVERY'})
+    assert catalog()[-1][0] == 'zulu'
+    request('PUT', f'{url}/status', params={'username': 'owner', 'status': 'CLOSED'})
+    assert catalog()[-1][:2] == ('zulu', 'CLOSED')
+    request('PUT', f'{url}/rollback/1', params={'username': 'owner'})
+    assert ('bravo', 'PUBLISHED', 0) in catalog()
+
+
+def test_catalog_popularity_invalidation(store):
+    tenders, bids = store
+
+    def popular():
+        rows = catalog(sort='popularity')
+        assert [row[2] for row in rows] == sorted((row[2] for row in rows), reverse=True)
+        return {name: (status, bid_count) for name, status, bid_count in rows}
+
+    assert popular()['alpha'] == ('PUBLISHED', 3)
+
+    created = request('POST', '/api/bids/new', json=dict(name='bid', description='', tender_id=str(tenders[1].id),
+                                                         author_type='User', author_id=str(bids[0].author_id)))
+    assert created.status_code == 200, created.text
+    assert popular()['bravo'] == ('PUBLISHED', 1)
+
+    request('PUT', f'/api/bids/{bids[0].id}/status', params={'username': 'bidder', 'status': 'CANCELED'})
+    assert popular()['alpha'] == ('PUBLISHED', 2)
+    request('GET', f'/api/bids/{bids[1].id}/submit_decision', params={'username': 'owner', 'decision': 'Rejected'})
+    assert popular()['alpha'] == ('PUBLISHED', 1)
+    request('GET', f'/api/bids/{created.json()["id"]}/submit_decision',
+            params={'username': 'owner', 'decision': 'Approved'})
+    assert popular()['bravo'] == ('CLOSED', 1)
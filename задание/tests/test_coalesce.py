@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from database.coalesce import SingleFlight
+
+
+def fetcher(calls: list, result=None, error: Exception = None):
+    async def fetch():
+        calls.append(None)
+        await asyncio.sleep(0.01)
+        if error is not None:
+            raise error
+        return result
+    return fetch
+
+
+def test_identical_reads_share_one_execution():
+    async def scenario():
+        flights, calls = SingleFlight(), []
+        fetch = fetcher(calls, ['row'])
+        results = await asyncio.gather(*(flights.run(('page', 1), fetch) for _ in range(5)))
+        assert results == [['row']] * 5
+        assert len(calls) == 1
+        # Different parameters and later reads are executed on their own.
+        await asyncio.gather(flights.run(('page', 2), fetch), flights.run(('page', 1), fetch))
+        assert len(calls) == 3
+
+    asyncio.run(scenario())
+
+
+def test_error_reaches_every_waiter():
+    async def scenario():
+        flights, calls = SingleFlight(), []
+        fetch = fetcher(calls, error=ValueError('broken'))
+        results = await asyncio.gather(*(flights.run(('page',), fetch) for _ in range(3)), return_exceptions=True)
+        assert [type(result) for result in results] == [ValueError] * 3
+        assert len(calls) == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_leader_hands_over_to_a_waiter():
+    async def scenario():
+        flights, calls = SingleFlight(), []
+        fetch = fetcher(calls, ['row'])
+        leader = asyncio.create_task(flights.run(('page',), fetch))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(flights.run(('page',), fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        # The waiter is not cancelled along with the leader and runs the query itself.
+        assert await waiter == ['row']
+        assert len(calls) == 2
+        assert not flights._flights
+
+    asyncio.run(scenario())
@@ -0,0 +1,38 @@
+import asyncio
+
+from database import metrics
+
+
+def serve(app, path: str):
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': path}
+    asyncio.run(metrics.MetricsMiddleware(app)(scope, receive, send))
+    return messages
+
+
+def responding(content_type: bytes):
+    async def app(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', content_type)]})
+        await send({'type': 'http.response.body', 'body': b''})
+    return app
+
+
+def series(histogram):
+    return {labels: counts for labels, (counts, _) in histogram._series.items()}
+
+
+def test_streams_stay_out_of_request_latency():
+    requests, streams = series(metrics.request_duration), series(metrics.stream_duration)
+    serve(responding(b'text/event-stream'), '/stream')
+    serve(responding(b'application/json'), '/page')
+
+    labels = ('GET', 'unmatched')
+    assert sum(series(metrics.stream_duration)[labels]) == sum(streams.get(labels, ())) + 1
+    assert sum(series(metrics.request_duration)[labels]) == sum(requests.get(labels, ())) + 1